@@ -18,6 +18,43 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 SOUNDFONT_PATH = os.path.join(BASE_DIR, 'soundfonts', 'GeneralUser.sf2')
 
+# Rendered melodies, relative to MEDIA_ROOT, keyed by content and evicted above the size limit
+RENDER_CACHE_DIR = 'render_cache'
+RENDER_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Threads rendering a battle generation and how long a request waits for one melody, in seconds
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+RENDER_TIMEOUT = 30
+
+# Per-battle and per-job directories, relative to MEDIA_ROOT. Workspaces unused for WORKSPACE_MAX_AGE
+# seconds are removed by a background collector every WORKSPACE_GC_INTERVAL seconds (None disables it)
+WORKSPACE_DIR = 'workspaces'
+WORKSPACE_MAX_AGE = 24 * 60 * 60
+WORKSPACE_GC_INTERVAL = 60 * 60
+
+# Synthesizer rendering the melodies: 'fluidsynth' (in-process, needs pyfluidsynth),
+# 'fluidsynth-process' (midi2audio), 'sine' (pure NumPy) or 'auto'
+SYNTH_BACKEND = 'auto'
+
+# Number of worker processes running simulated annealing jobs in the background
+SIMULATED_ANNEALING_WORKERS = os.cpu_count() or 1
+# Jobs sample their per-generation statistics once every N generations
+SIMULATED_ANNEALING_STATS_EVERY = 10
+# Seconds between two checkpoints of a running job, an interrupted job resumes from its last one
+SIMULATED_ANNEALING_CHECKPOINT_INTERVAL = 5
+# Early stopping of jobs, see simulated_annealing.core.stopping.EarlyStopping. Deliberately off for the
+# 1000-generation jobs of the page: they finish in about a second and any patience short enough to fire
+# costs score, improvements keep coming long after the temperature froze. The time budget only guards
+# against runaway jobs, a per-job 'stopping' parameter overrides these defaults
+SIMULATED_ANNEALING_STOPPING = {
+    'time_budget': 60,
+}
+# Parent selection of the genetic MelodyGenerator: an operator of simulated_annealing.core.selection.SelectionOperators
+# or 'pareto', and the operator parameters
+MELODY_GENERATOR_SELECTION = {
+    'operator': 'truncation',
+}
+
 
 
 # Quick-start development settings - unsuitable for production
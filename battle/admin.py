@@ -1,3 +1,8 @@
 from django.contrib import admin
 
-# Register your models here.
+from battle.models import Battle
+
+
+@admin.register(Battle)
+class BattleAdmin(admin.ModelAdmin):
+    list_display = ('id', 'n_melodies', 'n_melody_notes', 'generation', 'updated_at')
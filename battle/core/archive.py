@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+from typing import Optional
+
+import numpy as np
+
+from battle.core.melody import Melody
+from battle.core.midi import atomic_open, save_midi, save_multitrack_midi
+
+ARCHIVE_NAME = "population.bin"
+MAGIC = b"EMGPOP"
+VERSION = 1
+# Magic, version, n_melodies, n_melody_notes, flags, length of the JSON metadata
+HEADER = struct.Struct("<6sHIIII")
+HAS_SCORES = 1
+ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class PopulationArchive:
+    """
+    Packed binary file holding a population: a fixed header, JSON metadata, then the raw uint8 notes
+    matrix, little-endian uint16 durations matrix and optional float64 scores, each 64-byte aligned.
+
+    Loading maps the file and returns views into it, nothing is parsed but the header. An .npz would
+    not do: its members are zip entries that np.load cannot memory-map. MIDI and JSON files are
+    separate, on-demand exports.
+    """
+
+    def __init__(self, notes, durations, scores=None, metadata: Optional[dict] = None):
+        """
+        :param notes: (n_melodies, n_melody_notes) MIDI note numbers.
+        :param durations: Durations in ticks, same shape as notes.
+        :param scores: Optional score of every melody.
+        :param metadata: JSON-serializable dict stored next to the matrices.
+        """
+        self.notes = np.asarray(notes)
+        self.durations = np.asarray(durations)
+        self.scores = None if scores is None else np.asarray(scores)
+        self.metadata = metadata or {}
+        if self.notes.ndim != 2 or self.notes.shape != self.durations.shape:
+            raise ValueError(f"Expected two matrices of equal shape, got {self.notes.shape} and {self.durations.shape}")
+        if self.scores is not None and self.scores.shape != (len(self.notes),):
+            raise ValueError(f"Expected {len(self.notes)} scores, got {self.scores.shape}")
+
+    @classmethod
+    def from_melodies(cls, melodies: list[Melody], scores=None, metadata: Optional[dict] = None) -> PopulationArchive:
+        return cls(
+            [melody.notes_array for melody in melodies],
+            [melody.durations_array for melody in melodies],
+            scores,
+            metadata,
+        )
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.notes.shape
+
+    @staticmethod
+    def _layout(n_melodies: int, n_melody_notes: int, has_scores: bool, metadata_length: int) -> tuple:
+        """ Offsets of the notes, durations and scores and the total file size. """
+        notes = _align(HEADER.size + metadata_length)
+        durations = _align(notes + n_melodies * n_melody_notes)
+        scores = _align(durations + 2 * n_melodies * n_melody_notes)
+        size = scores + (8 * n_melodies if has_scores else 0)
+        return notes, durations, scores, size
+
+    def to_bytes(self) -> bytearray:
+        metadata = json.dumps(self.metadata).encode("utf-8")
+        n_melodies, n_melody_notes = self.shape
+        notes, durations, scores, size = self._layout(n_melodies, n_melody_notes, self.scores is not None, len(metadata))
+
+        data = bytearray(size)
+        flags = HAS_SCORES if self.scores is not None else 0
+        HEADER.pack_into(data, 0, MAGIC, VERSION, n_melodies, n_melody_notes, flags, len(metadata))
+        data[HEADER.size:HEADER.size + len(metadata)] = metadata
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        buffer[notes:notes + self.notes.size] = self.notes.ravel()
+        buffer[durations:durations + 2 * self.durations.size].view("<u2")[:] = self.durations.ravel()
+        if self.scores is not None:
+            buffer[scores:size].view("<f8")[:] = self.scores
+        return data
+
+    def save(self, path: str) -> None:
+        """ Writes the archive atomically. """
+        data = self.to_bytes()
+        with atomic_open(path) as f:
+            f.write(data)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> PopulationArchive:
+        """
+        Opens an archive.
+
+        :param path: Archive file.
+        :param mmap: Map the file read-only instead of reading it, the matrices are then views into the mapping.
+        """
+        if mmap:
+            buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        else:
+            with open(path, "rb") as f:
+                buffer = np.frombuffer(f.read(), dtype=np.uint8)
+        if len(buffer) < HEADER.size:
+            raise ValueError(f"{path} is not a population archive")
+        magic, version, n_melodies, n_melody_notes, flags, metadata_length = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a population archive")
+        if version != VERSION:
+            raise ValueError(f"{path} has unsupported archive version {version}")
+
+        has_scores = bool(flags & HAS_SCORES)
+        notes, durations, scores, size = cls._layout(n_melodies, n_melody_notes, has_scores, metadata_length)
+        if len(buffer) < size:
+            raise ValueError(f"{path} is truncated")
+
+        n_notes = n_melodies * n_melody_notes
+        archive = cls.__new__(cls)
+        archive.metadata = json.loads(buffer[HEADER.size:HEADER.size + metadata_length].tobytes())
+        archive.notes = buffer[notes:notes + n_notes].reshape(n_melodies, n_melody_notes)
+        archive.durations = buffer[durations:durations + 2 * n_notes].view("<u2").reshape(n_melodies, n_melody_notes)
+        archive.scores = buffer[scores:size].view("<f8") if has_scores else None
+        return archive
+
+    def melody(self, index: int) -> Melody:
+        return Melody.from_bytes(
+            self.notes[index].astype(np.uint8).tobytes(), self.durations[index].astype("<u2").tobytes()
+        )
+
+    def melodies(self) -> list[Melody]:
+        return [self.melody(i) for i in range(len(self.notes))]
+
+    def to_dict(self) -> dict:
+        """ {index: {"notes": [...], "durations": [...]}} form, as melodies.json used to store it. """
+        return {
+            i: {"notes": notes, "durations": durations}
+            for i, (notes, durations) in enumerate(zip(self.notes.tolist(), self.durations.tolist()))
+        }
+
+    def export_json(self, path: str) -> None:
+        with atomic_open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    def export_midi(self, directory: str, multitrack: bool = False) -> list[str]:
+        """
+        Writes the melodies as MIDI files.
+
+        :param directory: Output directory, created if needed.
+        :param multitrack: Write a single population.mid with one track per melody instead of melody_{i}.mid files.
+        :return: Paths of the written files.
+        """
+        os.makedirs(directory, exist_ok=True)
+        if multitrack:
+            path = os.path.join(directory, "population.mid")
+            save_multitrack_midi(path, zip(self.notes, self.durations))
+            return [path]
+        paths = []
+        for i, (notes, durations) in enumerate(zip(self.notes, self.durations)):
+            paths.append(os.path.join(directory, f"melody_{i}.mid"))
+            save_midi(paths[-1], notes, durations)
+        return paths
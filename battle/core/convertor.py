@@ -1,12 +1,39 @@
-from Evalutionary_music_generation import settings
-from midi2audio import FluidSynth
 import os
-from django.conf import settings
 
+from Evalutionary_music_generation import settings
+from battle.core.render_cache import RenderCache
+from battle.core.synth import get_backend
+
+
+def soundfont_path():
+    return os.path.join(settings.BASE_DIR, 'soundfont', 'GeneralUser-GS.sf2')
+
+
+def render_cache():
+    return RenderCache(os.path.join(settings.MEDIA_ROOT, settings.RENDER_CACHE_DIR), settings.RENDER_CACHE_MAX_BYTES)
+
+
+def render_melody(notes, durations):
+    """
+    Renders a melody through the render cache, the synthesizer only runs on a cache miss.
+
+    :return: Path of the audio file relative to MEDIA_ROOT.
+    """
+    return render_melodies([(notes, durations)])[0]
+
+
+def render_melodies(melodies):
+    """
+    Renders several melodies through the render cache, the misses in a single synthesizer call.
 
-def convert_mid_to_mp3(file_name, algorithm_dir):
-    soundfont_path = os.path.join(settings.BASE_DIR, 'soundfont', 'GeneralUser-GS.sf2')
-    mid_file_path = os.path.join(settings.MEDIA_ROOT, algorithm_dir, f'{file_name}.mid')
-    mp3_file_path = os.path.join(settings.MEDIA_ROOT, algorithm_dir, f'{file_name}.mp3')
-    fs = FluidSynth(soundfont_path)
-    fs.midi_to_audio(mid_file_path, mp3_file_path)
+    :param melodies: List of (notes, durations) pairs.
+    :return: Paths of the audio files relative to MEDIA_ROOT, in the same order.
+    """
+    cache = render_cache()
+    backend = get_backend(soundfont_path())
+    keys = [cache.key(notes, durations, soundfont_path(), **backend.settings()) for notes, durations in melodies]
+    paths = cache.get_or_render_many(
+        dict(zip(keys, melodies)),
+        lambda jobs: backend.render_many((notes, durations, path) for (notes, durations), path in jobs),
+    )
+    return [os.path.relpath(paths[key], settings.MEDIA_ROOT) for key in keys]
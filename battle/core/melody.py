@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import sys
+from array import array
+
+import numpy as np
+
+
+class Melody:
+    """
+    Compact melody: notes as array('B') MIDI numbers and durations as array('H') ticks.
+
+    One byte per note and two per duration instead of a boxed int each, copies are two memcpy,
+    and numpy views share the same memory. The {"notes": [...], "durations": [...]} dict form is
+    only used at the edges (JSON files, sessions).
+
+    Melodies hash by content: do not mutate one while it is used as a dict key or in a set.
+    """
+
+    __slots__ = ("notes", "durations")
+
+    def __init__(self, notes, durations):
+        """
+        :param notes: Iterable of MIDI note numbers (0-255).
+        :param durations: Iterable of durations in ticks (0-65535), as many as notes.
+        """
+        self.notes = array("B", notes)
+        self.durations = array("H", durations)
+        if len(self.notes) != len(self.durations):
+            raise ValueError(f"Melody has {len(self.notes)} notes but {len(self.durations)} durations")
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Melody:
+        """ Builds a melody from its {"notes": [...], "durations": [...]} form. """
+        return cls(data["notes"], data["durations"])
+
+    @classmethod
+    def from_bytes(cls, notes: bytes, durations: bytes) -> Melody:
+        """ Builds a melody from packed uint8 notes and little-endian uint16 durations, see to_bytes. """
+        melody = cls.__new__(cls)
+        melody.notes = array("B", notes)
+        melody.durations = array("H")
+        melody.durations.frombytes(durations)
+        if sys.byteorder == "big":
+            melody.durations.byteswap()
+        if len(melody.notes) != len(melody.durations):
+            raise ValueError(f"Melody has {len(melody.notes)} notes but {len(melody.durations)} durations")
+        return melody
+
+    def to_bytes(self) -> tuple[bytes, bytes]:
+        """ Packs the melody as uint8 notes and little-endian uint16 durations. """
+        durations = self.durations
+        if sys.byteorder == "big":
+            durations = durations[:]
+            durations.byteswap()
+        return self.notes.tobytes(), durations.tobytes()
+
+    def to_dict(self) -> dict:
+        """ Exports the melody as {"notes": [...], "durations": [...]} with plain Python ints. """
+        return {"notes": self.notes.tolist(), "durations": self.durations.tolist()}
+
+    @property
+    def notes_array(self) -> np.ndarray:
+        """ Zero-copy uint8 numpy view of the notes, writes go through to the melody. """
+        return np.frombuffer(self.notes, dtype=np.uint8)
+
+    @property
+    def durations_array(self) -> np.ndarray:
+        """ Zero-copy uint16 numpy view of the durations, writes go through to the melody. """
+        return np.frombuffer(self.durations, dtype=np.uint16)
+
+    def copy(self) -> Melody:
+        melody = Melody.__new__(Melody)
+        melody.notes = self.notes[:]
+        melody.durations = self.durations[:]
+        return melody
+
+    def __len__(self) -> int:
+        return len(self.notes)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Melody):
+            return NotImplemented
+        return self.notes == other.notes and self.durations == other.durations
+
+    def __hash__(self) -> int:
+        return hash((self.notes.tobytes(), self.durations.tobytes()))
+
+    def __repr__(self) -> str:
+        return f"Melody(notes={self.notes.tolist()}, durations={self.durations.tolist()})"
+
+
+def pack_melodies(melodies) -> tuple[bytes, bytes]:
+    """ Packs equal-length melodies row after row into a notes blob and a durations blob, see Melody.to_bytes. """
+    packed = [melody.to_bytes() for melody in melodies]
+    return b"".join(notes for notes, _ in packed), b"".join(durations for _, durations in packed)
+
+
+def unpack_melody(notes: bytes, durations: bytes, index: int, n_melody_notes: int) -> Melody:
+    """ Reads one melody out of blobs written by pack_melodies without unpacking the others. """
+    start = index * n_melody_notes
+    return Melody.from_bytes(
+        notes[start:start + n_melody_notes],
+        durations[2 * start:2 * (start + n_melody_notes)],
+    )
@@ -0,0 +1,134 @@
+import os
+import struct
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+from mido import MidiFile, MidiTrack, Message
+
+TICKS_PER_BEAT = 480  # mido's default, the tick durations are relative to it
+VELOCITY = 64
+NOTE_ON = 0x90
+NOTE_OFF = 0x80
+END_OF_TRACK = b"\x00\xff\x2f\x00"
+VARLEN_SLOTS = np.arange(4)  # Delta times below 2**28 take at most 4 bytes
+
+
+def _read_umask() -> int:
+    # The umask can only be read by setting it, done once at import rather than on every (threaded) write
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+UMASK = _read_umask()
+
+
+@contextmanager
+def atomic_open(path, mode="wb", **kwargs):
+    """
+    Opens a temporary file next to path and moves it over path once the block succeeds,
+    so readers never see a partially written file.
+
+    mkstemp creates owner-only files, the file gets the mode of the file it replaces instead,
+    or the mode open() would have given a new file.
+    """
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory or ".")
+    try:
+        try:
+            permissions = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            permissions = 0o666 & ~UMASK
+        os.fchmod(fd, permissions)
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def build_midi(notes, durations) -> MidiFile:
+    """ Builds a single-track MIDI file playing the notes one after another. """
+    mid = MidiFile()
+    track = MidiTrack()
+    mid.tracks.append(track)
+    for note, duration in zip(notes, durations):
+        track.append(Message("note_on", note=int(note), velocity=64, time=0))
+        track.append(Message("note_off", note=int(note), velocity=64, time=int(duration)))
+    return mid
+
+
+def _track_layout(notes, durations):
+    """ Validated arrays of a track, the length of each duration as a variable-length quantity and the track size. """
+    notes = np.asarray(notes, dtype=np.int64)
+    durations = np.asarray(durations, dtype=np.int64)
+    if notes.shape != durations.shape or notes.ndim != 1:
+        raise ValueError(f"Expected as many notes as durations, got {notes.shape} and {durations.shape}")
+    if notes.size and (notes.min() < 0 or notes.max() > 127):
+        raise ValueError("MIDI notes must be in range 0..127")
+    if durations.size and (durations.min() < 0 or durations.max() >= 1 << 28):
+        raise ValueError("MIDI delta times must be in range 0..2**28-1")
+    # Variable-length quantities: 7 bits per byte, most significant first, high bit set on all but the last
+    varlen = 1 + (durations >= 1 << 7) + (durations >= 1 << 14) + (durations >= 1 << 21)
+    # Per note: delta 0, note on (3 bytes), the duration as delta, note off (3 bytes)
+    size = int(7 * notes.size + varlen.sum()) + len(END_OF_TRACK)
+    return notes, durations, varlen, size
+
+
+def _encode_track(buffer: np.ndarray, notes, durations, varlen) -> None:
+    """ Writes the events of a track into a uint8 buffer of exactly the track's size. """
+    # One fixed-width row per note: delta 0, note on, 4 slots for the duration, note off.
+    # The unused duration slots are dropped when the rows are flattened into the buffer.
+    rows = np.empty((notes.size, 11), dtype=np.uint8)
+    rows[:, 0] = 0
+    rows[:, 1] = NOTE_ON
+    rows[:, 2] = notes
+    rows[:, 3] = VELOCITY
+    groups = varlen[:, None] - 1 - VARLEN_SLOTS  # 7-bit group stored in each slot, most significant first
+    rows[:, 4:8] = (durations[:, None] >> 7 * np.maximum(groups, 0)) & 0x7F | (groups > 0) << 7
+    rows[:, 8] = NOTE_OFF
+    rows[:, 9] = notes
+    rows[:, 10] = VELOCITY
+    used = np.ones((notes.size, 11), dtype=bool)
+    used[:, 4:8] = groups >= 0
+    buffer[:-len(END_OF_TRACK)] = rows[used]
+    buffer[-len(END_OF_TRACK):] = np.frombuffer(END_OF_TRACK, dtype=np.uint8)
+
+
+def encode_midi(tracks) -> bytearray:
+    """
+    Encodes melodies as a type 1 Standard MIDI File, one track per melody, without building mido messages.
+
+    The file is written into one preallocated bytearray and is byte for byte what build_midi and
+    MidiFile.save produce for the same melodies.
+
+    :param tracks: Iterable of (notes, durations) pairs.
+    """
+    layouts = [_track_layout(notes, durations) for notes, durations in tracks]
+    data = bytearray(14 + sum(8 + size for *_, size in layouts))
+    struct.pack_into(">4sIhhh", data, 0, b"MThd", 6, 1, len(layouts), TICKS_PER_BEAT)
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    offset = 14
+    for notes, durations, varlen, size in layouts:
+        struct.pack_into(">4sI", data, offset, b"MTrk", size)
+        offset += 8
+        _encode_track(buffer[offset:offset + size], notes, durations, varlen)
+        offset += size
+    return data
+
+
+def save_midi(path, notes, durations) -> None:
+    """ Encodes the MIDI file of a melody and writes it atomically. """
+    data = encode_midi([(notes, durations)])
+    with atomic_open(path) as f:
+        f.write(data)
+
+
+def save_multitrack_midi(path, tracks) -> None:
+    """ Writes several melodies, e.g. a whole population, as the tracks of one MIDI file, atomically. """
+    data = encode_midi(tracks)
+    with atomic_open(path) as f:
+        f.write(data)
@@ -0,0 +1,53 @@
+import numpy as np
+
+NOTE_MIN, NOTE_MAX = 48, 83
+DURATION_MIN, DURATION_MAX = 240, 1920
+
+# Size of a note change in semitones and its probability
+NOTE_STEPS = np.arange(1, 12 + 1)
+NOTE_STEP_P = np.array([0.45, 0.2, 0.1, 0.05, 0.05, 0.05, 0.03, 0.02, 0.02, 0.01, 0.01, 0.01])
+NOTE_STEP_CDF = np.cumsum(NOTE_STEP_P)
+
+
+def make_rng(seed=None) -> np.random.Generator:
+    """
+    Returns a NumPy random generator.
+
+    :param seed: None for fresh OS entropy, an int or SeedSequence for a reproducible stream,
+                 or an existing Generator which is returned as is.
+    """
+    return np.random.default_rng(seed)
+
+
+def mutate(
+        notes: np.ndarray,
+        durations: np.ndarray,
+        rng: np.random.Generator,
+        chance: float = 0.05,
+        note_range=(NOTE_MIN, NOTE_MAX),
+        duration_range=(DURATION_MIN, DURATION_MAX)
+) -> None:
+    """
+    Mutates whole note and duration matrices in place with a handful of bulk draws.
+
+    Every note moves up or down by 1-12 semitones (NOTE_STEP_P) and every duration is doubled or
+    halved, each independently with the given chance. Results are clamped to the given ranges.
+
+    :param notes: Integer matrix of MIDI note numbers, one row per melody.
+    :param durations: Integer matrix of durations in ticks, same shape as notes.
+    :param rng: Random generator, see make_rng.
+    :param chance: The probability of a mutation occurring for each note or duration.
+    :param note_range: Inclusive (min, max) of the notes.
+    :param duration_range: Inclusive (min, max) of the durations.
+    """
+    note_mask, duration_mask = rng.random((2,) + notes.shape) < chance
+    n_notes, n_durations = np.count_nonzero(note_mask), np.count_nonzero(duration_mask)
+    draws = rng.random(2 * n_notes + n_durations)
+
+    steps = NOTE_STEPS[np.searchsorted(NOTE_STEP_CDF, draws[:n_notes] * NOTE_STEP_CDF[-1], side="right")]
+    signs = np.where(draws[n_notes:2 * n_notes] < 0.5, -1, 1)
+    notes[note_mask] = np.clip(notes[note_mask] + signs * steps, *note_range)
+
+    doubled = draws[2 * n_notes:] < 0.5
+    changed = np.where(doubled, durations[duration_mask] * 2, durations[duration_mask] // 2)
+    durations[duration_mask] = np.clip(changed, *duration_range)
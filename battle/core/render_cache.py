@@ -0,0 +1,126 @@
+import os
+import threading
+from hashlib import sha256
+
+import numpy as np
+
+
+class RenderCache:
+    """
+    Content-addressed on-disk store of rendered melodies with LRU eviction.
+
+    Files are named after a hash of (notes, durations, soundfont, synth settings), so a melody
+    that was already rendered with the same synthesizer is served without rendering it again.
+    File modification times track recency: hits touch the file, eviction removes the oldest.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, extension: str = ".wav"):
+        """
+        :param directory: Directory holding the cached files.
+        :param max_bytes: Total size above which the least recently used files are evicted.
+        :param extension: Extension of the rendered audio files.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extension = extension
+
+    @staticmethod
+    def key(notes, durations, soundfont: str, **synth_settings) -> str:
+        """
+        Hash identifying a rendering.
+
+        :param notes: Note values of the melody.
+        :param durations: Durations of the melody.
+        :param soundfont: Path of the soundfont, its size and modification time are part of the key.
+        :param synth_settings: Any other synthesizer setting affecting the output (sample rate, gain, ...).
+        """
+        digest = sha256()
+        digest.update(np.asarray(notes, dtype=np.int16).tobytes())
+        digest.update(np.asarray(durations, dtype=np.int16).tobytes())
+        try:
+            stat = os.stat(soundfont)
+            digest.update(f"{soundfont}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        except OSError:
+            digest.update(str(soundfont).encode())
+        digest.update(repr(sorted(synth_settings.items())).encode())
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.extension}")
+
+    def get(self, key: str):
+        """ Returns the path of a cached file and marks it as recently used, or None. """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get_or_render(self, key: str, render) -> str:
+        """
+        Returns the cached file for key, rendering it on a miss.
+
+        :param key: Cache key, see RenderCache.key.
+        :param render: Callable render(audio_path) writing the audio file.
+        :return: Path of the cached file.
+        """
+        path = self.get(key)
+        if path is not None:
+            return path
+
+        return self.get_or_render_many({key: None}, lambda jobs: render(jobs[0][1]))[key]
+
+    def get_or_render_many(self, items: dict, render_many) -> dict:
+        """
+        Batch version of get_or_render, all misses are rendered by one call.
+
+        :param items: Mapping of cache key to the item to render for it.
+        :param render_many: Callable render_many([(item, audio_path), ...]) writing every audio file.
+        :return: Mapping of cache key to the path of its cached file.
+        """
+        paths = {}
+        missing = []
+        for key, item in items.items():
+            path = self.get(key)
+            if path is not None:
+                paths[key] = path
+            else:
+                # Unique per rendering thread: concurrent misses on one key must not write into the same file
+                tmp_name = f".{key}.{os.getpid()}.{threading.get_ident()}.tmp{self.extension}"
+                tmp_path = os.path.join(self.directory, tmp_name)
+                missing.append((key, item, tmp_path))
+        if not missing:
+            return paths
+
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            render_many([(item, tmp_path) for _, item, tmp_path in missing])
+            for key, _, tmp_path in missing:
+                paths[key] = self.path(key)
+                os.replace(tmp_path, paths[key])
+        finally:
+            for _, _, tmp_path in missing:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        self.evict()
+        return paths
+
+    def evict(self) -> None:
+        """ Removes the least recently used files until the cache fits in max_bytes. """
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(self.extension) and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,92 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait as wait_futures
+
+from Evalutionary_music_generation import settings
+from battle.core.convertor import render_cache, soundfont_path
+from battle.core.synth import get_backend
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+
+
+class RenderPool:
+    """
+    Renders melodies in a bounded thread pool, one task per melody, so a failing or hanging render
+    only affects its own melody. Audio paths are content-addressed and known before rendering ends,
+    callers wait only for the melodies they are about to play.
+    """
+
+    def __init__(self, max_workers: int, timeout: float):
+        """
+        :param max_workers: Number of render threads.
+        :param timeout: Seconds wait() gives each melody before giving up on it.
+        """
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="render")
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, notes, durations) -> str:
+        """
+        Schedules a melody for rendering unless it is cached or already being rendered.
+
+        :return: Path of the audio file relative to MEDIA_ROOT, it exists once the render finished.
+        """
+        cache = render_cache()
+        backend = get_backend(soundfont_path())
+        key = cache.key(notes, durations, soundfont_path(), **backend.settings())
+        path = os.path.relpath(cache.path(key), settings.MEDIA_ROOT)
+
+        with self._lock:
+            if path in self._pending or cache.get(key) is not None:
+                return path
+            future = self._executor.submit(
+                cache.get_or_render, key, lambda audio_path: backend.render(notes, durations, audio_path)
+            )
+            self._pending[path] = future
+        future.add_done_callback(lambda done: self._finished(path, done))
+        return path
+
+    def wait(self, paths) -> list:
+        """
+        Waits for the given renders, at most `timeout` seconds each.
+
+        :return: For every path, whether its audio file is ready.
+        """
+        ready = []
+        for path in paths:
+            with self._lock:
+                future = self._pending.get(path)
+            if future is not None:
+                try:
+                    future.result(timeout=self.timeout)
+                except TimeoutError:
+                    logger.warning("Rendering %s did not finish in %s seconds", path, self.timeout)
+                except Exception:
+                    pass  # logged by _finished
+            ready.append(os.path.exists(os.path.join(settings.MEDIA_ROOT, path)))
+        return ready
+
+    def drain(self) -> None:
+        """ Blocks until every queued render finished. """
+        with self._lock:
+            futures = list(self._pending.values())
+        wait_futures(futures)
+
+    def _finished(self, path: str, future) -> None:
+        """ Drops a finished render, a failed one is retried by the next submit. """
+        with self._lock:
+            self._pending.pop(path, None)
+        if future.exception() is not None:
+            logger.error("Rendering %s failed", path, exc_info=future.exception())
+
+
+def get_render_pool() -> RenderPool:
+    """ Returns the render pool of this server process, creating it on first use. """
+    global _pool
+    if _pool is None:
+        _pool = RenderPool(settings.RENDER_WORKERS, settings.RENDER_TIMEOUT)
+    return _pool
@@ -0,0 +1,171 @@
+import os
+import shutil
+import threading
+import wave
+from functools import lru_cache
+
+import numpy as np
+from midi2audio import FluidSynth
+
+from Evalutionary_music_generation import settings
+from battle.core.midi import save_midi
+
+try:
+    import fluidsynth  # pyfluidsynth, optional
+except ImportError:
+    fluidsynth = None
+
+TICKS_PER_BEAT = 480  # mido defaults used by battle.core.midi
+SECONDS_PER_TICK = 0.5 / TICKS_PER_BEAT  # 120 bpm
+
+
+def write_wav(path, samples: np.ndarray, sample_rate: int, channels: int = 1) -> None:
+    """ Writes interleaved 16-bit samples to a WAV file. """
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.asarray(samples, dtype="<i2").tobytes())
+
+
+class SynthBackend:
+    """ Renders melodies given as note/duration sequences into WAV files. """
+
+    name = None
+
+    def __init__(self, sample_rate: int = 44100):
+        self.sample_rate = sample_rate
+
+    def settings(self) -> dict:
+        """ Everything that affects the rendered audio, used in render cache keys. """
+        return {"backend": self.name, "sample_rate": self.sample_rate}
+
+    def render(self, notes, durations, audio_path: str) -> None:
+        raise NotImplementedError("Must be implemented in subclasses")
+
+    def render_many(self, melodies) -> None:
+        """
+        Renders several melodies in one call.
+
+        :param melodies: Iterable of (notes, durations, audio_path) tuples.
+        """
+        for notes, durations, audio_path in melodies:
+            self.render(notes, durations, audio_path)
+
+    def _frames(self, durations) -> np.ndarray:
+        return np.round(np.asarray(durations, dtype=float) * SECONDS_PER_TICK * self.sample_rate).astype(np.int64)
+
+
+class SineSynth(SynthBackend):
+    """ Pure NumPy sine synthesizer with an ADSR envelope, for tests and machines without FluidSynth. """
+
+    name = "sine"
+
+    def __init__(self, sample_rate: int = 22050, attack=0.01, decay=0.05, sustain=0.7, release=0.05, volume=0.3):
+        super().__init__(sample_rate)
+        self.attack, self.decay, self.sustain, self.release, self.volume = attack, decay, sustain, release, volume
+
+    def settings(self) -> dict:
+        return {
+            **super().settings(),
+            "adsr": (self.attack, self.decay, self.sustain, self.release),
+            "volume": self.volume,
+        }
+
+    def render(self, notes, durations, audio_path: str) -> None:
+        frames = self._frames(durations)
+        frequencies = 440.0 * 2 ** ((np.asarray(notes, dtype=float) - 69) / 12)
+
+        # Position of every sample inside its note
+        starts = np.repeat(np.cumsum(frames) - frames, frames)
+        t = (np.arange(frames.sum()) - starts) / self.sample_rate
+        lengths = np.repeat(frames / self.sample_rate, frames)
+
+        signal = np.sin(2 * np.pi * np.repeat(frequencies, frames) * t)
+        write_wav(audio_path, signal * self._envelope(t, lengths) * self.volume * 32767, self.sample_rate)
+
+    def _envelope(self, t: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        attack = np.clip(t / self.attack, 0, 1)
+        decay = 1 - (1 - self.sustain) * np.clip((t - self.attack) / self.decay, 0, 1)
+        release = np.clip((lengths - t) / self.release, 0, 1)
+        return np.minimum(attack, decay) * release
+
+
+class FluidSynthProcess(SynthBackend):
+    """ Spawns the fluidsynth command line for every melody (one soundfont load per file). """
+
+    name = "fluidsynth-process"
+
+    def __init__(self, soundfont: str, sample_rate: int = 44100):
+        super().__init__(sample_rate)
+        self.soundfont = soundfont
+
+    def settings(self) -> dict:
+        return {**super().settings(), "soundfont": self.soundfont}
+
+    def render(self, notes, durations, audio_path: str) -> None:
+        mid_file_path = f"{audio_path}.mid"
+        save_midi(mid_file_path, notes, durations)
+        try:
+            FluidSynth(self.soundfont, sample_rate=self.sample_rate).midi_to_audio(mid_file_path, audio_path)
+        finally:
+            os.remove(mid_file_path)
+
+
+class PersistentFluidSynth(SynthBackend):
+    """
+    Long-lived in-process FluidSynth (pyfluidsynth): melodies are rendered straight from note/duration
+    sequences, without MIDI files or subprocesses.
+
+    A fluidsynth.Synth renders one melody at a time, so every rendering thread (at most RENDER_WORKERS
+    of the render pool) gets its own synth, created with the soundfont loaded on its first render.
+    """
+
+    name = "fluidsynth"
+    velocity = 64
+
+    def __init__(self, soundfont: str, sample_rate: int = 44100, gain: float = 0.2, release: float = 0.5):
+        super().__init__(sample_rate)
+        self.soundfont = soundfont
+        self.gain = gain
+        self.release = release
+        self._local = threading.local()
+
+    def settings(self) -> dict:
+        return {**super().settings(), "soundfont": self.soundfont, "gain": self.gain, "release": self.release}
+
+    def _get_synth(self):
+        """ Returns the synth of the calling thread, loading the soundfont on first use. """
+        synth = getattr(self._local, "synth", None)
+        if synth is None:
+            synth = fluidsynth.Synth(gain=self.gain, samplerate=float(self.sample_rate))
+            synth.program_select(0, synth.sfload(self.soundfont), 0, 0)
+            self._local.synth = synth
+        return synth
+
+    def render(self, notes, durations, audio_path: str) -> None:
+        synth = self._get_synth()
+        chunks = []
+        for note, frames in zip(notes, self._frames(durations)):
+            synth.noteon(0, int(note), self.velocity)
+            chunks.append(synth.get_samples(int(frames)))
+            synth.noteoff(0, int(note))
+        chunks.append(synth.get_samples(int(self.release * self.sample_rate)))
+        write_wav(audio_path, np.concatenate(chunks), self.sample_rate, channels=2)
+
+
+@lru_cache(maxsize=None)
+def get_backend(soundfont: str) -> SynthBackend:
+    """
+    Returns the synthesizer of this process for a soundfont, created once and kept warm.
+    settings.SYNTH_BACKEND selects 'fluidsynth', 'fluidsynth-process', 'sine' or 'auto', which picks
+    the first one available in that order.
+    """
+    choice = getattr(settings, "SYNTH_BACKEND", "auto")
+    has_soundfont = os.path.exists(soundfont)
+
+    if choice == "fluidsynth" or (choice == "auto" and fluidsynth is not None and has_soundfont):
+        return PersistentFluidSynth(soundfont)
+    if choice == "fluidsynth-process" or (choice == "auto" and shutil.which("fluidsynth") and has_soundfont):
+        return FluidSynthProcess(soundfont)
+    return SineSynth()
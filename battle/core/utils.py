@@ -1,12 +1,13 @@
 import os
 import random
-import json
 
 import pygame
 import numpy as np
-from mido import MidiFile, MidiTrack, Message
 
 from Evalutionary_music_generation import settings
+from battle.core.melody import Melody
+from battle.core.archive import ARCHIVE_NAME, PopulationArchive
+from battle.core.mutation import make_rng, mutate
 
 code2name = {
     48: "C3",
@@ -49,34 +50,19 @@ code2name = {
 
 
 def generate_random_melodies(n_melodies, n_melody_notes):
-    melodies = {}
+    melodies = []
     for i in range(n_melodies):
         notes = [random.randint(48, 83) for _ in range(n_melody_notes)]
         durations = random.choices([240, 480, 960, 1920], k=n_melody_notes)
 
-        melodies[i] = {
-            'notes': notes,
-            'durations': durations
-        }
+        melodies.append(Melody(notes, durations))
 
     return melodies
 
 
 def save_melodies(melodies, algorithm_dir):
-    for i in range(len(melodies)):
-        mid = MidiFile()
-        track = MidiTrack()
-        mid.tracks.append(track)
-
-        notes, durations = melodies[i]['notes'], melodies[i]['durations']
-        for note, duration in zip(notes, durations):
-            track.append(Message('note_on', note=note, velocity=64, time=0))
-            track.append(Message('note_off', note=note, velocity=64, time=duration))
-
-            mid.save(os.path.join(settings.MEDIA_ROOT, algorithm_dir, f'melody_{i}.mid'))
-
-    with open(os.path.join(settings.MEDIA_ROOT, algorithm_dir, f'melodies.json'), 'w') as f:
-        json.dump(melodies, f, indent=4)
+    """ Writes the melodies as a population archive, MIDI and JSON files are exported from it on demand. """
+    PopulationArchive.from_melodies(melodies).save(os.path.join(settings.MEDIA_ROOT, algorithm_dir, ARCHIVE_NAME))
 
 
 def play_melody(index, algorithm_dir):
@@ -129,16 +115,16 @@ def crossover(melodies, winners, n_melody_notes):
     print()
     print()
     print()
-    new_generation = {}
+    new_generation = []
     for i in range(len(melodies)):
         first_parent, second_parent = random.sample(winners, 2)
         split_index = random.randint(1, n_melody_notes - 1)
 
-        new_generation[i] = {
-            "notes": melodies[first_parent]['notes'][:split_index] + melodies[second_parent]['notes'][split_index:],
-            "durations": melodies[first_parent]['durations'][:split_index] + melodies[second_parent]['durations'][
-                                                                             split_index:]
-        }
+        first, second = melodies[first_parent], melodies[second_parent]
+        new_generation.append(Melody(
+            first.notes[:split_index] + second.notes[split_index:],
+            first.durations[:split_index] + second.durations[split_index:],
+        ))
 
     return new_generation
 
@@ -158,35 +144,22 @@ def crossover(melodies, winners, n_melody_notes):
 #     return melodies
 
 
-def mutation(melodies):
-    for i in range(len(melodies)):
-        for j in range(len(melodies[i]['notes'])):
-            if (chance(5)):
-                p_dist = [0.45, 0.2, 0.1, 0.05, 0.05, 0.05, 0.03, 0.02, 0.02, 0.01, 0.01, 0.01]
-                sign = random.choice([-1, 1])
-                change_note_number = np.random.choice(list(range(1, 12 + 1)), p=p_dist)
-                melodies[i]['notes'][j] = int(melodies[i]['notes'][j] + sign * change_note_number)
-                melodies[i]['notes'][j] = min(max(melodies[i]['notes'][j], 48), 83)
-            if (chance(5)):
-                scalar = random.choice([2, 0.5])
-                melodies[i]['durations'][j] = int(melodies[i]['durations'][j] * scalar)
-                melodies[i]['durations'][j] = min(max(melodies[i]['durations'][j], 240), 1920)
+def mutation(melodies, rng=None):
+    if not melodies:
+        return melodies
+    notes = np.array([melody.notes_array for melody in melodies])
+    durations = np.array([melody.durations_array for melody in melodies])
+    mutate(notes, durations, make_rng(rng))
+
+    for melody, melody_notes, melody_durations in zip(melodies, notes, durations):
+        melody.notes_array[:] = melody_notes
+        melody.durations_array[:] = melody_durations
 
     return melodies
 
 
 def load_melodies_data(algorithm_dir):
-    with open(os.path.join(settings.MEDIA_ROOT, algorithm_dir, f'melodies.json')) as f:
-        melodies = json.load(f)
-
-    keys = list(melodies.keys())
-    for key in keys:
-        melodies[int(key)] = melodies[key]
-
-    for key in keys:
-        del melodies[key]
-
-    return melodies
+    return PopulationArchive.load(os.path.join(settings.MEDIA_ROOT, algorithm_dir, ARCHIVE_NAME)).melodies()
 
 
 if __name__ == "__main__":
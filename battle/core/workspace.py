@@ -0,0 +1,164 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from Evalutionary_music_generation import settings
+from battle.core.midi import UMASK, atomic_open
+
+logger = logging.getLogger(__name__)
+
+_collector = None
+
+
+class Workspace:
+    """
+    Private directory of one battle or job, MEDIA_ROOT/WORKSPACE_DIR/<kind>/<key>, so concurrent sessions
+    never write into each other's files.
+
+    Files are published atomically. Every atomic write renames a file into the workspace and so refreshes
+    its modification time, which is what the collector looks at to find stale workspaces.
+    """
+
+    def __init__(self, kind: str, key):
+        """
+        :param kind: Owner type, e.g. 'battle' or 'jobs'.
+        :param key: Owner id, unique within the kind.
+        """
+        self.kind = kind
+        self.key = str(key)
+        self.relpath = os.path.join(settings.WORKSPACE_DIR, kind, self.key)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(settings.MEDIA_ROOT, self.relpath)
+
+    def file(self, *parts) -> str:
+        """ Absolute path of a file inside the workspace. """
+        return os.path.join(self.path, *parts)
+
+    def url(self, *parts) -> str:
+        return os.path.join(settings.MEDIA_URL, self.relpath, *parts)
+
+    def create(self):
+        """ Creates the workspace if needed, marks it as used and makes sure stale workspaces get collected. """
+        os.makedirs(self.path, exist_ok=True)
+        self.touch()
+        get_collector()
+        return self
+
+    def touch(self) -> None:
+        """ Marks the workspace as used, postponing its collection. """
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            pass
+
+    def publish_file(self, name: str, source: str) -> str:
+        """ Copies a file into the workspace atomically, returns its absolute path. """
+        path = self.file(name)
+        with open(source, "rb") as src, atomic_open(path) as dst:
+            shutil.copyfileobj(src, dst)
+        return path
+
+    def publish_directory(self, name: str, files: dict) -> str:
+        """
+        Replaces a subdirectory with copies of the given files.
+
+        The new directory is filled next to the old one and renamed into place, readers list either the
+        complete old set or the complete new set; for the instant between the two renames the directory
+        does not exist.
+
+        :param name: Subdirectory name.
+        :param files: Mapping of file names in the subdirectory to the paths they are copied from.
+        :return: Absolute path of the subdirectory.
+        """
+        staging = tempfile.mkdtemp(prefix=f".{name}.", suffix=".tmp", dir=self.path)
+        try:
+            os.chmod(staging, 0o777 & ~UMASK)  # mkdtemp directories are owner-only, see atomic_open
+            for file_name, source in files.items():
+                shutil.copyfile(source, os.path.join(staging, file_name))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        target = self.file(name)
+        retired = None
+        if os.path.exists(target):
+            retired = tempfile.mkdtemp(prefix=f".{name}.", suffix=".old", dir=self.path)
+            os.replace(target, retired)  # POSIX lets a directory replace an empty one
+        os.replace(staging, target)
+        if retired is not None:
+            shutil.rmtree(retired, ignore_errors=True)
+        return target
+
+    def listdir(self, *parts) -> list:
+        """ Names in a workspace directory, an empty list if it does not exist (yet). """
+        try:
+            return sorted(os.listdir(self.file(*parts)))
+        except FileNotFoundError:
+            return []
+
+
+def collect_workspaces(max_age: float) -> list:
+    """
+    Removes the workspaces not used for max_age seconds.
+
+    :return: Paths of the removed workspaces, relative to MEDIA_ROOT.
+    """
+    root = os.path.join(settings.MEDIA_ROOT, settings.WORKSPACE_DIR)
+    if not os.path.isdir(root):
+        return []
+    cutoff = time.time() - max_age
+    removed = []
+    for kind in os.scandir(root):
+        if not kind.is_dir():
+            continue
+        for entry in os.scandir(kind.path):
+            try:
+                stale = entry.is_dir() and entry.stat().st_mtime < cutoff
+            except FileNotFoundError:
+                continue  # Removed concurrently, e.g. by the collector of another server process
+            if stale:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed.append(os.path.relpath(entry.path, settings.MEDIA_ROOT))
+    return removed
+
+
+class WorkspaceCollector:
+    """ Daemon thread calling collect_workspaces every `interval` seconds. """
+
+    def __init__(self, interval: float, max_age: float):
+        """
+        :param interval: Seconds between two collections.
+        :param max_age: Seconds a workspace may stay unused, see collect_workspaces.
+        """
+        self.interval = interval
+        self.max_age = max_age
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="workspace-collector", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                removed = collect_workspaces(self.max_age)
+            except Exception:
+                logger.exception("Collecting stale workspaces failed")
+                continue
+            if removed:
+                logger.info("Removed %d stale workspaces", len(removed))
+
+
+def get_collector() -> Optional[WorkspaceCollector]:
+    """ Returns the workspace collector of this server process, starting it on first use. """
+    global _collector
+    if _collector is None and settings.WORKSPACE_GC_INTERVAL is not None:
+        _collector = WorkspaceCollector(settings.WORKSPACE_GC_INTERVAL, settings.WORKSPACE_MAX_AGE)
+    return _collector
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from Evalutionary_music_generation import settings
+from battle.core.workspace import collect_workspaces
+
+
+class Command(BaseCommand):
+    help = "Removes battle and job workspaces that were not used recently, e.g. from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age", type=float, default=settings.WORKSPACE_MAX_AGE,
+            help="Seconds a workspace may stay unused (default: WORKSPACE_MAX_AGE).",
+        )
+
+    def handle(self, *args, **options):
+        removed = collect_workspaces(options["max_age"])
+        for path in removed:
+            self.stdout.write(path)
+        self.stdout.write(self.style.SUCCESS(f"Removed {len(removed)} workspace(s)"))
@@ -0,0 +1,38 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from battle.core.archive import PopulationArchive
+
+
+class Command(BaseCommand):
+    help = "Exports a population archive as MIDI files and/or melodies.json."
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", help="Population archive, e.g. a workspace's population.bin.")
+        parser.add_argument("output", help="Directory receiving the exported files.")
+        parser.add_argument("--midi", action="store_true", help="Write one melody_{i}.mid file per melody.")
+        parser.add_argument("--multitrack", action="store_true", help="Write a single population.mid, one track per melody.")
+        parser.add_argument("--json", action="store_true", help="Write melodies.json.")
+
+    def handle(self, *args, **options):
+        if not (options["midi"] or options["multitrack"] or options["json"]):
+            raise CommandError("Nothing to export, pass --midi, --multitrack and/or --json.")
+        try:
+            archive = PopulationArchive.load(options["archive"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {options['archive']}: {e}")
+
+        paths = []
+        if options["midi"]:
+            paths += archive.export_midi(options["output"])
+        if options["multitrack"]:
+            paths += archive.export_midi(options["output"], multitrack=True)
+        if options["json"]:
+            os.makedirs(options["output"], exist_ok=True)
+            paths.append(os.path.join(options["output"], "melodies.json"))
+            archive.export_json(paths[-1])
+        for path in paths:
+            self.stdout.write(path)
+        n_melodies, n_melody_notes = archive.shape
+        self.stdout.write(self.style.SUCCESS(f"Exported {n_melodies} x {n_melody_notes} melodies to {len(paths)} file(s)"))
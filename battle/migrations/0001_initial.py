@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:41
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Battle',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('n_melodies', models.PositiveSmallIntegerField()),
+                ('n_melody_notes', models.PositiveSmallIntegerField()),
+                ('generation', models.PositiveIntegerField(default=0)),
+                ('notes', models.BinaryField()),
+                ('durations', models.BinaryField()),
+                ('pairs', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.PositiveIntegerField()),
+                ('pair', models.PositiveSmallIntegerField()),
+                ('winner', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('battle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='battle.battle')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('battle', 'generation', 'pair'), name='unique_vote_per_pair')],
+            },
+        ),
+    ]
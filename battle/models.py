@@ -1,3 +1,127 @@
-from django.db import models
+from __future__ import annotations
 
-# Create your models here.
+import uuid
+from typing import Optional
+
+from django.db import IntegrityError, models, transaction
+
+from battle.core.melody import Melody, pack_melodies, unpack_melody
+from battle.core.workspace import Workspace
+
+
+class Battle(models.Model):
+    """
+    A manual battle. The current generation is stored packed (see battle.core.melody.pack_melodies)
+    with its pairs; votes are appended as Vote rows, so voting never rewrites the population.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    n_melodies = models.PositiveSmallIntegerField()
+    n_melody_notes = models.PositiveSmallIntegerField()
+    generation = models.PositiveIntegerField(default=0)
+    notes = models.BinaryField()  # uint8, n_melodies x n_melody_notes row after row
+    durations = models.BinaryField()  # little-endian uint16, same layout
+    pairs = models.BinaryField()  # uint8 melody indices, two per pair
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # The packed population, deferred on the vote path so that a vote costs the same whatever the battle size
+    MELODY_FIELDS = ('notes', 'durations')
+
+    class Meta:
+        ordering = ['-created_at']
+
+    @classmethod
+    def start(cls, melodies: list[Melody], pairs) -> Battle:
+        notes, durations = pack_melodies(melodies)
+        return cls.objects.create(
+            n_melodies=len(melodies),
+            n_melody_notes=len(melodies[0]) if melodies else 0,
+            notes=notes,
+            durations=durations,
+            pairs=bytes(index for pair in pairs for index in pair),
+        )
+
+    def workspace(self) -> Workspace:
+        """ Directory of the battle's MIDI files and previous winners. """
+        return Workspace('battle', self.id)
+
+    def load_melodies(self) -> None:
+        """ Fetches the packed population of a battle loaded with MELODY_FIELDS deferred, in one query. """
+        self.refresh_from_db(fields=self.MELODY_FIELDS)
+
+    def melody(self, index: int) -> Melody:
+        return unpack_melody(bytes(self.notes), bytes(self.durations), index, self.n_melody_notes)
+
+    def melodies(self) -> list[Melody]:
+        notes, durations = bytes(self.notes), bytes(self.durations)
+        return [unpack_melody(notes, durations, i, self.n_melody_notes) for i in range(self.n_melodies)]
+
+    def pair_list(self) -> list[tuple[int, int]]:
+        pairs = bytes(self.pairs)
+        return list(zip(pairs[::2], pairs[1::2]))
+
+    def winners(self) -> list[int]:
+        """ Winners of the current generation, in pair order. """
+        return list(self.votes.filter(generation=self.generation).order_by('pair').values_list('winner', flat=True))
+
+    def current_pair(self) -> Optional[tuple[int, int]]:
+        """ The pair waiting for a vote, None once every pair of the generation was voted on. """
+        pairs = self.pair_list()
+        voted = self.votes.filter(generation=self.generation).count()
+        return pairs[voted] if voted < len(pairs) else None
+
+    def vote(self, winner: int) -> Optional[int]:
+        """
+        Records the winner of the current pair.
+
+        :return: Index of the voted pair, the generation is complete once it is the last one. None if the
+                 melody is not part of the current pair or the pair was already voted on.
+        """
+        pair_index = self.votes.filter(generation=self.generation).count()
+        pairs = self.pair_list()
+        if pair_index >= len(pairs) or winner not in pairs[pair_index]:
+            return None
+        try:
+            with transaction.atomic():
+                Vote.objects.create(battle=self, generation=self.generation, pair=pair_index, winner=winner)
+        except IntegrityError:
+            return None
+        return pair_index
+
+    def next_generation(self, melodies: list[Melody], pairs) -> bool:
+        """
+        Replaces the population with the next generation.
+
+        :return: False if another request already moved the battle past the current generation.
+        """
+        notes, durations = pack_melodies(melodies)
+        fields = {
+            'generation': self.generation + 1,
+            'notes': notes,
+            'durations': durations,
+            'pairs': bytes(index for pair in pairs for index in pair),
+        }
+        if not Battle.objects.filter(pk=self.pk, generation=self.generation).update(**fields):
+            return False
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+
+    def __str__(self):
+        return f'Battle {self.id} (generation {self.generation})'
+
+
+class Vote(models.Model):
+    """ Winner of one pair of a battle generation. """
+
+    battle = models.ForeignKey(Battle, on_delete=models.CASCADE, related_name='votes')
+    generation = models.PositiveIntegerField()
+    pair = models.PositiveSmallIntegerField()
+    winner = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['battle', 'generation', 'pair'], name='unique_vote_per_pair'),
+        ]
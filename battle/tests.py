@@ -1,3 +1,308 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import threading
+import wave
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from mido import MidiFile
+
+from Evalutionary_music_generation import settings
+from battle.core.archive import ALIGNMENT, HEADER, PopulationArchive
+from battle.core.convertor import render_melodies, render_melody
+from battle.core.melody import Melody, pack_melodies, unpack_melody
+from battle.core.midi import build_midi, encode_midi
+from battle.core.render_cache import RenderCache
+from battle.core.render_pool import RenderPool
+from battle.core.synth import SECONDS_PER_TICK, SineSynth, get_backend
+from battle.core.utils import generate_random_melodies
+from battle.models import Battle
+
+
+class EncodeMidiTests(SimpleTestCase):
+
+    @staticmethod
+    def mido_bytes(mid: MidiFile) -> bytes:
+        buffer = io.BytesIO()
+        mid.save(file=buffer)
+        return buffer.getvalue()
+
+    def test_single_track_matches_mido(self):
+        rng = np.random.default_rng(0)
+        # Durations around every variable-length quantity boundary
+        durations = [0, 1, 127, 128, 240, 16383, 16384, 2 ** 21 - 1, 2 ** 21, 2 ** 28 - 1]
+        notes = rng.integers(0, 128, len(durations))
+        self.assertEqual(bytes(encode_midi([(notes, durations)])), self.mido_bytes(build_midi(notes, durations)))
+        self.assertEqual(bytes(encode_midi([([], [])])), self.mido_bytes(build_midi([], [])))
+
+    def test_multitrack_matches_mido(self):
+        rng = np.random.default_rng(1)
+        tracks = [(rng.integers(48, 84, 12), rng.integers(240, 1921, 12)) for _ in range(5)]
+        mid = MidiFile()
+        for notes, durations in tracks:
+            mid.tracks.append(build_midi(notes, durations).tracks[0])
+        self.assertEqual(bytes(encode_midi(tracks)), self.mido_bytes(mid))
+
+    def test_rejects_out_of_range_values(self):
+        with self.assertRaises(ValueError):
+            encode_midi([([128], [240])])
+        with self.assertRaises(ValueError):
+            encode_midi([([60], [2 ** 28])])
+
+
+class MelodyTests(SimpleTestCase):
+
+    def test_round_trips(self):
+        melodies = generate_random_melodies(5, 8)
+        for melody in melodies:
+            self.assertEqual(Melody.from_dict(melody.to_dict()), melody)
+            self.assertEqual(Melody.from_bytes(*melody.to_bytes()), melody)
+            self.assertEqual(melody.notes_array.tolist(), melody.notes.tolist())
+            self.assertEqual(melody.durations_array.tolist(), melody.durations.tolist())
+        notes, durations = pack_melodies(melodies)
+        self.assertEqual([unpack_melody(notes, durations, i, 8) for i in range(5)], melodies)
+
+    def test_copies_and_hashing(self):
+        melody = Melody([60, 62, 64], [240, 480, 960])
+        copy = melody.copy()
+        self.assertEqual(copy, melody)
+        self.assertEqual(len({melody, copy}), 1)
+        copy.notes_array[0] = 61  # Views write through
+        self.assertNotEqual(copy, melody)
+        self.assertEqual(copy.notes[0], 61)
+
+    def test_rejects_mismatched_lengths(self):
+        with self.assertRaises(ValueError):
+            Melody([60, 62], [240])
+        with self.assertRaises(ValueError):
+            Melody.from_bytes(bytes([60, 62]), bytes(2))
+
+
+class PopulationArchiveTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "population.bin")
+        rng = np.random.default_rng(0)
+        self.archive = PopulationArchive(
+            rng.integers(48, 84, (7, 13)), rng.integers(0, 2 ** 16, (7, 13)), rng.random(7), {"generation": 42},
+        )
+
+    def test_round_trip(self):
+        self.archive.save(self.path)
+        for mmap in (True, False):
+            loaded = PopulationArchive.load(self.path, mmap=mmap)
+            np.testing.assert_array_equal(loaded.notes, self.archive.notes)
+            np.testing.assert_array_equal(loaded.durations, self.archive.durations)
+            np.testing.assert_array_equal(loaded.scores, self.archive.scores)
+            self.assertEqual(loaded.metadata, {"generation": 42})
+            self.assertEqual(loaded.melodies(), [
+                Melody(notes, durations) for notes, durations in zip(self.archive.notes, self.archive.durations)
+            ])
+        # Mapped matrices are aligned read-only views into the file
+        mapped = PopulationArchive.load(self.path)
+        for matrix in (mapped.notes, mapped.durations, mapped.scores):
+            self.assertEqual(matrix.ctypes.data % ALIGNMENT, 0)
+        with self.assertRaises(ValueError):
+            mapped.notes[0, 0] = 0
+
+    def test_round_trip_without_scores(self):
+        PopulationArchive(self.archive.notes[:0], self.archive.durations[:0]).save(self.path)
+        loaded = PopulationArchive.load(self.path)
+        self.assertEqual(loaded.shape, (0, 13))
+        self.assertIsNone(loaded.scores)
+        self.assertEqual(loaded.metadata, {})
+
+    def assert_rejected(self, data: bytes, message: str):
+        with open(self.path, "wb") as f:
+            f.write(data)
+        for mmap in (True, False):
+            with self.assertRaisesRegex(ValueError, message):
+                PopulationArchive.load(self.path, mmap=mmap)
+
+    def test_rejects_corrupt_files(self):
+        data = bytes(self.archive.to_bytes())
+        self.assert_rejected(b"EMG", "not a population archive")
+        self.assert_rejected(b"MIDI" + data[4:], "not a population archive")
+        self.assert_rejected(data[:6] + b"\x02\x00" + data[8:], "unsupported archive version 2")
+        self.assert_rejected(data[:-1], "truncated")
+        self.assert_rejected(data[:HEADER.size], "truncated")
+        metadata = data.index(b"{")
+        self.assert_rejected(data[:metadata] + b"[" + data[metadata + 1:], "")  # Invalid JSON
+
+
+class RenderCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = RenderCache(directory.name, max_bytes=300)
+
+    @staticmethod
+    def write(size):
+        def render(path):
+            with open(path, "wb") as f:
+                f.write(b"\0" * size)
+        return render
+
+    def test_evicts_least_recently_used_above_max_bytes(self):
+        paths = {}
+        for i, key in enumerate("abc"):
+            paths[key] = self.cache.get_or_render(key, self.write(100))
+            os.utime(paths[key], ns=(i * 10 ** 9, i * 10 ** 9))  # a is the oldest
+        self.assertEqual(self.cache.get("a"), paths["a"])  # Touched, b becomes the oldest
+
+        self.cache.get_or_render("d", self.write(100))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertCountEqual(os.listdir(self.cache.directory), ["a.wav", "c.wav", "d.wav"])
+
+        # A hit serves the file without rendering
+        self.assertEqual(self.cache.get_or_render("c", self.write(0)), paths["c"])
+        self.assertEqual(os.path.getsize(paths["c"]), 100)
+
+        self.cache.get_or_render("e", self.write(250))
+        self.assertCountEqual(os.listdir(self.cache.directory), ["e.wav"])
+
+    def test_concurrent_misses_on_one_key(self):
+        barrier = threading.Barrier(2)
+        errors = []
+
+        def render(path):
+            with open(path, "wb") as f:
+                f.write(b"\0" * 10)
+            barrier.wait(timeout=5)  # Both threads hold a rendered temporary file
+
+        def miss():
+            try:
+                self.cache.get_or_render_many({"a": None}, lambda jobs: render(jobs[0][1]))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=miss) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.cache.directory), ["a.wav"])
+
+
+class SineSynthTestCase(SimpleTestCase):
+    """ Renders with the sine backend into a temporary MEDIA_ROOT. """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for patch in (
+                mock.patch.object(settings, "MEDIA_ROOT", directory.name),
+                mock.patch.object(settings, "SYNTH_BACKEND", "sine"),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        get_backend.cache_clear()
+        self.addCleanup(get_backend.cache_clear)
+
+    @staticmethod
+    def read_wav(relpath):
+        with wave.open(os.path.join(settings.MEDIA_ROOT, relpath), "rb") as f:
+            samples = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2")
+            return f.getnchannels(), f.getframerate(), samples
+
+
+class RenderTests(SineSynthTestCase):
+
+    def test_sine_backend_renders_the_notes(self):
+        self.assertIsInstance(get_backend("missing.sf2"), SineSynth)
+        durations = [480, 960, 480]
+        path = render_melody([69, 81, 57], durations)
+        self.assertTrue(path.startswith(settings.RENDER_CACHE_DIR))
+
+        channels, sample_rate, samples = self.read_wav(path)
+        self.assertEqual((channels, sample_rate), (1, 22050))
+        self.assertEqual(len(samples), round(sum(durations) * SECONDS_PER_TICK * sample_rate))
+        self.assertGreater(np.abs(samples).max(), 0.2 * 32767)
+
+        # The first note is an A4, its frequency dominates the first half second
+        first = samples[:round(480 * SECONDS_PER_TICK * sample_rate)].astype(float)
+        peak = np.argmax(np.abs(np.fft.rfft(first))) * sample_rate / len(first)
+        self.assertAlmostEqual(peak, 440, delta=2)
+
+    def test_render_melodies_reuses_cached_files(self):
+        melodies = [([60, 62], [240, 240]), ([64, 65], [480, 240])]
+        paths = render_melodies(melodies)
+        self.assertEqual(len(set(paths)), 2)
+        with mock.patch.object(SineSynth, "render", side_effect=AssertionError("rendered again")):
+            self.assertEqual(render_melodies(melodies[::-1]), paths[::-1])
+            self.assertEqual(render_melody(*melodies[0]), paths[0])
+
+
+class RenderPoolTests(SineSynthTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.pool = RenderPool(max_workers=2, timeout=0.2)
+        self.addCleanup(self.pool._executor.shutdown)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.failures = 1
+        render = SineSynth.render
+
+        def flaky_render(synth, notes, durations, audio_path):
+            if notes[0] == 60:  # Hangs until released
+                self.release.wait(timeout=5)
+            elif notes[0] == 62 and self.failures:
+                self.failures -= 1
+                raise RuntimeError("synthesizer crashed")
+            render(synth, notes, durations, audio_path)
+
+        patch = mock.patch.object(SineSynth, "render", flaky_render)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_wait_gives_up_on_a_hanging_render(self):
+        hanging = self.pool.submit([60, 64], [240, 240])
+        other = self.pool.submit([64, 67], [240, 240])
+        self.assertEqual(self.pool.submit([60, 64], [240, 240]), hanging)  # Already being rendered
+
+        with self.assertLogs("battle.core.render_pool", "WARNING"):
+            self.assertEqual(self.pool.wait([hanging, other]), [False, True])
+        self.release.set()
+        self.pool.drain()
+        self.assertEqual(self.pool.wait([hanging]), [True])
+        self.read_wav(hanging)
+
+    def test_failed_render_only_affects_its_melody(self):
+        with self.assertLogs("battle.core.render_pool", "ERROR"):
+            paths = [self.pool.submit([note, 65], [240, 240]) for note in (62, 64, 67)]
+            self.assertEqual(self.pool.wait(paths), [False, True, True])
+            self.pool.drain()
+        # The next submit retries it
+        self.assertEqual(self.pool.submit([62, 65], [240, 240]), paths[0])
+        self.assertEqual(self.pool.wait(paths), [True, True, True])
+
+
+class BattleVoteTests(TestCase):
+
+    def setUp(self):
+        self.melodies = generate_random_melodies(4, 8)
+        self.battle = Battle.start(self.melodies, [(0, 1), (2, 3)])
+
+    def test_votes_follow_the_pairs(self):
+        with CaptureQueriesContext(connection) as queries:
+            battle = Battle.objects.defer(*Battle.MELODY_FIELDS).get(pk=self.battle.pk)
+            self.assertIsNone(battle.vote(2))  # Not in the current pair
+            self.assertEqual(battle.vote(1), 0)
+        # The vote path never reads the packed population
+        self.assertFalse(any('"notes"' in query['sql'] for query in queries.captured_queries))
+        self.assertIsNone(Battle.objects.get(pk=self.battle.pk).vote(0))  # Pair already voted on
+        self.assertEqual(battle.vote(3), 1)
+        self.assertEqual(battle.winners(), [1, 3])
+        self.assertIsNone(battle.current_pair())
+
+        battle.load_melodies()
+        self.assertEqual([melody.notes for melody in battle.melodies()], [melody.notes for melody in self.melodies])
@@ -1,19 +1,22 @@
-import shutil
-
 from django.views import View
 from django.views.generic import TemplateView
 
 from battle.core.utils import generate_random_melodies, save_melodies, random_pairs, crossover, mutation
 from django.shortcuts import render, redirect
-from battle.core.convertor import convert_mid_to_mp3
+from battle.core.render_pool import get_render_pool
 import os
 from Evalutionary_music_generation import settings
 from battle.forms import Manual
+from battle.models import Battle
 
 
 class MidiPairView(View):
+    """
+    Manual battle. The population lives in a Battle row, the session only keeps the battle id
+    and the last form data.
+    """
+
     def get(self, request):
-        algorithm_dir = 'manual'
         if 'initial' in request.session:
             initial_form_data = request.session['initial']
             form = Manual(initial=initial_form_data)
@@ -21,15 +24,19 @@ class MidiPairView(View):
             form = Manual()
         context = {'form': form}
 
-        pairs = request.session.get('pairs', [])
-        winners = request.session.get('winners', [])
-        if pairs:
-            current_pair_index = len(winners)
-            pair = pairs[current_pair_index]
+        battle = self.get_battle(request)
+        pair = battle.current_pair() if battle is not None else None
+        if pair:
+            render_pool = get_render_pool()
+            audio = []
+            for index in pair:
+                melody = battle.melody(index)
+                audio.append(render_pool.submit(melody.notes, melody.durations))
+            render_pool.wait(audio)
             context.update(
                 {
-                    'mp3_file_url_0': os.path.join(settings.MEDIA_URL, algorithm_dir, f'melody_{pair[0]}.mp3'),
-                    'mp3_file_url_1': os.path.join(settings.MEDIA_URL, algorithm_dir, f'melody_{pair[1]}.mp3'),
+                    'mp3_file_url_0': os.path.join(settings.MEDIA_URL, audio[0]),
+                    'mp3_file_url_1': os.path.join(settings.MEDIA_URL, audio[1]),
                     'melody_0_index': pair[0],
                     'melody_1_index': pair[1]
                 }
@@ -38,7 +45,6 @@ class MidiPairView(View):
         return render(request, 'battle/battle.html', context)
 
     def post(self, request):
-        algorithm_dir = "manual"
         form = Manual(request.POST)
         if form.is_valid():
             form_data = form.cleaned_data
@@ -47,48 +53,77 @@ class MidiPairView(View):
             n_melody_notes = form_data['n_melody_notes']
 
             melodies = generate_random_melodies(n_melodies, n_melody_notes)
-            save_melodies(melodies, algorithm_dir)
-
             pairs = random_pairs(n_melodies)
-            for index in range(len(melodies)):
-                convert_mid_to_mp3(f'melody_{index}', algorithm_dir)
-            request.session['melodies'] = melodies
-            request.session['pairs'] = pairs
-            request.session['winners'] = []
+            battle = Battle.start(melodies, pairs)
+            save_melodies(melodies, battle.workspace().create().relpath)
+            self.render_generation(melodies, pairs)
+            request.session['battle_id'] = str(battle.id)
 
+        battle = self.get_battle(request, with_melodies=False)
         selected_melody = request.POST.get('selected_melody')
-        if selected_melody:
-            request.session['winners'].append(int(selected_melody))
-            request.session.modified = True
-
-        if len(request.session.get('winners', [])) == request.session['initial']['n_melodies'] / 2:
-            winners = request.session['winners']
-            melodies = request.session['melodies']
-            melodies = {int(key): value for key, value in melodies.items()}
-
-            source_folder = os.path.join(settings.MEDIA_ROOT, algorithm_dir)
-            destination_folder = os.path.join(settings.MEDIA_ROOT, "previous")
-            if os.path.exists(destination_folder):
-                shutil.rmtree(destination_folder)
-            os.makedirs(destination_folder)
-            winners_file_names = [f"melody_{num}.mp3" for num in winners]
-            for file in winners_file_names:
-                shutil.move(os.path.join(source_folder, file), os.path.join(destination_folder, file))
-            if os.path.exists(source_folder):
-                shutil.rmtree(source_folder)
-            os.makedirs(source_folder)
-
-            melodies = crossover(melodies, winners, request.session['initial']['n_melody_notes'])
+        if battle is None or not selected_melody:
+            return redirect('midi-pair')
+        pair_index = battle.vote(int(selected_melody))
+        if pair_index is None:
+            return redirect('midi-pair')
+
+        if pair_index == len(battle.pair_list()) - 1:
+            # Last vote of the generation, only now is the population needed
+            battle.load_melodies()
+            winners = battle.winners()
+            melodies = battle.melodies()
+            render_pool = get_render_pool()
+
+            winner_audio = {}
+            for num in winners:
+                audio_path = render_pool.submit(melodies[num].notes, melodies[num].durations)
+                if not os.path.exists(os.path.join(settings.MEDIA_ROOT, audio_path)):
+                    continue
+                extension = os.path.splitext(audio_path)[1]
+                winner_audio[f"melody_{num}{extension}"] = os.path.join(settings.MEDIA_ROOT, audio_path)
+            workspace = battle.workspace().create()
+            workspace.publish_directory("previous", winner_audio)
+
+            melodies = crossover(melodies, winners, battle.n_melody_notes)
             melodies = mutation(melodies)
-            save_melodies(melodies, algorithm_dir)
-            pairs = random_pairs(request.session['initial']['n_melodies'])
-            for index in range(len(melodies)):
-                convert_mid_to_mp3(f'melody_{index}', algorithm_dir)
-            request.session['pairs'] = pairs
-            request.session['winners'] = []
+            pairs = random_pairs(battle.n_melodies)
+            if battle.next_generation(melodies, pairs):
+                save_melodies(melodies, workspace.relpath)
+                self.render_generation(melodies, pairs)
 
         return redirect('midi-pair')
 
+    @staticmethod
+    def get_battle(request, with_melodies: bool = True):
+        """
+        The battle of this session, None if there is none or it was deleted.
+
+        :param with_melodies: Load the packed population too, otherwise see Battle.load_melodies.
+        """
+        battle_id = request.session.get('battle_id')
+        if battle_id is None:
+            return None
+        battles = Battle.objects.filter(pk=battle_id)
+        if not with_melodies:
+            battles = battles.defer(*Battle.MELODY_FIELDS)
+        return battles.first()
+
+    @staticmethod
+    def render_generation(melodies, pairs):
+        """
+        Queues the renders of a generation in pair order and waits only for the first pair,
+        the rest keeps rendering in the background while the user listens.
+
+        :return: Audio paths relative to MEDIA_ROOT, indexed like the melodies.
+        """
+        order = [index for pair in pairs for index in pair]
+        order += [index for index in range(len(melodies)) if index not in order]
+        render_pool = get_render_pool()
+        audio = {index: render_pool.submit(melodies[index].notes, melodies[index].durations) for index in order}
+        if pairs:
+            render_pool.wait([audio[index] for index in pairs[0]])
+        return [audio[index] for index in range(len(melodies))]
+
 
 class ManualResultView(TemplateView):
     template_name = 'battle/manual_result.html'
@@ -96,9 +131,11 @@ class ManualResultView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         previous_winners = []
-        folder = os.path.join(settings.MEDIA_ROOT, "previous")
-        for file in os.listdir(folder):
-            if file.endswith(".mp3"):
-                previous_winners.append(os.path.join(settings.MEDIA_URL, "previous", file))
+        battle = MidiPairView.get_battle(self.request, with_melodies=False)
+        if battle is not None:
+            workspace = battle.workspace()
+            for file in workspace.listdir("previous"):
+                if file.endswith((".mp3", ".wav")):
+                    previous_winners.append(workspace.url("previous", file))
         context['previous_winners'] = previous_winners
         return context
@@ -1,3 +1,9 @@
 from django.contrib import admin
 
-# Register your models here.
+from simulated_annealing.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'progress', 'created_at')
+    list_filter = ('status',)
@@ -0,0 +1,291 @@
+import inspect
+import io
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Iterator, Optional
+from unittest import mock
+
+import numpy as np
+from django.conf import settings as django_settings
+from django.test import Client, override_settings
+
+from Evalutionary_music_generation import settings
+from battle.core.archive import PopulationArchive
+from battle.core.midi import build_midi, encode_midi
+from battle.core.render_pool import get_render_pool
+from simulated_annealing.core.generator import MelodyGenerator, SimulatedAnnealingGA
+from simulated_annealing.core.heuristics import Heuristic, MelodyFeatures
+from simulated_annealing.core.pareto import Objectives, nsga2_select, non_dominated_sort
+from simulated_annealing.core.persistence import MelodyPersistence
+from simulated_annealing.core.population import Population
+from simulated_annealing.core.selection import SelectionOperators
+
+# Up to the limits of the battle and simulated annealing forms
+GRID = {"n_melodies": (2, 6, 20), "n_melody_notes": (5, 8, 32, 100)}
+QUICK_GRID = {"n_melodies": (6, 20), "n_melody_notes": (8, 100)}
+# Selection is also timed on populations this many times larger than the grid point
+LARGE_POPULATION_FACTOR = 100
+
+
+def measure(func: Callable, repeat: int = 5, min_time: float = 0.02) -> dict:
+    """
+    Times a callable: calls are batched until one batch takes at least min_time seconds,
+    then `repeat` batches are timed.
+
+    :return: Seconds per call, best and median over the batches, and the batch size.
+    """
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1 << 16:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    return {"best": min(timings), "median": statistics.median(timings), "number": number, "repeat": repeat}
+
+
+@contextmanager
+def isolated_media() -> Iterator[str]:
+    """ Points MEDIA_ROOT at a temporary directory, so benchmarks never touch the real media files. """
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as directory:
+        original = settings.MEDIA_ROOT
+        settings.MEDIA_ROOT = directory
+        try:
+            with override_settings(MEDIA_ROOT=directory):
+                yield directory
+        finally:
+            settings.MEDIA_ROOT = original
+
+
+class BenchmarkSuite:
+    """
+    Offline benchmarks of the generators, heuristics, I/O and views.
+
+    Every method starting with 'bench_' is registered automatically. It receives one point of the grid
+    and yields (name, callable) cases; the callable is what gets timed, setup happens before yielding.
+    """
+
+    def __init__(self, generations: int = 100, seed: int = 0):
+        """
+        :param generations: Number of generations of the timed SimulatedAnnealingGA runs.
+        :param seed: Seed of the benchmarked generators, so every run times the same work.
+        """
+        self.generations = generations
+        self.seed = seed
+        self.heuristic = Heuristic(cache_size=0)
+        self.BENCHMARKS = {
+            name[6:]: method  # Remove 'bench_' prefix
+            for name, method in inspect.getmembers(self, predicate=inspect.ismethod)
+            if name.startswith("bench_")
+        }
+
+    def population(self, n_melodies: int, n_melody_notes: int) -> Population:
+        return Population.random(n_melodies, n_melody_notes, np.random.default_rng(self.seed))
+
+    def bench_heuristic(self, n_melodies, n_melody_notes):
+        """ Heuristic.evaluate per metric over every melody, and the batch evaluation of each metric. """
+        population = self.population(n_melodies, n_melody_notes)
+        melodies = population.notes.tolist()
+        for metric in sorted(self.heuristic.AVAILABLE_METRICS):
+            metrics = [metric]
+            if not self.heuristic.config.get_weight(metric):
+                # Disabled metrics cannot be evaluated on their own, time their batch function instead
+                batch = self.heuristic.BATCH_METRICS[metric]
+                yield f"heuristic.{metric}_scores", lambda f=batch: f(MelodyFeatures(population.notes))
+                continue
+            yield f"heuristic.evaluate[{metric}]", lambda m=metrics: [self.heuristic.evaluate(x, m) for x in melodies]
+            yield f"heuristic.evaluate_batch[{metric}]", lambda m=metrics: self.heuristic.evaluate_batch(population.notes, m)
+        yield "heuristic.evaluate_batch", lambda: self.heuristic.evaluate_batch(population.notes)
+
+    def bench_selection(self, n_melodies, n_melody_notes):
+        """
+        Every selection operator picking half of the melodies from precomputed scores, against the
+        full sort truncation used to do, also on a large population.
+        """
+        for factor in (1, LARGE_POPULATION_FACTOR):
+            suffix = "" if factor == 1 else f"[x{factor}]"
+            scores = self.heuristic.evaluate_batch(self.population(n_melodies * factor, n_melody_notes).notes)
+            k = len(scores) // 2
+            yield f"selection.argsort{suffix}", lambda s=scores, k=k: np.argsort(-s, kind="stable")[:k]
+            operators = SelectionOperators(np.random.default_rng(self.seed), tournament_size=3)
+            for name in sorted(operators.OPERATORS):
+                yield f"selection.{name}{suffix}", lambda s=scores, k=k, n=name: operators.select(n, s, k)
+
+    def bench_pareto(self, n_melodies, n_melody_notes):
+        """ Objective scores, non-dominated sorting and NSGA-II selection, also on a large population. """
+        objectives = Objectives(self.heuristic)
+        for factor in (1, LARGE_POPULATION_FACTOR):
+            suffix = "" if factor == 1 else f"[x{factor}]"
+            population = self.population(n_melodies * factor, n_melody_notes)
+            scores = objectives.scores(population.notes)
+            yield f"pareto.objectives{suffix}", lambda p=population: objectives.scores(p.notes)
+            yield f"pareto.non_dominated_sort{suffix}", lambda s=scores: non_dominated_sort(s)
+            yield f"pareto.nsga2_select{suffix}", lambda s=scores: nsga2_select(s, len(s) // 2)
+
+    def bench_generator(self, n_melodies, n_melody_notes):
+        """ Mutation, crossover and complete simulated annealing runs. """
+        generator = MelodyGenerator(
+            n_melodies, n_melody_notes, heuristic=self.heuristic, persistence=MelodyPersistence(None), seed=self.seed
+        )
+        yield "generator.mutation", lambda: generator.mutation(generator.population)
+
+        winners = list(range(max(n_melodies // 2, 1)))
+        yield "generator.crossover", lambda: generator.crossover(winners)
+
+        def run():
+            SimulatedAnnealingGA(
+                n_melodies,
+                n_melody_notes,
+                heuristic=self.heuristic,
+                persistence=MelodyPersistence(None),
+                seed=self.seed,
+            ).run(self.generations)
+
+        yield f"simulated_annealing.run[{self.generations}]", run
+
+    def bench_midi(self, n_melodies, n_melody_notes):
+        """ Encoding every melody as a MIDI file through mido and with the byte-level encoder. """
+        population = self.population(n_melodies, n_melody_notes)
+        tracks = list(zip(population.notes, population.durations))
+
+        def save_with_mido():
+            for notes, durations in tracks:
+                build_midi(notes, durations).save(file=io.BytesIO())
+
+        yield "midi.mido", save_with_mido
+        yield "midi.encode", lambda: [encode_midi([track]) for track in tracks]
+        yield "midi.encode[multitrack]", lambda: encode_midi(tracks)
+
+    def bench_io(self, n_melodies, n_melody_notes):
+        """ Writing the population archive, rewriting an unchanged population and loading it back. """
+        population = self.population(n_melodies, n_melody_notes)
+        with tempfile.TemporaryDirectory(prefix="benchmark-") as directory:
+            yield "persistence.save", lambda: MelodyPersistence(directory).save(population)
+
+            persistence = MelodyPersistence(directory)
+            persistence.save(population)
+            yield "persistence.save[unchanged]", lambda: persistence.save(population)
+
+            generator = MelodyGenerator(
+                n_melodies, n_melody_notes, heuristic=self.heuristic, persistence=persistence, seed=self.seed
+            )
+            yield "generator.load_melodies", lambda: generator.load_melodies(persistence.path)
+
+            path = os.path.join(directory, "melodies.json")
+            PopulationArchive.load(persistence.path).export_json(path)
+            yield "generator.load_melodies[json]", lambda: generator.load_melodies(path)
+
+    def bench_views(self, n_melodies, n_melody_notes):
+        """
+        Both pages through the Django test client. Simulated annealing jobs are created but not
+        submitted, the timing covers the request only.
+        """
+        form = {"n_melodies": n_melodies, "n_melody_notes": n_melody_notes}
+        with isolated_media():
+            client = Client()
+            # Redirects once the first pair is rendered, the rest is drained before the media goes away
+            yield "battle.post", lambda: client.post("/battle/", form)
+            yield "battle.get", lambda: client.get("/battle/")
+            get_render_pool().drain()
+
+            with mock.patch("simulated_annealing.views.submit_job"):
+                yield "simulated_annealing.post", lambda: client.post(
+                    "/simulated_annealing/", {**form, "n_iterations": 1000}
+                )
+            yield "simulated_annealing.get", lambda: client.get("/simulated_annealing/")
+
+    def run(
+            self,
+            grid: dict,
+            repeat: int = 5,
+            min_time: float = 0.02,
+            select: Optional[str] = None,
+            report: Optional[Callable] = None
+    ) -> list[dict]:
+        """
+        Runs the registered benchmarks over every point of the grid.
+
+        :param grid: Mapping with the 'n_melodies' and 'n_melody_notes' values to combine.
+        :param repeat: Number of timed batches per case, see measure.
+        :param min_time: Minimal duration of a batch in seconds.
+        :param select: Only run cases whose name contains this substring.
+        :param report: Optional callable invoked with every result as it is produced.
+        :return: List of results with the case name, grid point and timings.
+        """
+        results = []
+        for n_melodies in grid["n_melodies"]:
+            for n_melody_notes in grid["n_melody_notes"]:
+                for suite in self.BENCHMARKS.values():
+                    for name, func in suite(n_melodies, n_melody_notes):
+                        if select and select not in name:
+                            continue
+                        result = {
+                            "benchmark": name,
+                            "n_melodies": n_melodies,
+                            "n_melody_notes": n_melody_notes,
+                            **measure(func, repeat, min_time),
+                        }
+                        results.append(result)
+                        if report is not None:
+                            report(result)
+        return results
+
+
+def environment() -> dict:
+    """ Describes where the benchmarks ran, stored next to the results. """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=django_settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def result_key(result: dict) -> tuple:
+    return result["benchmark"], result["n_melodies"], result["n_melody_notes"]
+
+
+def compare(base: list[dict], head: list[dict]) -> list[dict]:
+    """
+    Matches two result lists by case and grid point.
+
+    :return: For every case present in both, the base and head best timings and their ratio (head / base).
+    """
+    base_timings = {result_key(result): result["best"] for result in base}
+    comparison = []
+    for result in head:
+        key = result_key(result)
+        if key not in base_timings:
+            continue
+        comparison.append({
+            "benchmark": key[0],
+            "n_melodies": key[1],
+            "n_melody_notes": key[2],
+            "base": base_timings[key],
+            "head": result["best"],
+            "ratio": result["best"] / base_timings[key] if base_timings[key] else float("inf"),
+        })
+    return comparison
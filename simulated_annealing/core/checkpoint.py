@@ -0,0 +1,54 @@
+import os
+import time
+from typing import Optional
+
+from battle.core.archive import PopulationArchive
+
+
+class Checkpointer:
+    """
+    Periodic checkpoints of a SimulatedAnnealingGA run, resumable with SimulatedAnnealingGA.resume.
+
+    A checkpoint is a population archive (see battle.core.archive) whose metadata holds the rest of the
+    optimizer state, written atomically over the previous one. Like MelodyPersistence it saves every N
+    generations and/or every few seconds; between saves a generation only pays a clock read.
+    """
+
+    def __init__(self, path: str, every: Optional[int] = None, interval: Optional[float] = None):
+        """
+        :param path: Checkpoint file, replaced by every save.
+        :param every: Save every N generations. None disables the generation policy.
+        :param interval: Save when this many seconds passed since the last save. None disables the time policy.
+        """
+        self.path = path
+        self.every = every
+        self.interval = interval
+        self.saves = 0
+        self._last_save = time.monotonic()
+
+    def should_save(self, generation: int) -> bool:
+        """ Checks the configured policies for the given (1-based) generation number. """
+        if self.every and generation % self.every == 0:
+            return True
+        if self.interval is not None and time.monotonic() - self._last_save >= self.interval:
+            return True
+        return False
+
+    def step(self, generator, generation: int) -> None:
+        """ Called after each generation, saves a checkpoint if a policy asks for it. """
+        if self.should_save(generation):
+            self.save(generator)
+
+    def save(self, generator) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        generator.checkpoint().save(self.path)
+        self.saves += 1
+        self._last_save = time.monotonic()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> PopulationArchive:
+        return PopulationArchive.load(self.path)
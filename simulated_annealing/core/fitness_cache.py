@@ -0,0 +1,60 @@
+from collections import OrderedDict
+from hashlib import blake2b
+
+import numpy as np
+
+
+class FitnessCache:
+    """ Bounded LRU cache of melody scores keyed by a compact hash of the note sequence. """
+
+    def __init__(self, maxsize: int = 4096):
+        """
+        :param maxsize: Maximum number of cached scores. 0 disables caching.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._scores = OrderedDict()
+
+    @staticmethod
+    def melody_keys(notes_matrix, prefix: tuple = ()) -> list:
+        """
+        Builds cache keys for every row of a note matrix.
+
+        :param notes_matrix: Matrix of note values, one melody per row.
+        :param prefix: Values identifying the evaluation (e.g. config version and metrics) added to every key.
+        :return: A list of hashable keys, one per melody.
+        """
+        rows = np.ascontiguousarray(notes_matrix, dtype=np.int16)
+        return [(*prefix, blake2b(row.tobytes(), digest_size=8).digest()) for row in rows]
+
+    def get(self, key):
+        """ Returns the cached score for the key or None, updating the LRU order and counters. """
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._scores.move_to_end(key)
+        return score
+
+    def put(self, key, score: float) -> None:
+        """ Stores a score, evicting the least recently used entries above maxsize. """
+        if self.maxsize <= 0:
+            return
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        while len(self._scores) > self.maxsize:
+            self._scores.popitem(last=False)
+
+    def clear(self) -> None:
+        """ Drops every cached score and resets the counters. """
+        self._scores.clear()
+        self.hits = self.misses = 0
+
+    def info(self) -> dict:
+        """ Cache statistics: hits, misses, current size and maxsize. """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._scores), "maxsize": self.maxsize}
+
+    def __len__(self) -> int:
+        return len(self._scores)
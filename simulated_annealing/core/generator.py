@@ -1,15 +1,24 @@
 from __future__ import annotations
 
-import copy
 import os
-import random
 import json
-from typing import Optional, Union
+from time import perf_counter
+from typing import Callable, Iterator, Optional, Union
 
 import numpy as np
-from mido import MidiFile, MidiTrack, Message
 
+from battle.core.archive import ARCHIVE_NAME, PopulationArchive
+from battle.core.melody import Melody
+from battle.core.mutation import make_rng, mutate
+from simulated_annealing.core.checkpoint import Checkpointer
 from simulated_annealing.core.heuristics import Heuristic
+from simulated_annealing.core.incremental import IncrementalEvaluator
+from simulated_annealing.core.pareto import Objectives, nsga2_select, pareto_front
+from simulated_annealing.core.persistence import MelodyPersistence
+from simulated_annealing.core.population import Population
+from simulated_annealing.core.selection import SelectionOperators
+from simulated_annealing.core.stats import RunCounters, RunSnapshot
+from simulated_annealing.core.stopping import EarlyStopping
 from simulated_annealing.core.utils import pair_round, random_pairs
 
 import os
@@ -21,7 +30,16 @@ class BaseMelodyGenerator:
     Base class for generating and evolving melodies using heuristic evaluation
     """
 
-    def __init__(self, n_melodies=6, n_melody_notes=8, n_crossover_split=4, heuristic: Optional[Union[str, Heuristic]] = None):
+    def __init__(
+            self,
+            n_melodies=6,
+            n_melody_notes=8,
+            n_crossover_split=4,
+            heuristic: Optional[Union[str, Heuristic]] = None,
+            persistence: Optional[MelodyPersistence] = None,
+            seed=None,
+            stopping: Optional[EarlyStopping] = None
+    ):
         """
         Initializes the melody generator with a given number of melodies and notes.
 
@@ -29,6 +47,12 @@ class BaseMelodyGenerator:
         :param n_melody_notes: Number of notes per melody. Default is 8.
         :param heuristic: A heuristic function for evaluating melodies. Can be a string, 
                           a Heuristic object, or None for manual selection.
+        :param persistence: When and where melodies are written. Defaults to saving only the final
+                            population into MEDIA_ROOT/<algorithm dir>.
+        :param seed: Seed of the generator's random stream (int, SeedSequence or numpy Generator).
+                     The same seed reproduces the same run, None draws a fresh one.
+        :param stopping: Optional early stopping criteria, checked after every generation. The reason
+                         the last run ended is kept in stop_reason.
         """
         self.n_melodies = n_melodies
         self.n_melody_notes = n_melody_notes
@@ -42,102 +66,150 @@ class BaseMelodyGenerator:
         else:
             print("Manual melody selection")
 
-        self.melodies = self.generate_random_melodies()
+        if persistence is None:
+            algorithm_dir = 'simulated_annealing' if self.heuristic else 'manual'
+            persistence = MelodyPersistence(os.path.join(settings.MEDIA_ROOT, algorithm_dir))
+        self.persistence = persistence
+        self.rng = make_rng(seed)
+        self.counters = RunCounters()
+        self.stopping = stopping
+        self.stop_reason = None
+
+        self.population = self.generate_random_melodies()
 
-    def generate_random_melodies(self) -> dict:
+    @property
+    def melodies(self) -> dict:
         """
-        Generates a set of random melodies with notes and durations.
+        Dictionary view of the population, built on demand for export.
 
         :return: A dictionary where keys are melody indices and values contain 'notes' and 'durations'.
         """
-        melodies = {}
-        for i in range(self.n_melodies):
-            notes = [random.randint(48, 83) for _ in range(self.n_melody_notes)]
-            durations = random.choices([220, 260, 300, 360], k=self.n_melody_notes)
-            melodies[i] = {"notes": notes, "durations": durations}
-        return melodies
-    
-    def save_melodies(self) -> None:
-        """Saves the generated melodies to MIDI files and a JSON file."""
-        algorithm_dir = 'simulated_annealing' if self.heuristic else 'manual'
-        for i, melody in self.melodies.items():
-            mid = MidiFile()
-            track = MidiTrack()
-            mid.tracks.append(track)
+        return self.population.to_dict()
 
-            notes, durations = melody["notes"], melody["durations"]
-            for note, duration in zip(notes, durations):
-                track.append(Message("note_on", note=note, velocity=64, time=0))
-                track.append(Message("note_off", note=note, velocity=64, time=duration))
-                mid.save(os.path.join(settings.MEDIA_ROOT, algorithm_dir, f"melody_{i}.mid"))
+    @melodies.setter
+    def melodies(self, melodies: dict) -> None:
+        self.population = Population.from_dict(melodies)
 
-        save_path = os.path.join(settings.MEDIA_ROOT, algorithm_dir, "melodies.json")
-        with open(save_path, "w", encoding="utf-8") as f:
-            json.dump(self.melodies, f, indent=4)
-
-    def load_melodies(self, load_path: str = "melodies.json") -> dict:
+    def generate_random_melodies(self) -> Population:
         """
-        Loads melodies from a JSON file.
+        Generates a set of random melodies with notes and durations.
 
-        :param load_path: The file path of the JSON file containing stored melodies.
-        :return: A dictionary with loaded melodies where keys are integers and values contain 'notes' and 'durations'.
+        :return: A population of n_melodies random melodies with n_melody_notes notes each.
         """
-        with open(load_path, encoding="utf-8") as f:
-            melodies = json.load(f)
-
-        keys = list(melodies.keys())
-        for key in keys:
-            melodies[int(key)] = melodies[key]
+        return Population.random(self.n_melodies, self.n_melody_notes, self.rng)
+    
+    def save_melodies(self) -> None:
+        """Saves the population archive if the population changed."""
+        self.persistence.save(self.population)
 
-        for key in keys:
-            del melodies[key]
+    def load_melodies(self, load_path: str = ARCHIVE_NAME) -> Population:
+        """
+        Loads melodies saved by a previous run.
 
-        return melodies
+        :param load_path: A population archive, or a melodies.json file written by older versions.
+        :return: The loaded population.
+        """
+        if load_path.endswith(".json"):
+            with open(load_path, encoding="utf-8") as f:
+                return Population.from_dict(json.load(f))
+        archive = PopulationArchive.load(load_path)
+        return Population(archive.notes, archive.durations)
 
-    def mutation(self, melodies: dict, chance: float = 0.05) -> dict:
+    def mutation(self, melodies: Population, chance: float = 0.05) -> Population:
         """
         Introduces random mutations to the melodies by modifying notes and durations.
+        The whole population is mutated at once from the generator's random stream: every note and
+        every duration changes independently with the given probability.
 
-        :param melodies: The dictionary of melodies to mutate.
+        :param melodies: The population to mutate in place.
         :param chance: The probability of a mutation occurring for each note or duration.
-        :return: The mutated melodies.
-        """
-        for melody in melodies.values():
-            for j in range(len(melody['notes'])):
-                if random.random() < chance:
-                    p_dist = [0.45, 0.2, 0.1, 0.05, 0.05, 0.05, 0.03, 0.02, 0.02, 0.01, 0.01, 0.01]
-                    sign = random.choice([-1, 1])
-                    change_note_number = np.random.choice(list(range(1, 12 + 1)), p=p_dist)
-                    melody['notes'][j] = int(melody['notes'][j] + sign*change_note_number)
-                    melody['notes'][j] = min(max(melody['notes'][j], 48), 83)
-                if random.random() < chance:
-                    scalar = random.choice([2, 0.5])
-                    melody['durations'][j] = int(melody['durations'][j]*scalar)
-                    melody['durations'][j] = min(max(melody['durations'][j], 240), 1920)
+        :return: The mutated population.
+        """
+        mutate(
+            melodies.notes,
+            melodies.durations,
+            self.rng,
+            chance,
+            note_range=(Population.NOTE_MIN, Population.NOTE_MAX),
+            duration_range=(Population.DURATION_MIN, Population.DURATION_MAX),
+        )
         return melodies
 
-    def run(self, generations: int = 1000) -> BaseMelodyGenerator:
+    def run(self, generations: int = 1000, callback: Optional[Callable] = None) -> BaseMelodyGenerator:
         """
-        Runs the evolutionary algorithm for a given number of generations.
+        Runs the evolutionary algorithm for a given number of generations, consuming run_iter().
 
         :param generations: Number of iterations to evolve melodies.
+        :param callback: Optional callable invoked as callback(generator, generation) after each generation.
+                         Raising from it stops the run. generator.counters holds the run's counters and
+                         timings, see RunStats for a callback turning them into statistics.
         :return: The evolved melody generator instance.
+        """
+        for snapshot in self.run_iter(generations):
+            if callback is not None:
+                callback(self, snapshot.generation)
+        return self
+
+    def run_iter(self, generations: int = 1000, every: int = 1) -> Iterator[RunSnapshot]:
+        """
+        Runs the evolutionary algorithm lazily, yielding a snapshot every `every` generations and after
+        the last one. The final population is saved once the iterator is exhausted, a consumer that
+        stops iterating early leaves it unsaved.
+
+        :param generations: Number of iterations to evolve melodies.
+        :param every: Yield one snapshot every `every` generations.
+        :return: Iterator of RunSnapshot.
         :raises NotImplementedError: This method must be implemented in a subclass.
         """
         raise NotImplementedError("Must be implemented in subclasses")
 
-    def evaluate(self, melody_idx: int, generation: Optional[dict] = None) -> float:
+    def snapshot(self) -> RunSnapshot:
+        """ Lightweight state of the running generation: best melody as last evaluated and temperature. """
+        counters = self.counters
+        scores = counters.scores
+        best_melody = None if scores is None else int(np.argmax(scores))
+        melody = counters.best
+        if melody is None and best_melody is not None:
+            melody = self.population.melody(best_melody)
+        return RunSnapshot(
+            generation=counters.generation,
+            best_melody=best_melody,
+            score=None if best_melody is None else float(scores[best_melody]),
+            temperature=getattr(self, "temperature", None),
+            notes=None if melody is None else melody.notes.tolist(),
+            durations=None if melody is None else melody.durations.tolist(),
+        )
+
+    def evaluate(self, melody_idx: int, generation: Optional[Population] = None) -> float:
         """
         Evaluates a melody using the heuristic function.
 
         :param melody_idx: The index of the melody to evaluate.
-        :param generation: An optional alternative set of melodies for evaluation.
+        :param generation: An optional alternative population for evaluation, the current one by default.
         :return: The heuristic evaluation score of the melody.
         """
         if generation is None:
-            return self.heuristic.evaluate(self.melodies[melody_idx]["notes"])
-        else:
-            return self.heuristic.evaluate(generation[melody_idx]["notes"])
+            generation = self.population
+        return self.heuristic.evaluate(generation.notes[melody_idx].tolist())
+
+    def evaluate_population(self, generation: Optional[Population] = None) -> np.ndarray:
+        """
+        Evaluates every melody of a population in one batch.
+
+        :param generation: An optional alternative population for evaluation.
+        :return: Vector of heuristic scores indexed by melody.
+        """
+        if generation is None:
+            generation = self.population
+        return self.heuristic.evaluate_batch(generation.notes)
+
+    def cache_info(self) -> dict:
+        """
+        Statistics of the heuristic fitness cache, showing how many evaluations were saved.
+
+        :return: A dictionary with 'hits', 'misses', 'size' and 'maxsize'.
+        """
+        return self.heuristic.cache.info()
 
     @property
     def best_melody(self):
@@ -146,7 +218,7 @@ class BaseMelodyGenerator:
 
         :return: The index of the best melody.
         """
-        return max(self.melodies.keys(), key=self.evaluate)
+        return int(np.argmax(self.evaluate_population()))
 
 class MelodyGenerator(BaseMelodyGenerator):
     """
@@ -156,14 +228,83 @@ class MelodyGenerator(BaseMelodyGenerator):
     and mutation to evolve melodies over multiple generations.
     """
 
-    def heuristic_selection(self) -> list[int]:
+    def __init__(
+            self,
+            n_melodies=6,
+            n_melody_notes=8,
+            n_crossover_split=4,
+            heuristic: Optional[Union[str, Heuristic]] = None,
+            persistence: Optional[MelodyPersistence] = None,
+            seed=None,
+            stopping: Optional[EarlyStopping] = None,
+            selection: Optional[Union[str, dict]] = None,
+            objectives: Optional[Union[list[str], dict[str, list[str]]]] = None
+    ):
+        """
+        Initializes the generator, see BaseMelodyGenerator for the common parameters.
+
+        :param selection: Name of a SelectionOperators operator picking half of the melodies from their
+                          weighted heuristic scores, or 'pareto' for NSGA-II ranking over separate objectives
+                          (see pareto_selection). A dict gives the name as 'operator' along with the operator
+                          parameters. settings.MELODY_GENERATOR_SELECTION by default.
+        :param objectives: Metrics or {name: [metrics]} groups used as objectives by the Pareto
+                           selection, every enabled metric by default. See pareto.Objectives.
         """
-        Selects the top 50% of melodies based on heuristic evaluation.
+        super().__init__(
+            n_melodies=n_melodies,
+            n_melody_notes=n_melody_notes,
+            n_crossover_split=n_crossover_split,
+            heuristic=heuristic,
+            persistence=persistence,
+            seed=seed,
+            stopping=stopping,
+        )
+        if selection is None:
+            selection = settings.MELODY_GENERATOR_SELECTION
+        if isinstance(selection, str):
+            selection = {'operator': selection}
+        params = dict(selection)
+        self.selection = params.pop('operator')
+        self.selection_operators = SelectionOperators(self.rng, **params)
+        if self.selection != "pareto" and self.selection not in self.selection_operators.OPERATORS:
+            names = sorted([*self.selection_operators.OPERATORS, "pareto"])
+            raise ValueError(f"Unknown selection {self.selection!r}, expected one of {names}")
+        if self.selection == "pareto" and self.heuristic is None:
+            raise ValueError("Pareto selection needs a heuristic")
+        self.objectives = Objectives(self.heuristic, objectives) if self.heuristic is not None else None
+
+    def heuristic_selection(self, scores: Optional[np.ndarray] = None) -> list[int]:
+        """
+        Selects half of the melodies from their heuristic scores with the configured selection operator.
+
+        :param scores: Scores of the current population if already evaluated.
+        :return: A list of indices representing the selected melodies.
+        """
+        if self.selection == "pareto":
+            return self.pareto_selection()
+        if scores is None:
+            scores = self.evaluate_population()
+        return self.selection_operators.select(self.selection, scores, len(scores) // 2).tolist()
 
+    def pareto_selection(self, objective_scores: Optional[np.ndarray] = None) -> list[int]:
+        """
+        Selects half of the melodies by NSGA-II ranking: whole Pareto fronts first, then the least
+        crowded melodies of the first front that does not fit.
+
+        :param objective_scores: Objective scores of the current population if already evaluated.
         :return: A list of indices representing the selected melodies.
         """
-        sorted_melodies = sorted(self.melodies.keys(), key=self.evaluate, reverse=True)
-        return sorted_melodies[:len(sorted_melodies) // 2]
+        if objective_scores is None:
+            objective_scores = self.objectives.scores(self.population.notes)
+        return nsga2_select(objective_scores, len(objective_scores) // 2).tolist()
+
+    def pareto_front(self) -> list[int]:
+        """
+        Finds the melodies of the current population that no other melody beats on every objective.
+
+        :return: Indices of the non-dominated melodies.
+        """
+        return pareto_front(self.objectives.scores(self.population.notes)).tolist()
 
     def manual_selection(self) -> list[int]:
         """
@@ -180,46 +321,71 @@ class MelodyGenerator(BaseMelodyGenerator):
     def crossover(self, winners) -> list[int]:
         """
         Generates a new generation of melodies by combining random parts of selected winners.
-        Melodies are split into self.n_crossover_split equal parts.
+        Melodies are split into self.n_crossover_split equal parts, the last part also takes
+        the remainder so that melodies keep their length.
 
         :param winners: A list of melody indices selected for reproduction.
         """
-        new_generation = {}
-        segment_length = self.n_melody_notes // self.n_crossover_split
-
-        for i in range(self.n_melodies):
-            new_notes = []
-            new_durations = []
-
-            for segment in range(self.n_crossover_split):
-                parent_idx = random.choice(winners)
-
-                start = segment * segment_length
-                end = start + segment_length
+        segment_length = max(self.n_melody_notes // self.n_crossover_split, 1)
+        columns = np.arange(self.n_melody_notes)
+        column_segments = np.minimum(columns // segment_length, self.n_crossover_split - 1)
 
-                new_notes.extend(self.melodies[parent_idx]['notes'][start:end])
-                new_durations.extend(self.melodies[parent_idx]['durations'][start:end])
+        parents = np.asarray(winners)[self.rng.integers(len(winners), size=(self.n_melodies, self.n_crossover_split))]
+        rows = parents[:, column_segments]
 
-            new_generation[i] = {
-                "notes": new_notes,
-                "durations": new_durations,
-            }
+        self.population = Population(
+            self.population.notes[rows, columns],
+            self.population.durations[rows, columns],
+        )
 
-        self.melodies = new_generation
-
-    def run(self, generations: int = 1000) -> MelodyGenerator:
+    def run_iter(self, generations: int = 1000, every: int = 1) -> Iterator[RunSnapshot]:
         """
-        Runs the evolutionary process for a given number of generations.
+        Runs the evolutionary process lazily, see BaseMelodyGenerator.run_iter.
 
         :param generations: The number of generations to evolve melodies.
-        :return: The evolved melody generator instance.
+        :param every: Yield one snapshot every `every` generations.
+        :return: Iterator of RunSnapshot.
         """
-        for _ in range(generations):
-            winners = self.heuristic_selection() if self.heuristic is not None else self.manual_selection()
+        counters = self.counters = RunCounters()
+        timings = counters.timings
+        self.stop_reason = None
+        if self.stopping is not None:
+            self.stopping.start()
+        for generation in range(1, generations + 1):
+            if self.heuristic is not None:
+                started = perf_counter()
+                counters.scores = self.evaluate_population()
+                counters.best = self.population.melody(int(np.argmax(counters.scores)))  # Crossover replaces the population
+                counters.evaluations += len(counters.scores)
+                objective_scores = self.objectives.scores(self.population.notes) if self.selection == "pareto" else None
+                timings["evaluate"] += perf_counter() - started
+                if objective_scores is not None:
+                    winners = self.pareto_selection(objective_scores)
+                else:
+                    winners = self.heuristic_selection(counters.scores)
+            else:
+                winners = self.manual_selection()
+
+            started = perf_counter()
             self.crossover(winners)
-            self.melodies = self.mutation(self.melodies)
-            self.save_melodies()
-        return self
+            crossed = perf_counter()
+            self.population = self.mutation(self.population)
+            mutated = perf_counter()
+            self.persistence.step(self.population, generation)
+            timings["crossover"] += crossed - started
+            timings["mutation"] += mutated - crossed
+            timings["io"] += perf_counter() - mutated
+
+            counters.generation = generation
+            if self.stopping is not None:
+                self.stop_reason = self.stopping.check(self, generation)
+            if self.stop_reason is not None or generation % every == 0 or generation == generations:
+                yield self.snapshot()
+            if self.stop_reason is not None:
+                break
+        else:
+            self.stop_reason = EarlyStopping.COMPLETED
+        self.persistence.finish(self.population, generation=counters.generation)
 
 
 class SimulatedAnnealingGA(BaseMelodyGenerator):
@@ -230,13 +396,22 @@ class SimulatedAnnealingGA(BaseMelodyGenerator):
     acceptance probability when evolving melodies over multiple generations.
     """
 
+    # Shortest melodies rescored incrementally by default. Below, a full evaluation served partly
+    # from the fitness cache (which the incremental path bypasses) is as fast or faster
+    INCREMENTAL_MIN_NOTES = 200
+
     def __init__(
             self,
             n_melodies=6,
             n_melody_notes=8,
             heuristic: Optional[Union[str, Heuristic]] = None,
             initial_temp=1000,
-            cooling_rate=0.97
+            cooling_rate=0.97,
+            incremental: Optional[bool] = None,
+            persistence: Optional[MelodyPersistence] = None,
+            seed=None,
+            stopping: Optional[EarlyStopping] = None,
+            checkpoint: Optional[Checkpointer] = None
     ):
         """
         Initializes the simulated annealing genetic algorithm for melody generation.
@@ -246,10 +421,99 @@ class SimulatedAnnealingGA(BaseMelodyGenerator):
         :param heuristic: The heuristic function for evaluation.
         :param initial_temp: Initial temperature for simulated annealing.
         :param cooling_rate: Cooling rate for temperature decay.
+        :param incremental: Rescore mutated generations from running heuristic counts (IncrementalEvaluator)
+                            instead of a full evaluation. Pays off for long melodies only: by default
+                            it is used from INCREMENTAL_MIN_NOTES notes on.
+        :param persistence: When and where melodies are written, see BaseMelodyGenerator.
+        :param seed: Seed of the random stream, see BaseMelodyGenerator.
+        :param stopping: Early stopping criteria, see BaseMelodyGenerator.
+        :param checkpoint: Optional policy saving the optimizer state during runs, see resume.
         """
-        super().__init__(n_melodies=n_melodies, n_melody_notes=n_melody_notes, heuristic=heuristic)
+        super().__init__(
+            n_melodies=n_melodies,
+            n_melody_notes=n_melody_notes,
+            heuristic=heuristic,
+            persistence=persistence,
+            seed=seed,
+            stopping=stopping,
+        )
         self.temperature = initial_temp
         self.cooling_rate = cooling_rate
+        self.incremental = n_melody_notes >= self.INCREMENTAL_MIN_NOTES if incremental is None else incremental
+        self.checkpointer = checkpoint
+        self.best_so_far: Optional[tuple[float, Melody]] = None  # Best (score, melody) seen, it may have left the population
+        self._resume = None
+
+    @classmethod
+    def resume(
+            cls,
+            checkpoint_path: str,
+            heuristic: Optional[Union[str, Heuristic]] = None,
+            persistence: Optional[MelodyPersistence] = None,
+            stopping: Optional[EarlyStopping] = None,
+            checkpoint: Optional[Checkpointer] = None
+    ) -> SimulatedAnnealingGA:
+        """
+        Rebuilds a generator from a checkpoint. Its next run continues after the checkpointed generation
+        and, given the same heuristic, produces bit for bit what the interrupted run would have.
+
+        :param checkpoint_path: File written by a Checkpointer.
+        :param heuristic: Heuristic of the interrupted run, by default rebuilt from the checkpointed config path.
+        :param persistence: When and where melodies are written, see BaseMelodyGenerator.
+        :param stopping: Early stopping criteria, their progress is restored from the checkpoint.
+        :param checkpoint: Policy for further checkpoints.
+        :return: The restored generator, call run() with the total number of generations.
+        """
+        archive = PopulationArchive.load(checkpoint_path)
+        state = archive.metadata
+        if heuristic is None and state["heuristic_config"] is not None:
+            heuristic = Heuristic(state["heuristic_config"])
+        n_melodies, n_melody_notes = archive.shape
+        generator = cls(
+            n_melodies,
+            n_melody_notes,
+            heuristic=heuristic,
+            initial_temp=state["temperature"],
+            cooling_rate=state["cooling_rate"],
+            incremental=state["incremental"],
+            persistence=persistence,
+            stopping=stopping,
+            checkpoint=checkpoint,
+        )
+        generator.population = Population(archive.notes, archive.durations)
+        generator.rng.bit_generator.state = state["rng"]
+        if state["best_so_far"] is not None:
+            best = state["best_so_far"]
+            generator.best_so_far = (best["score"], Melody(best["notes"], best["durations"]))
+        generator._resume = state
+        return generator
+
+    def checkpoint(self) -> PopulationArchive:
+        """ State of the run after its last finished generation, see resume. """
+        counters = self.counters
+        best = self.best_so_far
+        return PopulationArchive(
+            self.population.notes,
+            self.population.durations,
+            counters.scores,
+            {
+                "algorithm": type(self).__name__,
+                "generation": counters.generation,
+                "temperature": self.temperature,
+                "cooling_rate": self.cooling_rate,
+                "incremental": self.incremental,
+                "heuristic_config": self.heuristic.config.config_path if self.heuristic is not None else None,
+                "rng": self.rng.bit_generator.state,
+                "evaluations": counters.evaluations,
+                "accepted": counters.accepted,
+                "best_so_far": None if best is None else {"score": best[0], **best[1].to_dict()},
+                "stopping": None if self.stopping is None else self.stopping.state(),
+            },
+        )
+
+    def _track_best(self, melody_idx: int, score: float) -> None:
+        if self.best_so_far is None or score > self.best_so_far[0]:
+            self.best_so_far = (float(score), self.population.melody(melody_idx))
 
     def acceptance_probability(self, old_score: float, new_score: float) -> float:
         """
@@ -263,24 +527,76 @@ class SimulatedAnnealingGA(BaseMelodyGenerator):
             return 1.0
         return np.exp((new_score - old_score) / self.temperature)
 
-    def run(self, generations: int = 1000) -> SimulatedAnnealingGA:
+    def run_iter(self, generations: int = 1000, every: int = 1) -> Iterator[RunSnapshot]:
         """
-        Runs the simulated annealing genetic algorithm for a given number of generations.
+        Runs the simulated annealing genetic algorithm lazily, see BaseMelodyGenerator.run_iter.
 
         :param generations: The number of generations to evolve melodies.
-        :return: The evolved melody generator instance.
+        :param every: Yield one snapshot every `every` generations.
+        :return: Iterator of RunSnapshot.
         """
-        self.save_melodies()
-        for _ in range(generations):
-            best_melody = max(self.melodies.keys(), key=self.evaluate)
-            best_score = self.evaluate(best_melody)
-
-            new_generation = self.mutation(copy.deepcopy(self.melodies))
-            new_best = max(new_generation.keys(), key=lambda i, gen=new_generation: self.evaluate(i, gen))
-            new_score = self.evaluate(new_best, new_generation)
+        resume, self._resume = self._resume, None
+        counters = self.counters = RunCounters(counts_acceptance=True)
+        if resume is not None:
+            counters.generation = resume["generation"]
+            counters.evaluations = resume["evaluations"]
+            counters.accepted = resume["accepted"]
+        timings = counters.timings
+        self.stop_reason = None
+        if self.stopping is not None:
+            self.stopping.start(resume["stopping"] if resume is not None else None)
+        evaluator = IncrementalEvaluator(self.heuristic, self.population.notes) if self.incremental else None
+        timings["evaluate"] += perf_counter() - counters.started
+        for generation in range(counters.generation + 1, generations + 1):
+            started = perf_counter()
+            scores = evaluator.scores if evaluator else self.evaluate_population()
+            best_melody = int(np.argmax(scores))
+            best_score = scores[best_melody]
+            self._track_best(best_melody, best_score)
+
+            mutating = perf_counter()
+            new_generation = self.mutation(self.population.copy())
+            evaluating = perf_counter()
+            if evaluator:
+                new_evaluator = evaluator.copy()
+                new_evaluator.update(new_generation.notes)
+                new_scores = new_evaluator.scores
+            else:
+                new_scores = self.evaluate_population(new_generation)
+            new_best = int(np.argmax(new_scores))
+            new_score = new_scores[new_best]
+
+            if self.rng.random() < self.acceptance_probability(best_score, new_score):
+                self.population.notes[best_melody] = new_generation.notes[new_best]
+                self.population.durations[best_melody] = new_generation.durations[new_best]
+                if evaluator:
+                    evaluator.replace_row(best_melody, new_evaluator, new_best)
+                scores[best_melody] = new_score
+                counters.accepted += 1
 
-            if random.random() < self.acceptance_probability(best_score, new_score):
-                self.melodies[best_melody] = new_generation[new_best]
-            
             self.temperature *= self.cooling_rate
-        return self
+            saving = perf_counter()
+            self.persistence.step(self.population, generation, scores)
+            timings["evaluate"] += (mutating - started) + (saving - evaluating)
+            timings["mutation"] += evaluating - mutating
+            timings["io"] += perf_counter() - saving
+
+            counters.evaluations += len(new_scores)
+            counters.scores = scores
+            counters.generation = generation
+            if self.stopping is not None:
+                self.stop_reason = self.stopping.check(self, generation)
+            if self.checkpointer is not None:
+                saving = perf_counter()
+                self.checkpointer.step(self, generation)
+                timings["io"] += perf_counter() - saving
+            if self.stop_reason is not None or generation % every == 0 or generation == generations:
+                yield self.snapshot()
+            if self.stop_reason is not None:
+                break
+        else:
+            self.stop_reason = EarlyStopping.COMPLETED
+        if counters.scores is not None:
+            best_melody = int(np.argmax(counters.scores))
+            self._track_best(best_melody, counters.scores[best_melody])
+        self.persistence.finish(self.population, counters.scores, counters.generation)
@@ -1,10 +1,13 @@
+import copy
 import inspect
 import os
+from functools import cached_property
 from typing import Optional
 import numpy as np
 import json
 
 from Evalutionary_music_generation import settings
+from simulated_annealing.core.fitness_cache import FitnessCache
 
 
 class HeuristicConfig:
@@ -23,7 +26,8 @@ class HeuristicConfig:
         "tonal_purity": {
             "weight": 0.05,
             "scale": [48, 50, 52, 53, 55, 57, 59, 60]  # Default: C major scale
-        }
+        },
+        "auto_key": { "weight": 0.0 }  # Disabled by default, see Heuristic.auto_key_score
     }
 
     default_config_path = os.path.join(settings.MEDIA_ROOT, 'simulated_annealing', 'default_config.json')
@@ -36,6 +40,7 @@ class HeuristicConfig:
         """
         self.config_path = config_path
         self.config = self.load_config()
+        self.version = 0  # Incremented on every change so that compiled evaluation plans can be invalidated
 
     def load_config(self):
         """ Loads heuristic configuration from a JSON file or falls back to default settings. """
@@ -51,7 +56,7 @@ class HeuristicConfig:
                         # Ensure all default keys exist within each heuristic config
                         for key, value in default_values.items():
                             if key not in data[heuristic]:
-                                data[heuristic][key] = value
+                                data[heuristic][key] = copy.deepcopy(value)
 
                 return data
 
@@ -60,7 +65,7 @@ class HeuristicConfig:
         except json.JSONDecodeError:
             print(f"Error: Failed to read configuration file '{self.config_path}'. Using default configuration.")
 
-        return self.DEFAULT_CONFIG.copy()
+        return copy.deepcopy(self.DEFAULT_CONFIG)  # Every config owns its weights, see version
 
     def save_config(self):
         """ Saves the current heuristic configuration to a JSON file. """
@@ -80,6 +85,7 @@ class HeuristicConfig:
         """
         if heuristic_name in self.config and 0 <= value <= 1:
             self.config[heuristic_name]["weight"] = value
+            self.version += 1
             self.save_config()
         else:
             raise ValueError(f"Invalid heuristic name or weight: {heuristic_name} -> {value}")
@@ -100,16 +106,169 @@ class HeuristicConfig:
             self.config[heuristic_name] = {}
 
         self.config[heuristic_name].update(params)
+        self.version += 1
         self.save_config()
 
 
+class MelodyFeatures:
+    """
+    Features of a batch of melodies shared by the vectorized heuristics.
+    Each feature is computed on first access and reused by every metric of the batch.
+    """
+
+    def __init__(self, notes):
+        """
+        :param notes: Matrix of note values with one melody per row (a single melody is treated as one row).
+        """
+        self.notes = np.array(notes, dtype=np.int64, ndmin=2)
+        self.n_melodies, self.n_notes = self.notes.shape
+
+    @cached_property
+    def intervals(self):
+        """ Signed intervals between consecutive notes, shape (n_melodies, n_notes - 1). """
+        return np.diff(self.notes, axis=1)
+
+    @cached_property
+    def abs_intervals(self):
+        """ Absolute intervals between consecutive notes. """
+        return np.abs(self.intervals)
+
+    @cached_property
+    def unique_notes(self):
+        """ Number of distinct notes in each melody. """
+        return self._count_unique(self.notes)
+
+    @cached_property
+    def unique_intervals(self):
+        """ Number of distinct absolute intervals in each melody. """
+        return self._count_unique(self.abs_intervals)
+
+    @cached_property
+    def pitch_class_histogram(self):
+        """ Occurrences of each of the 12 pitch classes in each melody, shape (n_melodies, 12). """
+        offsets = 12 * np.arange(self.n_melodies)[:, None]
+        counts = np.bincount((self.notes % 12 + offsets).ravel(), minlength=12 * self.n_melodies)
+        return counts.reshape(self.n_melodies, 12)
+
+    @cached_property
+    def key_counts(self):
+        """ Number of notes of each melody in each of the 24 keys (see KEY_NAMES), shape (n_melodies, 24). """
+        return self.pitch_class_histogram @ KEY_MATRIX.T
+
+    @cached_property
+    def half_matches(self):
+        """ Position-wise equality of the first half of each melody with its second half. """
+        half = self.n_notes // 2
+        return self.notes[:, :half] == self.notes[:, half:2 * half]
+
+    @staticmethod
+    def _count_unique(matrix):
+        if matrix.shape[1] == 0:
+            return np.zeros(matrix.shape[0], dtype=np.int64)
+        ordered = np.sort(matrix, axis=1)
+        return 1 + np.count_nonzero(np.diff(ordered, axis=1), axis=1)
+
+
+def scale_lookup_table(scale):
+    """ Turns a list of MIDI notes into a boolean lookup table indexed by note number. """
+    if isinstance(scale, np.ndarray) and scale.dtype == bool:
+        return scale
+    lookup = np.zeros(128, dtype=bool)
+    lookup[list(scale)] = True
+    return lookup
+
+
+CHORD_INTERVALS = scale_lookup_table({3, 4, 7, 8})
+
+
+def pitch_class_mask(notes) -> int:
+    """ 12-bit mask with bit i set when a note of pitch class i (C = 0) is present, whatever its octave. """
+    mask = 0
+    for note in notes:
+        mask |= 1 << (note % 12)
+    return mask
+
+
+NOTE_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+MAJOR_SCALE = (0, 2, 4, 5, 7, 9, 11)
+MINOR_SCALE = (0, 2, 3, 5, 7, 8, 10)  # Natural minor
+
+# The 24 major and minor keys as pitch-class masks, and the same masks unpacked into a (24, 12)
+# membership matrix: a pitch-class histogram times its transpose counts the in-key notes of every key.
+# A major key and its relative minor share their pitch classes, ties resolve to the major key.
+KEY_NAMES = tuple(f"{name} major" for name in NOTE_NAMES) + tuple(f"{name} minor" for name in NOTE_NAMES)
+KEY_MASKS = np.array(
+    [pitch_class_mask(tonic + step for step in MAJOR_SCALE) for tonic in range(12)]
+    + [pitch_class_mask(tonic + step for step in MINOR_SCALE) for tonic in range(12)],
+    dtype=np.int64,
+)
+KEY_MATRIX = (KEY_MASKS[:, None] >> np.arange(12)) & 1
+
+
+class EvaluationPlan:
+    """
+    Evaluation steps compiled once for a fixed list of metrics and a given config version:
+    metric order, normalized weight vector and heuristic functions with pre-bound parameters.
+    """
+
+    # Converters applied to config parameters when the plan is compiled
+    SCALAR_PARAMETERS = {"scale": frozenset}
+    BATCH_PARAMETERS = {"scale": scale_lookup_table}
+
+    def __init__(self, heuristic, metrics: list[str]):
+        """
+        :param heuristic: The Heuristic whose functions and config are compiled.
+        :param metrics: Metric names in evaluation order.
+        """
+        self.version = heuristic.config.version
+        self.metrics = tuple(metrics)
+
+        normalized_weights = heuristic.normalize_weights(metrics)
+        self.weights = np.array([normalized_weights[m] for m in self.metrics])
+
+        self.scalar_steps = [
+            (heuristic.AVAILABLE_METRICS[m], self._bind(heuristic, heuristic.AVAILABLE_METRICS[m], m, self.SCALAR_PARAMETERS), w)
+            for m, w in zip(self.metrics, self.weights)
+        ]
+        self.batch_steps = [
+            (heuristic.BATCH_METRICS[m], self._bind(heuristic, heuristic.BATCH_METRICS[m], m, self.BATCH_PARAMETERS), w)
+            for m, w in zip(self.metrics, self.weights)
+        ]
+
+    @staticmethod
+    def _bind(heuristic, heuristic_func, metric, converters):
+        """ Selects the config parameters accepted by the heuristic function and converts them. """
+        config_params = heuristic.config.get_parameters(metric)
+        signature = inspect.signature(heuristic_func)
+        return {
+            key: converters.get(key, lambda value: value)(config_params[key])
+            for key in signature.parameters if key in config_params
+        }
+
+
+def scale_scores(counts, min_val, max_val):
+    """ Vectorized min-max scaling used by the batch heuristics; zero when the range is empty. """
+    if max_val <= min_val:
+        return np.zeros(len(counts))
+    return (counts - min_val) / (max_val - min_val)
+
+
 class Heuristic:
     """ Evaluates melodies using weighted heuristic scores with optional metric filtering. """
 
-    def __init__(self, config_path="heuristics_config.json"):
-        """ Initializes the heuristic evaluator, loads configuration, and dynamically registers heuristics. """
+    def __init__(self, config_path="heuristics_config.json", cache_size: int = 4096):
+        """
+        Initializes the heuristic evaluator, loads configuration, and dynamically registers heuristics.
+
+        :param config_path: Path to the JSON file containing heuristic settings.
+        :param cache_size: Number of melody scores kept by the batch fitness cache, 0 disables it.
+        """
         self.config = HeuristicConfig(config_path)
         self.AVAILABLE_METRICS = self._initialize_metrics()
+        self.BATCH_METRICS = self._initialize_batch_metrics()
+        self._plans = {}
+        self._metric_steps = {}  # Bound batch functions of metric_scores, see compile_plan
+        self.cache = FitnessCache(cache_size)
 
     # def __init__(self, config_path):
     #     """ Initializes the heuristic evaluator, loads configuration, and dynamically registers heuristics. """
@@ -126,6 +285,14 @@ class Heuristic:
             if name.endswith("_score")
         }
 
+    def _initialize_batch_metrics(self):
+        """ Registers the vectorized counterparts of the heuristics, methods ending with '_scores'. """
+        return {
+            name[:-7]: method  # Remove '_scores' suffix
+            for name, method in inspect.getmembers(self, predicate=inspect.ismethod)
+            if name.endswith("_scores")
+        }
+
     def validate_metrics(self, metrics):
         """ Ensures all requested metrics exist in the system. """
         invalid_metrics = [m for m in metrics if m not in self.AVAILABLE_METRICS]
@@ -148,6 +315,27 @@ class Heuristic:
 
         return {m: w / total_abs_weight for m, w in selected_weights.items()}
 
+    def compile_plan(self, metrics: Optional[list[str]] = None) -> EvaluationPlan:
+        """
+        Returns the evaluation plan for the given metrics, compiling it on first use
+        and again only after the config has been changed.
+
+        :param metrics: Optional list of heuristic names, all configured metrics by default.
+        :return: The compiled EvaluationPlan.
+        """
+        key = None if metrics is None else tuple(metrics)
+        plan = self._plans.get(key)
+        if plan is None or plan.version != self.config.version:
+            if metrics is None:
+                # Используем все метрики, a zero weight disables a metric and it is not computed at all
+                metrics = sorted(
+                    m for m in self.AVAILABLE_METRICS.keys() & self.config.config.keys() if self.config.get_weight(m)
+                )
+            else:
+                self.validate_metrics(metrics)  # Проверяем, что метрики существуют
+            plan = self._plans[key] = EvaluationPlan(self, metrics)
+        return plan
+
     def evaluate(self, melody: list[int], metrics: Optional[list[str]] = None):
         """
         Evaluates a single melody based on the given or all available heuristics.
@@ -156,26 +344,73 @@ class Heuristic:
         :param metrics: Optional list of heuristic names to evaluate on.
         :return: Normalized heuristic score.
         """
-        if metrics is None:
-            metrics = list(self.AVAILABLE_METRICS.keys() & self.config.config.keys())  # Используем все метрики
-        else:
-            self.validate_metrics(metrics)  # Проверяем, что метрики существуют
-
-        # Получаем нормализованные веса для выбранных метрик
-        normalized_weights = self.normalize_weights(metrics)
-
         # Вычисляем общий score
         total_score = 0
-        for metric in metrics:
-            heuristic_func = self.AVAILABLE_METRICS[metric]
-            config_params = self.config.get_parameters(metric)
-            signature = inspect.signature(heuristic_func)
-            signature_params = {name: param.default for name, param in signature.parameters.items()}
-            kwargs = {key: config_params[key] for key in signature_params if key in config_params}
-            total_score += heuristic_func(melody, **kwargs) * normalized_weights[metric]
+        for heuristic_func, kwargs, weight in self.compile_plan(metrics).scalar_steps:
+            total_score += heuristic_func(melody, **kwargs) * weight
 
         return total_score
-    
+
+    def evaluate_batch(self, notes_matrix, metrics: Optional[list[str]] = None) -> np.ndarray:
+        """
+        Evaluates a whole population of melodies at once.
+        Shared features (intervals, pitch-class histogram, ...) are extracted once for the batch,
+        then every metric is computed as array operations over all melodies.
+        Scores of melodies already seen with the same config version are served from the fitness cache.
+
+        :param notes_matrix: Matrix of note values, one melody per row.
+        :param metrics: Optional list of heuristic names to evaluate on.
+        :return: Vector of normalized heuristic scores, one per melody.
+        """
+        plan = self.compile_plan(metrics)
+        if self.cache.maxsize <= 0:
+            return self._evaluate_plan(plan, notes_matrix)
+
+        notes_matrix = np.array(notes_matrix, ndmin=2)
+        keys = self.cache.melody_keys(notes_matrix, (plan.version, plan.metrics))
+        scores = np.array([self.cache.get(key) for key in keys], dtype=float)  # Misses become NaN
+
+        missing = np.flatnonzero(np.isnan(scores))
+        if missing.size:
+            scores[missing] = self._evaluate_plan(plan, notes_matrix[missing])
+            for i in missing:
+                self.cache.put(keys[i], scores[i])
+        return scores
+
+    def metric_scores(self, notes_matrix, metrics: list[str]) -> np.ndarray:
+        """
+        Unweighted scores of every metric, for selection modes that look at metrics separately.
+        Metrics are computed whatever their weight, and the scores are not cached.
+
+        :param notes_matrix: Matrix of note values, one melody per row.
+        :param metrics: Heuristic names, one column each.
+        :return: (n_melodies, n_metrics) matrix of scores.
+        """
+        key = tuple(metrics)
+        version, steps = self._metric_steps.get(key, (None, None))
+        if version != self.config.version:
+            self.validate_metrics(metrics)
+            steps = [
+                (self.BATCH_METRICS[m], EvaluationPlan._bind(self, self.BATCH_METRICS[m], m, EvaluationPlan.BATCH_PARAMETERS))
+                for m in metrics
+            ]
+            self._metric_steps[key] = (self.config.version, steps)
+
+        features = MelodyFeatures(notes_matrix)
+        columns = [heuristic_func(features, **kwargs) for heuristic_func, kwargs in steps]
+        return np.column_stack(columns) if columns else np.zeros((features.n_melodies, 0))
+
+    @staticmethod
+    def _evaluate_plan(plan: EvaluationPlan, notes_matrix) -> np.ndarray:
+        """ Runs the batch steps of a compiled plan over a note matrix. """
+        features = MelodyFeatures(notes_matrix)
+
+        total_scores = np.zeros(features.n_melodies)
+        for heuristic_func, kwargs, weight in plan.batch_steps:
+            total_scores += heuristic_func(features, **kwargs) * weight
+
+        return total_scores
+
     # === Heuristic Functions (auto-registered via inspect) === #
 
     def monotony_score(self, melody):
@@ -250,3 +485,72 @@ class Heuristic:
         in_scale_notes = sum(1 for note in melody if note in scale)
         min_val, max_val = 0, len(melody)
         return (in_scale_notes - min_val) / (max_val - min_val) if max_val > min_val else 0
+
+    def auto_key_score(self, melody):
+        """
+        Scores how well the melody fits its best-fitting major or minor key, in any octave:
+        the largest share of its notes belonging to one of the 24 keys.
+        """
+        histogram = np.bincount(np.asarray(melody) % 12, minlength=12)
+        in_key_notes = int((KEY_MATRIX @ histogram).max()) if len(melody) else 0
+        min_val, max_val = 0, len(melody)
+        return (in_key_notes - min_val) / (max_val - min_val) if max_val > min_val else 0
+
+    # === Vectorized Heuristic Functions (auto-registered via inspect) === #
+    # Each takes the MelodyFeatures of a batch and returns one score per melody,
+    # matching its scalar '_score' counterpart above.
+
+    def monotony_scores(self, features):
+        """ Vectorized monotony_score. """
+        return 1 - scale_scores(features.unique_notes, 1, features.n_notes)
+
+    def ascending_scale_scores(self, features):
+        """ Vectorized ascending_scale_score. """
+        ascending_steps = np.count_nonzero(features.intervals > 0, axis=1)
+        return scale_scores(ascending_steps, 0, features.n_notes - 1)
+
+    def descending_scale_scores(self, features):
+        """ Vectorized descending_scale_score. """
+        descending_steps = np.count_nonzero(features.intervals < 0, axis=1)
+        return scale_scores(descending_steps, 0, features.n_notes - 1)
+
+    def arpeggio_scores(self, features):
+        """ Vectorized arpeggio_score. """
+        arpeggio_steps = np.count_nonzero(CHORD_INTERVALS[features.abs_intervals], axis=1)
+        return scale_scores(arpeggio_steps, 0, features.n_notes - 1)
+
+    def repetition_scores(self, features):
+        """ Vectorized repetition_score: a pattern of two notes immediately repeated. """
+        pattern_size = 2
+        notes = features.notes
+        shifted_equal = notes[:, :-pattern_size] == notes[:, pattern_size:]
+        repeated_patterns = np.count_nonzero(shifted_equal[:, :-1] & shifted_equal[:, 1:], axis=1)
+        return scale_scores(repeated_patterns, 0, features.n_notes // pattern_size)
+
+    def interval_variety_scores(self, features):
+        """ Vectorized interval_variety_score. """
+        return scale_scores(features.unique_intervals, 1, features.n_notes - 1)
+
+    def smoothness_scores(self, features):
+        """ Vectorized smoothness_score. """
+        smooth_steps = np.count_nonzero(features.abs_intervals <= 2, axis=1)
+        return scale_scores(smooth_steps, 0, features.n_notes - 1)
+
+    def symmetry_scores(self, features):
+        """ Vectorized symmetry_score. """
+        sym_match = np.count_nonzero(features.half_matches, axis=1)
+        return scale_scores(sym_match, 0, features.n_notes // 2)
+
+    def tonic_stability_scores(self, features):
+        """ Vectorized tonic_stability_score. """
+        tonic_occurrences = np.count_nonzero(features.notes == features.notes[:, :1], axis=1)
+        return scale_scores(tonic_occurrences, 1, features.n_notes)
+
+    def tonal_purity_scores(self, features, scale):
+        """ Vectorized tonal_purity_score. """
+        in_scale_notes = np.count_nonzero(scale_lookup_table(scale)[features.notes], axis=1)
+        return scale_scores(in_scale_notes, 0, features.n_notes)
+
+    def auto_key_scores(self, features):
+        """ Vectorized auto_key_score, every key of every melody in one matrix product. """
+        return scale_scores(features.key_counts.max(axis=1), 0, features.n_notes)
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import copy
+from typing import Optional
+
+import numpy as np
+
+from simulated_annealing.core.heuristics import CHORD_INTERVALS, KEY_MATRIX, Heuristic, MelodyFeatures, scale_lookup_table
+
+
+class IncrementalEvaluator:
+    """
+    Keeps per-melody running counts of the heuristics so that a population can be rescored after
+    point mutations by only looking at the notes, intervals and windows around the changed notes.
+
+    Every built-in metric is derived from these counts or from the note/interval histograms.
+    Metrics without an incremental form are recomputed with their batch heuristic, but only
+    for the melodies that changed.
+    """
+
+    # Columns of the running counts matrix
+    COUNTED = (
+        "ascending_scale", "descending_scale", "arpeggio", "smoothness",  # one flag per interval
+        "repetition",  # one flag per window of two repeated notes pairs
+        "symmetry",  # one flag per note of the first half
+        "tonal_purity", "tonic_stability",  # one flag per note
+    )
+    HISTOGRAM_SIZE = 128
+
+    def __init__(self, heuristic: Heuristic, notes, metrics: Optional[list[str]] = None):
+        """
+        :param heuristic: The heuristic whose compiled plan defines metrics, weights and parameters.
+        :param notes: Matrix of note values, one melody per row.
+        :param metrics: Optional list of heuristic names, all configured metrics by default.
+        """
+        self.plan = heuristic.compile_plan(metrics)
+        self.notes = np.array(notes, dtype=np.int64, ndmin=2)
+        self.n_melodies, self.n_notes = self.notes.shape
+
+        batch_params = {metric: kwargs for metric, (_, kwargs, _) in zip(self.plan.metrics, self.plan.batch_steps)}
+        scale = batch_params.get("tonal_purity", {}).get("scale")
+        self._scale = scale_lookup_table(scale if scale is not None else [])
+        self._compile_scores()
+
+        positions = self._affected_positions(np.ones(self.notes.shape, dtype=bool))
+        self.counts = self._count_flags(self.notes, positions)
+        self.note_histogram = self._note_histogram(self.notes, positions[-1])
+        self.interval_histogram = self._interval_histogram(self.notes, positions[0])
+
+        self.metric_scores = np.zeros((self.n_melodies, len(self.plan.metrics)))
+        self._rescore(np.arange(self.n_melodies))
+
+    @property
+    def scores(self) -> np.ndarray:
+        """ Weighted heuristic score of every melody. """
+        return self.metric_scores @ self.plan.weights
+
+    def copy(self) -> IncrementalEvaluator:
+        """ Returns an independent copy of the running state. """
+        clone = copy.copy(self)
+        clone.notes = self.notes.copy()
+        clone.counts = self.counts.copy()
+        clone.note_histogram = self.note_histogram.copy()
+        clone.interval_histogram = self.interval_histogram.copy()
+        clone.metric_scores = self.metric_scores.copy()
+        return clone
+
+    def update(self, new_notes) -> np.ndarray:
+        """
+        Applies the difference between the current and the new note matrix to the running counts.
+
+        :param new_notes: Matrix of note values with the same shape as the current one.
+        :return: Indices of the melodies that changed.
+        """
+        new_notes = np.array(new_notes, dtype=np.int64)
+        changed = new_notes != self.notes
+        changed_rows = np.flatnonzero(changed.any(axis=1))
+        if changed_rows.size == 0:
+            return changed_rows
+
+        # New and old notes are stacked so that their flags are gathered in one pass
+        n_melodies = self.n_melodies
+        both = np.concatenate((new_notes, self.notes))
+        positions = tuple(
+            (np.concatenate((idx, idx + self.notes.size)), np.concatenate((rows, rows + n_melodies)))
+            for idx, rows in self._affected_positions(changed)
+        )
+        self.notes = new_notes
+
+        counts = self._count_flags(both, positions)
+        self.counts += counts[:n_melodies] - counts[n_melodies:]
+        histogram = self._note_histogram(both, positions[-1])
+        self.note_histogram += histogram[:n_melodies] - histogram[n_melodies:]
+        histogram = self._interval_histogram(both, positions[0])
+        self.interval_histogram += histogram[:n_melodies] - histogram[n_melodies:]
+
+        # A new first note changes the tonic itself, those melodies are recounted in full
+        new_tonic = changed_rows[changed[changed_rows, 0]]
+        self.counts[new_tonic, self.COUNTED.index("tonic_stability")] = np.count_nonzero(
+            self.notes[new_tonic] == self.notes[new_tonic, :1], axis=1
+        )
+
+        self._rescore(changed_rows)
+        return changed_rows
+
+    def replace_row(self, row: int, source: IncrementalEvaluator, source_row: int) -> None:
+        """
+        Replaces one melody with a melody of another evaluator sharing the same plan, without rescoring.
+
+        :param row: Index of the melody to replace.
+        :param source: Evaluator holding the new melody.
+        :param source_row: Index of the new melody in the source evaluator.
+        """
+        self.notes[row] = source.notes[source_row]
+        self.counts[row] = source.counts[source_row]
+        self.note_histogram[row] = source.note_histogram[source_row]
+        self.interval_histogram[row] = source.interval_histogram[source_row]
+        self.metric_scores[row] = source.metric_scores[source_row]
+
+    def _affected_positions(self, changed: np.ndarray) -> tuple:
+        """
+        Finds every position whose flag depends on a changed note.
+
+        :param changed: Boolean matrix of changed notes, one row per melody.
+        :return: (flat indices into the note matrix, rows) pairs for the starts of intervals,
+                 the starts of repetition windows, first-half notes and notes.
+        """
+        n_notes = changed.shape[1]
+        half = n_notes // 2
+        masks = np.zeros((4, *changed.shape), dtype=bool)
+        masks[0, :, :-1] = changed[:, :-1] | changed[:, 1:]
+        if n_notes >= 4:
+            masks[1, :, :-3] = changed[:, :-3] | changed[:, 1:-2] | changed[:, 2:-1] | changed[:, 3:]
+        masks[2, :, :half] = changed[:, :half] | changed[:, half:2 * half]
+        masks[3] = changed
+
+        positions = []
+        for mask in masks:
+            flat = np.flatnonzero(mask)
+            positions.append((flat, flat // n_notes))
+        return tuple(positions)
+
+    def _count_flags(self, notes: np.ndarray, positions: tuple) -> np.ndarray:
+        """ Sums the flags of every COUNTED column over the given positions, per row of the note matrix. """
+        (interval_idx, interval_rows), (window_idx, window_rows), (half_idx, half_rows), (note_idx, note_rows) = positions
+        flat = notes.ravel()
+
+        intervals = flat[interval_idx + 1] - flat[interval_idx]
+        abs_intervals = np.abs(intervals)
+        note_values = flat[note_idx]
+        flags = (
+            (interval_rows, intervals > 0),
+            (interval_rows, intervals < 0),
+            (interval_rows, CHORD_INTERVALS[abs_intervals]),
+            (interval_rows, abs_intervals <= 2),
+            (window_rows, (flat[window_idx] == flat[window_idx + 2]) & (flat[window_idx + 1] == flat[window_idx + 3])),
+            (half_rows, flat[half_idx] == flat[half_idx + self.n_notes // 2]),
+            (note_rows, self._scale[note_values]),
+            (note_rows, note_values == flat[note_rows * self.n_notes]),
+        )
+        n_columns = len(flags)
+        keys = np.concatenate([rows[values] * n_columns + column for column, (rows, values) in enumerate(flags)])
+        return np.bincount(keys, minlength=len(notes) * n_columns).reshape(len(notes), n_columns)
+
+    def _note_histogram(self, notes: np.ndarray, positions: tuple) -> np.ndarray:
+        """ Per-melody histogram of the notes at the given positions. """
+        idx, rows = positions
+        return self._histogram(len(notes), rows, notes.ravel()[idx])
+
+    def _interval_histogram(self, notes: np.ndarray, positions: tuple) -> np.ndarray:
+        """ Per-melody histogram of the absolute intervals starting at the given positions. """
+        idx, rows = positions
+        flat = notes.ravel()
+        return self._histogram(len(notes), rows, np.abs(flat[idx + 1] - flat[idx]))
+
+    def _histogram(self, n_rows: int, rows: np.ndarray, values: np.ndarray) -> np.ndarray:
+        histogram = np.bincount(rows * self.HISTOGRAM_SIZE + values, minlength=n_rows * self.HISTOGRAM_SIZE)
+        return histogram.reshape(n_rows, self.HISTOGRAM_SIZE)
+
+    def _compile_scores(self) -> None:
+        """
+        Maps every metric of the plan to a column of the per-melody values matrix
+        (running counts followed by distinct note and interval counts) and its min-max scaling.
+        """
+        n_notes = self.n_notes
+        ranges = {
+            "ascending_scale": (0, n_notes - 1),
+            "descending_scale": (0, n_notes - 1),
+            "arpeggio": (0, n_notes - 1),
+            "smoothness": (0, n_notes - 1),
+            "repetition": (0, n_notes // 2),
+            "symmetry": (0, n_notes // 2),
+            "tonal_purity": (0, n_notes),
+            "tonic_stability": (1, n_notes),
+            "monotony": (1, n_notes),
+            "interval_variety": (1, n_notes - 1),
+            "auto_key": (0, n_notes),
+        }
+        sources = [*self.COUNTED, "monotony", "interval_variety", "auto_key"]
+        self._uses_key = "auto_key" in self.plan.metrics
+
+        incremental = [j for j, metric in enumerate(self.plan.metrics) if metric in ranges]
+        self._incremental_columns = np.array(incremental, dtype=np.int64)
+        self._fallback_columns = [j for j in range(len(self.plan.metrics)) if j not in incremental]
+
+        metrics = [self.plan.metrics[j] for j in incremental]
+        self._value_columns = np.array([sources.index(metric) for metric in metrics], dtype=np.int64)
+        min_vals = np.array([ranges[metric][0] for metric in metrics], dtype=float)
+        max_vals = np.array([ranges[metric][1] for metric in metrics], dtype=float)
+        valid = max_vals > min_vals
+        self._min_vals = min_vals
+        self._spans = np.where(valid, max_vals - min_vals, 1.0)
+        self._valid = valid
+        # monotony is reported as 1 - scaled distinct notes
+        self._inverted = np.array([metric == "monotony" for metric in metrics])
+
+    def _rescore(self, rows: np.ndarray) -> None:
+        """ Recomputes the per-metric scores of the given melodies. """
+        values = np.hstack((
+            self.counts[rows],
+            np.count_nonzero(self.note_histogram[rows], axis=1)[:, None],
+            np.count_nonzero(self.interval_histogram[rows], axis=1)[:, None],
+            self._in_key_notes(rows)[:, None],
+        ))[:, self._value_columns]
+        scaled = np.where(self._valid, (values - self._min_vals) / self._spans, 0.0)
+        self.metric_scores[np.ix_(rows, self._incremental_columns)] = np.where(self._inverted, 1 - scaled, scaled)
+
+        if self._fallback_columns:
+            features = MelodyFeatures(self.notes[rows])
+            for j in self._fallback_columns:
+                heuristic_func, kwargs, _ = self.plan.batch_steps[j]
+                self.metric_scores[rows, j] = heuristic_func(features, **kwargs)
+
+    def _in_key_notes(self, rows: np.ndarray) -> np.ndarray:
+        """ Notes of each melody in its best-fitting key, from the note histogram folded into pitch classes. """
+        if not self._uses_key:
+            return np.zeros(len(rows), dtype=np.int64)
+        histogram = self.note_histogram[rows]
+        padded = np.zeros((len(rows), -(-self.HISTOGRAM_SIZE // 12) * 12), dtype=histogram.dtype)
+        padded[:, :self.HISTOGRAM_SIZE] = histogram
+        pitch_classes = padded.reshape(len(rows), -1, 12).sum(axis=1)
+        return (pitch_classes @ KEY_MATRIX.T).max(axis=1)
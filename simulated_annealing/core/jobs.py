@@ -0,0 +1,176 @@
+import atexit
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import django
+
+from Evalutionary_music_generation import settings
+from battle.core.workspace import Workspace
+from simulated_annealing.core.stats import RunStats
+
+# Models are imported inside the functions: this module is imported by spawned
+# worker processes before Django is set up.
+
+_executor = None
+_futures = {}  # Job id -> future of the jobs queued or running in this server process
+
+CHECKPOINT_NAME = 'checkpoint.bin'
+
+
+class JobCancelled(Exception):
+    """ Raised from the progress callback to stop a run whose cancellation was requested. """
+
+
+def _init_worker():
+    """ Sets up Django in a freshly spawned worker process. """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Evalutionary_music_generation.settings')
+    django.setup()
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """ Returns the process pool shared by every job of this server process, creating it on first use. """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.SIMULATED_ANNEALING_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        )
+        atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+    return _executor
+
+
+def job_workspace(job_id) -> Workspace:
+    """ Workspace of a job: its uploaded config and the melodies it writes. """
+    return Workspace('jobs', job_id)
+
+
+def interrupted_jobs():
+    """
+    Jobs left behind by a worker pool that is gone: running ones continue from their last checkpoint when
+    requeued, pending ones lost their queued future when the pool shut down and start from scratch.
+    Jobs still queued in this process are not interrupted.
+    """
+    from simulated_annealing.models import Job
+
+    return Job.objects.filter(
+        status__in=(Job.Status.RUNNING, Job.Status.PENDING), cancel_requested=False
+    ).exclude(pk__in=[job_id for job_id, future in list(_futures.items()) if not future.done()])
+
+
+def submit_job(job) -> None:
+    """ Queues a saved Job for execution in the worker pool. """
+    job_id = str(job.id)
+    future = _futures[job_id] = get_executor().submit(run_job, job_id)
+    future.add_done_callback(lambda done: _futures.pop(job_id) if _futures.get(job_id) is done else None)
+
+
+def cancel_job(job) -> None:
+    """ Asks a job to stop, the worker notices it on its next progress update. """
+    from simulated_annealing.models import Job
+
+    Job.objects.filter(pk=job.pk).update(cancel_requested=True)
+    Job.objects.filter(pk=job.pk, status=Job.Status.PENDING).update(status=Job.Status.CANCELLED)
+
+
+class ProgressReporter:
+    """
+    Run callback storing a job's progress and sampled statistics, and checking for cancellation,
+    at most every `interval` seconds.
+    """
+
+    def __init__(self, job_id, generations: int, interval: float = 0.5, stats: Optional[RunStats] = None):
+        self.job_id = job_id
+        self.generations = generations
+        self.interval = interval
+        self.stats = stats if stats is not None else RunStats(every=settings.SIMULATED_ANNEALING_STATS_EVERY)
+        self._last_report = 0.0
+
+    def __call__(self, generator, generation: int) -> None:
+        self.stats(generator, generation)
+        now = time.monotonic()
+        if now - self._last_report < self.interval:
+            return
+        self._last_report = now
+
+        from simulated_annealing.models import Job
+
+        Job.objects.filter(pk=self.job_id).update(
+            progress=generation / self.generations,
+            stats={**self.stats.to_dict(), 'snapshot': generator.snapshot()._asdict()},
+        )
+        if Job.objects.filter(pk=self.job_id, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def run_job(job_id) -> None:
+    """ Executes a simulated annealing job inside a worker process and stores its result. """
+    from simulated_annealing.core.checkpoint import Checkpointer
+    from simulated_annealing.core.generator import SimulatedAnnealingGA
+    from simulated_annealing.core.heuristics import Heuristic
+    from simulated_annealing.core.persistence import MelodyPersistence
+    from simulated_annealing.core.stopping import EarlyStopping
+    from simulated_annealing.models import Job
+
+    started = Job.objects.filter(pk=job_id, status=Job.Status.PENDING, cancel_requested=False).update(
+        status=Job.Status.RUNNING
+    )
+    if not started:
+        return
+
+    job = Job.objects.get(pk=job_id)
+    params = job.params
+    try:
+        if params.get('config_path'):
+            heuristic = Heuristic(config_path=params['config_path'])
+        else:
+            heuristic = Heuristic()
+
+        workspace = job_workspace(job_id)
+        persistence = MelodyPersistence(workspace.path, metadata={'job': str(job_id), 'params': params})
+        stopping = EarlyStopping(**params.get('stopping', settings.SIMULATED_ANNEALING_STOPPING))
+        checkpoint = Checkpointer(
+            workspace.file(CHECKPOINT_NAME), interval=settings.SIMULATED_ANNEALING_CHECKPOINT_INTERVAL
+        )
+        if checkpoint.exists():
+            # The job was interrupted, e.g. by a worker restart, and requeued: continue where it stopped
+            generator = SimulatedAnnealingGA.resume(checkpoint.path, heuristic, persistence, stopping, checkpoint)
+        else:
+            generator = SimulatedAnnealingGA(
+                heuristic=heuristic,
+                n_melodies=params['n_melodies'],
+                n_melody_notes=params['n_melody_notes'],
+                initial_temp=params['initial_temp'],
+                persistence=persistence,
+                seed=params.get('seed'),
+                stopping=stopping,
+                checkpoint=checkpoint,
+            )
+        generations = params['generations']
+        reporter = ProgressReporter(job_id, generations)
+        generator.run(generations, callback=reporter)
+
+        best_melody = generator.best_melody
+        melody = generator.melodies[best_melody]
+        Job.objects.filter(pk=job_id).update(
+            status=Job.Status.DONE,
+            progress=1.0,
+            stats={**reporter.stats.to_dict(), 'snapshot': generator.snapshot()._asdict()},
+            result={
+                'best_melody': best_melody,
+                'score': float(generator.evaluate_population()[best_melody]),
+                'stop_reason': generator.stop_reason,
+                'generations': generator.counters.generation,
+                'directory': workspace.relpath,
+                'notes': melody['notes'],
+                'durations': melody['durations'],
+            },
+        )
+    except JobCancelled:
+        Job.objects.filter(pk=job_id).update(status=Job.Status.CANCELLED)
+    except Exception:
+        Job.objects.filter(pk=job_id).update(status=Job.Status.FAILED, error=traceback.format_exc())
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+from typing import Optional, Union
+
+import numpy as np
+
+# Upper bound on the number of point pairs compared at once by the dominance checks
+BLOCK_ELEMENTS = 1 << 22
+
+
+class Objectives:
+    """
+    Heuristic metrics treated as separate objectives, all maximized, instead of one weighted sum.
+
+    Every objective is a group of metrics combined with their config weights, normalized to an absolute
+    sum of 1 within the group (equal weights when they are all zero). A single-metric objective is the
+    metric score itself, negated when its weight is negative.
+    """
+
+    def __init__(self, heuristic, groups: Optional[Union[list[str], dict[str, list[str]]]] = None):
+        """
+        :param heuristic: The Heuristic computing the metric scores.
+        :param groups: {objective name: [metric, ...]}, or a list of metrics that are each their own
+                       objective. Every metric enabled in the config by default.
+        """
+        if groups is None:
+            groups = heuristic.compile_plan().metrics
+        if not isinstance(groups, dict):
+            groups = {metric: [metric] for metric in groups}
+        if not groups or not all(groups.values()):
+            raise ValueError("Objectives need at least one objective and one metric per objective")
+        heuristic.validate_metrics([metric for metrics in groups.values() for metric in metrics])
+
+        self.heuristic = heuristic
+        self.groups = {name: list(metrics) for name, metrics in groups.items()}
+        self.names = tuple(self.groups)
+        self.metrics = sorted({metric for metrics in self.groups.values() for metric in metrics})
+
+    def weights(self) -> np.ndarray:
+        """ (n_metrics, n_objectives) matrix turning metric scores into objective scores, from the current config. """
+        weights = np.zeros((len(self.metrics), len(self.names)))
+        for j, metrics in enumerate(self.groups.values()):
+            rows = [self.metrics.index(metric) for metric in metrics]
+            group = np.array([self.heuristic.config.get_weight(metric) for metric in metrics], dtype=float)
+            total = np.abs(group).sum()
+            weights[rows, j] = group / total if total else 1 / len(metrics)
+        return weights
+
+    def scores(self, notes_matrix) -> np.ndarray:
+        """
+        Objective scores of a population.
+
+        :param notes_matrix: Matrix of note values, one melody per row.
+        :return: (n_melodies, n_objectives) matrix, columns in self.names order.
+        """
+        return self.heuristic.metric_scores(notes_matrix, self.metrics) @ self.weights()
+
+
+def _domination_counts(dominating: np.ndarray, dominated: np.ndarray, triangular: bool = False) -> np.ndarray:
+    """
+    Counts, for every point of `dominated`, the points of `dominating` that are at least as good on every
+    objective. Points are distinct, so that is domination.
+
+    :param dominating: (n, n_objectives) scores, maximized.
+    :param dominated: (m, n_objectives) scores.
+    :param triangular: Both are the same points sorted by decreasing sum of scores: only earlier points
+                       are counted, a point can only be dominated by points with a larger sum.
+    :return: Vector of m counts.
+    """
+    counts = np.zeros(len(dominated), dtype=np.int64)
+    step = max(1, BLOCK_ELEMENTS // max(len(dominated), 1))
+    for start in range(0, len(dominating), step):
+        block = dominating[start:start + step]
+        offset = start + 1 if triangular else 0
+        targets = dominated[offset:]
+        # One 2-D comparison per objective: reducing a short trailing objectives axis is far slower
+        at_least = np.ones((len(block), len(targets)), dtype=bool)
+        for objective in range(targets.shape[1]):
+            at_least &= block[:, objective, None] >= targets[None, :, objective]
+        if triangular:
+            at_least = np.triu(at_least)
+        counts[offset:] += np.count_nonzero(at_least, axis=0)
+    return counts
+
+
+def non_dominated_sort(scores, n_required: Optional[int] = None) -> np.ndarray:
+    """
+    Fast non-dominated sort (NSGA-II): splits the points into successive Pareto fronts.
+
+    Duplicate score vectors are sorted once. Domination counts are computed for every point in
+    memory-bounded blocks, then each front is peeled off by subtracting what its points dominate
+    from the counts of the remaining ones.
+
+    :param scores: (n_melodies, n_objectives) scores, every objective maximized.
+    :param n_required: Stop once at least this many points are ranked, the others then share the next
+                       rank. Selection only needs the fronts it takes from.
+    :return: Front index of every point, 0 for the Pareto front.
+    """
+    scores = np.asarray(scores, dtype=float)
+    if scores.ndim != 2:
+        raise ValueError(f"Expected a (n_melodies, n_objectives) matrix, got shape {scores.shape}")
+    unique, inverse, multiplicity = np.unique(scores, axis=0, return_inverse=True, return_counts=True)
+    # Decreasing sum, ties in decreasing lexicographic order (np.unique sorts rows increasingly): a point
+    # dominating another comes first even when rounding makes their sums equal
+    order = np.lexsort((-np.arange(len(unique)), -unique.sum(axis=1)))
+    unique, multiplicity = unique[order], multiplicity[order]
+
+    counts = _domination_counts(unique, unique, triangular=True)
+    ranks = np.full(len(unique), -1, dtype=np.int64)
+    front = np.flatnonzero(counts == 0)
+    rank = ranked = 0
+    while front.size:
+        ranks[front] = rank
+        rank += 1
+        ranked += multiplicity[front].sum()
+        remaining = np.flatnonzero(ranks < 0)
+        if n_required is not None and ranked >= n_required:
+            ranks[remaining] = rank
+            break
+        counts[remaining] -= _domination_counts(unique[front], unique[remaining])
+        front = remaining[counts[remaining] == 0]
+
+    sorted_ranks = np.empty_like(ranks)
+    sorted_ranks[order] = ranks
+    return sorted_ranks[inverse.reshape(-1)]
+
+
+def crowding_distance(scores, ranks) -> np.ndarray:
+    """
+    NSGA-II crowding distance of every point within its front: the sum over objectives of the
+    normalized gap between its two neighbours. The extreme points of every front get infinity.
+
+    :param scores: (n_melodies, n_objectives) scores.
+    :param ranks: Front index of every point, see non_dominated_sort.
+    :return: Vector of distances, larger is less crowded.
+    """
+    scores = np.asarray(scores, dtype=float)
+    ranks = np.asarray(ranks)
+    if len(scores) == 0:
+        return np.zeros(0)
+    # Every column sorted by value, then stably by rank: fronts one after the other, each sorted along the objective
+    order = np.argsort(scores, axis=0, kind="stable")
+    order = np.take_along_axis(order, np.argsort(ranks[order], axis=0, kind="stable"), axis=0)
+    sorted_values = np.take_along_axis(scores, order, axis=0)
+    # Fronts take the same rows in every column
+    sorted_ranks = np.sort(ranks)
+    first = np.r_[True, sorted_ranks[1:] != sorted_ranks[:-1]]
+    last = np.r_[sorted_ranks[1:] != sorted_ranks[:-1], True]
+
+    spans = (sorted_values[last] - sorted_values[first])[np.cumsum(first) - 1]
+    gaps = np.zeros(scores.shape)
+    gaps[1:-1] = sorted_values[2:] - sorted_values[:-2]
+    contribution = np.divide(gaps, spans, out=np.zeros(scores.shape), where=spans > 0)
+    contribution[first | last] = np.inf
+
+    distance = np.zeros(scores.shape)
+    np.put_along_axis(distance, order, contribution, axis=0)
+    return distance.sum(axis=1)
+
+
+def pareto_front(scores) -> np.ndarray:
+    """ Indices of the non-dominated points. """
+    return np.flatnonzero(non_dominated_sort(scores, n_required=1) == 0)
+
+
+def nsga2_select(scores, k: int) -> np.ndarray:
+    """
+    NSGA-II survivor selection: whole fronts in rank order, then the least crowded points of the
+    front that does not fit entirely.
+
+    :param scores: (n_melodies, n_objectives) scores, every objective maximized.
+    :param k: Number of points to select.
+    :return: Indices of the selected points, best fronts first.
+    """
+    scores = np.asarray(scores, dtype=float)
+    k = min(k, len(scores))
+    ranks = non_dominated_sort(scores, n_required=k)
+    cumulative = np.cumsum(np.bincount(ranks))
+    last_rank = int(np.searchsorted(cumulative, k))
+
+    selected = np.flatnonzero(ranks < last_rank)
+    selected = selected[np.argsort(ranks[selected], kind="stable")]
+    missing = k - len(selected)
+    if missing:
+        candidates = np.flatnonzero(ranks == last_rank)
+        distance = crowding_distance(scores[candidates], np.zeros(len(candidates), dtype=np.int64))
+        if missing < len(candidates):
+            candidates = candidates[np.argpartition(-distance, missing - 1)[:missing]]
+        selected = np.concatenate((selected, candidates))
+    return selected
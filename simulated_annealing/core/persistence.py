@@ -0,0 +1,82 @@
+import os
+import time
+from hashlib import blake2b
+from typing import Optional
+
+from battle.core.archive import ARCHIVE_NAME, PopulationArchive
+from simulated_annealing.core.population import Population
+
+
+class MelodyPersistence:
+    """
+    Write-behind persistence of a generator's melodies.
+
+    Decides when the population is written (final-only, every N generations or on a wall-clock
+    interval) and writes it as one packed archive (see battle.core.archive), atomically, skipping
+    populations that did not change since the last save. MIDI and JSON files are exported from the
+    archive on demand.
+    """
+
+    def __init__(
+            self,
+            directory: Optional[str],
+            every: Optional[int] = None,
+            interval: Optional[float] = None,
+            metadata: Optional[dict] = None
+    ):
+        """
+        :param directory: Directory receiving the population archive. None disables writing.
+        :param every: Save every N generations. None disables the generation policy.
+        :param interval: Save when this many seconds passed since the last save. None disables the time policy.
+        Without either policy the melodies are only written by finish() or an explicit save().
+        :param metadata: JSON-serializable dict stored in every archive, e.g. the run parameters.
+        """
+        self.directory = directory
+        self.every = every
+        self.interval = interval
+        self.metadata = metadata or {}
+        self.writes = 0
+        self._written = None
+        self._last_save = time.monotonic()
+
+    @property
+    def path(self) -> Optional[str]:
+        return None if self.directory is None else os.path.join(self.directory, ARCHIVE_NAME)
+
+    def should_save(self, generation: int) -> bool:
+        """ Checks the configured policies for the given (1-based) generation number. """
+        if self.every and generation % self.every == 0:
+            return True
+        if self.interval is not None and time.monotonic() - self._last_save >= self.interval:
+            return True
+        return False
+
+    def step(self, population: Population, generation: int, scores=None) -> None:
+        """ Called after each generation, saves the population if a policy asks for it. """
+        if self.should_save(generation):
+            self.save(population, scores, generation)
+
+    def finish(self, population: Population, scores=None, generation: Optional[int] = None) -> None:
+        """ Called at the end of a run, always saves the final population. """
+        self.save(population, scores, generation)
+
+    def save(self, population: Population, scores=None, generation: Optional[int] = None) -> None:
+        """
+        Writes the population archive unless the population is unchanged since the last save.
+
+        :param scores: Scores of this population's melodies, stored in the archive when given.
+        :param generation: Generation the population comes from, stored in the archive metadata.
+        """
+        if self.directory is None:
+            return
+        digest = blake2b(population.notes.tobytes() + population.durations.tobytes(), digest_size=16).digest()
+        if digest == self._written and os.path.exists(self.path):
+            self._last_save = time.monotonic()
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        metadata = dict(self.metadata) if generation is None else {**self.metadata, "generation": generation}
+        PopulationArchive(population.notes, population.durations, scores, metadata).save(self.path)
+        self._written = digest
+        self.writes += 1
+        self._last_save = time.monotonic()
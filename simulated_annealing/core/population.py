@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+
+from battle.core.melody import Melody
+
+
+class Population:
+    """
+    Array-backed storage for a population of melodies.
+
+    Notes and durations are kept as two (n_melodies, n_melody_notes) integer matrices so that
+    generation, mutation and crossover can work on the whole population at once. The
+    {"notes": [...], "durations": [...]} dict view is only built on export.
+    """
+
+    NOTE_MIN, NOTE_MAX = 48, 83
+    DURATION_MIN, DURATION_MAX = 240, 1920
+    INITIAL_DURATIONS = (220, 260, 300, 360)
+    dtype = np.int16
+
+    def __init__(self, notes, durations):
+        """
+        :param notes: Matrix (or nested list) of MIDI note numbers, one row per melody.
+        :param durations: Matrix (or nested list) of note durations in ticks, same shape as notes.
+        """
+        self.notes = np.array(notes, dtype=self.dtype, ndmin=2)
+        self.durations = np.array(durations, dtype=self.dtype, ndmin=2)
+        if self.notes.shape != self.durations.shape:
+            raise ValueError(f"Notes and durations shapes differ: {self.notes.shape} != {self.durations.shape}")
+
+    @classmethod
+    def random(cls, n_melodies: int, n_melody_notes: int, rng: Optional[np.random.Generator] = None) -> Population:
+        """
+        Generates a population of random melodies.
+
+        :param n_melodies: Number of melodies (rows).
+        :param n_melody_notes: Number of notes per melody (columns).
+        :param rng: Random generator to draw from, a fresh one when None.
+        :return: A new Population.
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        shape = (n_melodies, n_melody_notes)
+        notes = rng.integers(cls.NOTE_MIN, cls.NOTE_MAX + 1, size=shape)
+        durations = rng.choice(cls.INITIAL_DURATIONS, size=shape)
+        return cls(notes, durations)
+
+    @classmethod
+    def from_dict(cls, melodies: dict) -> Population:
+        """
+        Builds a population from the {index: {"notes": [...], "durations": [...]}} representation.
+
+        :param melodies: Melodies keyed by integer (or numeric string) index.
+        :return: A new Population with rows ordered by index.
+        """
+        keys = sorted(melodies, key=int)
+        return cls(
+            [melodies[key]["notes"] for key in keys],
+            [melodies[key]["durations"] for key in keys],
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Exports the population as {index: {"notes": [...], "durations": [...]}} with plain Python ints.
+
+        :return: A dictionary view of the population.
+        """
+        return {
+            i: {"notes": notes, "durations": durations}
+            for i, (notes, durations) in enumerate(zip(self.notes.tolist(), self.durations.tolist()))
+        }
+
+    @classmethod
+    def from_melodies(cls, melodies: list[Melody]) -> Population:
+        """ Builds a population from Melody objects of equal length. """
+        return cls(
+            [melody.notes_array for melody in melodies],
+            [melody.durations_array for melody in melodies],
+        )
+
+    def melody(self, index: int) -> Melody:
+        """ Copies one row out as a compact Melody. """
+        return Melody(self.notes[index].astype(np.uint8), self.durations[index].astype(np.uint16))
+
+    def to_melodies(self) -> list[Melody]:
+        """ Copies every row out as a compact Melody. """
+        return [self.melody(i) for i in range(len(self))]
+
+    def copy(self) -> Population:
+        """ Returns an independent copy of the population. """
+        return Population(self.notes.copy(), self.durations.copy())
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        """ (n_melodies, n_melody_notes) """
+        return self.notes.shape
+
+    def __len__(self) -> int:
+        return self.notes.shape[0]
@@ -0,0 +1,124 @@
+import inspect
+
+import numpy as np
+
+
+def top_k(scores, k: int) -> np.ndarray:
+    """
+    Indices of the k best scores, best first, ties broken by index as a stable sort would.
+    Only the k selected scores are sorted, the rest is split off with a partition.
+
+    :param scores: Score vector, higher is better.
+    :param k: Number of indices to return.
+    """
+    scores = np.asarray(scores)
+    n = len(scores)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= n:
+        return np.argsort(-scores, kind="stable")
+    threshold = -np.partition(-scores, k - 1)[k - 1]
+    better = np.flatnonzero(scores > threshold)
+    tied = np.flatnonzero(scores == threshold)[:k - len(better)]
+    chosen = np.concatenate((better, tied))
+    return chosen[np.argsort(-scores[chosen], kind="stable")]
+
+
+class SelectionOperators:
+    """
+    Selection operators of MelodyGenerator. Every method ending with '_selection' is registered
+    under its name without the suffix.
+
+    An operator picks k parents from a precomputed score vector (higher is better) and returns their
+    indices; stochastic operators may pick a melody several times. They work on whole arrays:
+    partial orderings use a partition instead of a full sort, draws come from the generator's random
+    stream in one call, so a seeded run selects the same parents.
+
+    Elitism applies to every operator: the `elite` best melodies are always selected, the operator
+    picks the others.
+    """
+
+    def __init__(self, rng: np.random.Generator, elite: int = 0, tournament_size: int = 2, pressure: float = 1.5):
+        """
+        :param rng: Random stream of the generator.
+        :param elite: Number of best melodies always selected.
+        :param tournament_size: Contestants per tournament, the best of them is selected.
+        :param pressure: Selection pressure of rank selection, from 1 (uniform) to 2 (the worst melody is never picked).
+        """
+        if elite < 0:
+            raise ValueError(f"elite must not be negative, got {elite}")
+        if tournament_size < 1:
+            raise ValueError(f"tournament_size must be at least 1, got {tournament_size}")
+        if not 1 <= pressure <= 2:
+            raise ValueError(f"pressure must be between 1 and 2, got {pressure}")
+        self.rng = rng
+        self.elite = elite
+        self.tournament_size = tournament_size
+        self.pressure = pressure
+        self.OPERATORS = {
+            name[:-10]: method  # Remove '_selection' suffix
+            for name, method in inspect.getmembers(self, predicate=inspect.ismethod)
+            if name.endswith("_selection")
+        }
+
+    def select(self, name: str, scores, k: int) -> np.ndarray:
+        """
+        Selects k melodies with the named operator, after the elite ones.
+
+        :param name: Operator name, a key of OPERATORS.
+        :param scores: Score vector of the population.
+        :param k: Number of melodies to select.
+        :return: Indices of the selected melodies.
+        """
+        if name not in self.OPERATORS:
+            raise ValueError(f"Unknown selection operator {name!r}, expected one of {sorted(self.OPERATORS)}")
+        scores = np.asarray(scores, dtype=float)
+        if name == "truncation":
+            return self.truncation_selection(scores, k)  # Already starts with the elite ones
+        elite = top_k(scores, min(self.elite, k))
+        if len(elite) == k:
+            return elite
+        return np.concatenate((elite, self.OPERATORS[name](scores, k - len(elite))))
+
+    # === Selection operators (auto-registered via inspect) === #
+
+    def truncation_selection(self, scores, k):
+        """ The k best melodies, best first. """
+        return top_k(scores, k)
+
+    def tournament_selection(self, scores, k):
+        """ Winners of k tournaments between tournament_size melodies drawn with replacement. """
+        contestants = self.rng.integers(len(scores), size=(k, self.tournament_size))
+        return contestants[np.arange(k), np.argmax(scores[contestants], axis=1)]
+
+    def rank_selection(self, scores, k):
+        """
+        Linear ranking: stochastic universal sampling on probabilities growing linearly with the rank,
+        from (2 - pressure) / n for the worst melody to pressure / n for the best. Ranks need a full sort.
+        """
+        n = len(scores)
+        ranks = np.empty(n)
+        ranks[np.argsort(scores, kind="stable")] = np.arange(n)
+        weights = 2 - self.pressure + 2 * (self.pressure - 1) * ranks / max(n - 1, 1)
+        return self._universal_sampling(weights, k)
+
+    def roulette_selection(self, scores, k):
+        """ Fitness-proportional sampling, k independent spins. Scores are shifted so that the worst one weighs 0. """
+        cumulative = np.cumsum(self._fitness_weights(scores))
+        spins = self.rng.random(k) * cumulative[-1]
+        return np.minimum(np.searchsorted(cumulative, spins, side="right"), len(scores) - 1)
+
+    def sus_selection(self, scores, k):
+        """ Stochastic universal sampling: fitness-proportional like roulette, with k evenly spaced pointers and one spin. """
+        return self._universal_sampling(self._fitness_weights(scores), k)
+
+    @staticmethod
+    def _fitness_weights(scores):
+        """ Scores shifted to be non-negative, heuristic weights may be negative. Uniform when all scores are equal. """
+        weights = scores - scores.min()
+        return weights if weights.any() else np.ones(len(scores))
+
+    def _universal_sampling(self, weights, k):
+        cumulative = np.cumsum(weights)
+        pointers = (self.rng.random() + np.arange(k)) * (cumulative[-1] / k)
+        return np.minimum(np.searchsorted(cumulative, pointers, side="right"), len(weights) - 1)
@@ -0,0 +1,105 @@
+import time
+from collections import deque
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+
+class RunSnapshot(NamedTuple):
+    """
+    State of a run after a generation, yielded by the generators' run_iter().
+
+    best_melody indexes the population as last evaluated. The genetic MelodyGenerator replaces that
+    population by crossover and mutation before the snapshot is taken, so the index is stale there:
+    notes and durations hold the best melody itself, as it was evaluated.
+    """
+
+    generation: int
+    best_melody: Optional[int]
+    score: Optional[float]
+    temperature: Optional[float]
+    notes: Optional[list[int]] = None
+    durations: Optional[list[int]] = None
+
+
+class RunCounters:
+    """
+    Cumulative counters of the current run, maintained by the generators' run loops.
+    Keeping them costs a few perf_counter calls per generation; turning them into statistics is left
+    to a run callback such as RunStats.
+    """
+
+    PHASES = ("evaluate", "mutation", "crossover", "io")
+
+    def __init__(self, counts_acceptance: bool = False):
+        """
+        :param counts_acceptance: Whether the algorithm accepts or rejects candidates (simulated annealing),
+                                  otherwise `accepted` stays None.
+        """
+        self.started = time.perf_counter()
+        self.generation = 0
+        self.evaluations = 0
+        self.accepted = 0 if counts_acceptance else None
+        self.timings = dict.fromkeys(self.PHASES, 0.0)
+        self.scores = None  # Scores of the population as last evaluated
+        self.best = None  # Best Melody of that population, kept by run loops that replace the population afterwards
+
+
+class RunStats:
+    """
+    Run callback turning a generator's RunCounters into per-generation statistics: best, mean and worst
+    score, acceptance rate, temperature, evaluations per second and time spent in each phase.
+
+    With every=N only one generation in N is sampled; rates and timings then cover the N generations
+    since the previous sample.
+    """
+
+    def __init__(self, every: int = 1, history: int = 100, listener: Optional[Callable] = None):
+        """
+        :param every: Sample one generation in `every`.
+        :param history: Number of samples kept in memory.
+        :param listener: Optional callable invoked with every sample.
+        """
+        self.every = every
+        self.history = deque(maxlen=history)
+        self.listener = listener
+        self.latest = None
+        self._counters = None
+        self._previous = None
+
+    def __call__(self, generator, generation: int) -> None:
+        if generation % self.every:
+            return
+        counters = generator.counters
+        if counters is not self._counters:
+            self._counters = counters
+            self._previous = (counters.started, 0, 0, 0, dict.fromkeys(counters.PHASES, 0.0))
+
+        now = time.perf_counter()
+        started, generations, evaluations, accepted, timings = self._previous
+        elapsed = now - started
+        scores = counters.scores
+
+        sample = {
+            "generation": generation,
+            "best": None if scores is None else float(np.max(scores)),
+            "mean": None if scores is None else float(np.mean(scores)),
+            "worst": None if scores is None else float(np.min(scores)),
+            "acceptance_rate": None,
+            "temperature": getattr(generator, "temperature", None),
+            "evaluations_per_second": (counters.evaluations - evaluations) / elapsed if elapsed else 0.0,
+            "time": {phase: counters.timings[phase] - timings[phase] for phase in counters.PHASES},
+            "elapsed": now - counters.started,
+        }
+        if counters.accepted is not None and counters.generation > generations:
+            sample["acceptance_rate"] = (counters.accepted - accepted) / (counters.generation - generations)
+
+        self._previous = (now, counters.generation, counters.evaluations, counters.accepted or 0, dict(counters.timings))
+        self.latest = sample
+        self.history.append(sample)
+        if self.listener is not None:
+            self.listener(sample)
+
+    def to_dict(self) -> dict:
+        """ JSON-serializable view: sampling rate, latest sample and the kept history. """
+        return {"every": self.every, "latest": self.latest, "history": list(self.history)}
@@ -0,0 +1,84 @@
+import time
+from typing import Optional
+
+
+class EarlyStopping:
+    """
+    Stopping criteria checked by the run loops after every generation.
+
+    A run stops at the first criterion met: the temperature froze, the best score did not improve for
+    `patience` generations, the target score was reached, or the wall-clock budget ran out.
+    Every criterion left to None is disabled.
+    """
+
+    FROZEN = "frozen"
+    STAGNATED = "stagnated"
+    TARGET_SCORE = "target_score"
+    TIME_BUDGET = "time_budget"
+    COMPLETED = "completed"  # Reported by the generators when the run went through every generation
+
+    def __init__(
+            self,
+            min_temperature: Optional[float] = None,
+            patience: Optional[int] = None,
+            target_score: Optional[float] = None,
+            time_budget: Optional[float] = None,
+            min_delta: float = 0.0
+    ):
+        """
+        :param min_temperature: Stop once the temperature falls below this value, worse melodies are
+                                practically never accepted from there on.
+        :param patience: Stop after this many generations without improvement of the best score.
+        :param target_score: Stop once the best score reaches this value.
+        :param time_budget: Stop after this many seconds.
+        :param min_delta: Minimal increase of the best score counted as an improvement.
+        """
+        self.min_temperature = min_temperature
+        self.patience = patience
+        self.target_score = target_score
+        self.time_budget = time_budget
+        self.min_delta = min_delta
+        self.start()
+
+    def start(self, state: Optional[dict] = None) -> None:
+        """
+        Resets the criteria, called by the generators when a run starts.
+
+        :param state: Progress saved by state(), to continue a resumed run.
+        """
+        state = state or {}
+        self._started = time.monotonic() - state.get("elapsed", 0.0)
+        self._best_score = state.get("best_score", float("-inf"))
+        self._best_generation = state.get("best_generation", 0)
+
+    def state(self) -> dict:
+        """ JSON-serializable progress of the criteria, see start. """
+        return {
+            "elapsed": time.monotonic() - self._started,
+            "best_score": self._best_score,
+            "best_generation": self._best_generation,
+        }
+
+    def check(self, generator, generation: int) -> Optional[str]:
+        """
+        :param generator: The running generator, its counters hold the current scores.
+        :param generation: The (1-based) generation that just finished.
+        :return: The reason to stop, or None to continue.
+        """
+        scores = generator.counters.scores
+        if scores is not None:
+            best_score = float(scores.max())
+            if best_score > self._best_score + self.min_delta:
+                self._best_score = best_score
+                self._best_generation = generation
+            if self.target_score is not None and best_score >= self.target_score:
+                return self.TARGET_SCORE
+
+        temperature = getattr(generator, "temperature", None)
+        if self.min_temperature is not None and temperature is not None and temperature < self.min_temperature:
+            return self.FROZEN
+        if self.patience is not None and generation - self._best_generation >= self.patience:
+            return self.STAGNATED
+        if self.time_budget is not None and time.monotonic() - self._started >= self.time_budget:
+            return self.TIME_BUDGET
+        return None
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from simulated_annealing.core.benchmarks import GRID, QUICK_GRID, BenchmarkSuite, environment
+
+
+class Command(BaseCommand):
+    help = "Times the generators, heuristics, I/O and views over a grid of population sizes and writes JSON results."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default="benchmark.json", help="File receiving the JSON results.")
+        parser.add_argument("--quick", action="store_true", help="Use a smaller grid.")
+        parser.add_argument("--select", help="Only run benchmarks whose name contains this string.")
+        parser.add_argument("--repeat", type=int, default=5, help="Number of timed batches per benchmark.")
+        parser.add_argument("--min-time", type=float, default=0.02, help="Minimal duration of a batch in seconds.")
+        parser.add_argument("--generations", type=int, default=100, help="Generations of the timed annealing runs.")
+
+    def handle(self, *args, **options):
+        suite = BenchmarkSuite(generations=options["generations"])
+
+        def report(result):
+            self.stdout.write(
+                f"{result['benchmark']:<45} {result['n_melodies']:>3} x {result['n_melody_notes']:<4}"
+                f"{result['best'] * 1e3:>12.3f} ms"
+            )
+
+        # The views run against a throwaway test database
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = suite.run(
+                QUICK_GRID if options["quick"] else GRID,
+                repeat=options["repeat"],
+                min_time=options["min_time"],
+                select=options["select"],
+                report=report,
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        with open(options["output"], "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} results written to {options['output']}"))
@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from simulated_annealing.core.benchmarks import compare
+
+
+class Command(BaseCommand):
+    help = "Compares two benchmark result files and reports the cases that got slower or faster."
+
+    def add_arguments(self, parser):
+        parser.add_argument("base", help="Results of the reference commit.")
+        parser.add_argument("head", help="Results of the commit under test.")
+        parser.add_argument("--threshold", type=float, default=0.1, help="Relative change reported, 0.1 is 10%%.")
+        parser.add_argument("--all", action="store_true", help="Also list the cases within the threshold.")
+        parser.add_argument("--fail-on-regression", action="store_true", help="Exit with an error on regressions.")
+
+    def handle(self, *args, **options):
+        base, head = self.load(options["base"]), self.load(options["head"])
+        threshold = options["threshold"]
+
+        regressions = 0
+        for row in sorted(compare(base["results"], head["results"]), key=lambda row: -row["ratio"]):
+            if row["ratio"] > 1 + threshold:
+                status, style = "slower", self.style.ERROR
+                regressions += 1
+            elif row["ratio"] < 1 / (1 + threshold):
+                status, style = "faster", self.style.SUCCESS
+            elif options["all"]:
+                status, style = "", str
+            else:
+                continue
+            self.stdout.write(style(
+                f"{row['benchmark']:<45} {row['n_melodies']:>3} x {row['n_melody_notes']:<4}"
+                f"{row['base'] * 1e3:>12.3f} ms {row['head'] * 1e3:>12.3f} ms {row['ratio']:>7.2f}x  {status}"
+            ))
+
+        commits = f"{base['environment'].get('commit')} -> {head['environment'].get('commit')}"
+        self.stdout.write(f"{commits}: {regressions} regression(s) above {threshold:.0%}")
+        if regressions and options["fail_on_regression"]:
+            raise CommandError(f"{regressions} benchmark(s) got slower")
+
+    @staticmethod
+    def load(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise CommandError(f"Cannot read benchmark results '{path}': {e}")
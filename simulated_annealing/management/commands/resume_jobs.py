@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from simulated_annealing.core.jobs import interrupted_jobs, run_job
+from simulated_annealing.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the jobs left pending or running by a crashed or restarted server, running ones continue "
+        "from their last checkpoint. "
+        "Run it only while no server is working on these jobs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--list", action="store_true", help="Only list the interrupted jobs.")
+
+    def handle(self, *args, **options):
+        jobs = list(interrupted_jobs())
+        for job in jobs:
+            self.stdout.write(f"{job.id} {job.progress:.0%}")
+            if options["list"]:
+                continue
+            Job.objects.filter(pk=job.pk, status=Job.Status.RUNNING).update(status=Job.Status.PENDING)
+            run_job(str(job.id))
+            job.refresh_from_db()
+            self.stdout.write(f"{job.id} {job.status}")
+        self.stdout.write(self.style.SUCCESS(f"{len(jobs)} interrupted job(s)"))
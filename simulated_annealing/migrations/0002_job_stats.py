@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulated_annealing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='stats',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -1,3 +1,536 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+from concurrent.futures import Future
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from Evalutionary_music_generation import settings
+from simulated_annealing.core import jobs
+from simulated_annealing.core.benchmarks import BenchmarkSuite, compare, measure
+
+from simulated_annealing.core.checkpoint import Checkpointer
+from simulated_annealing.core.generator import MelodyGenerator, SimulatedAnnealingGA
+from simulated_annealing.core.heuristics import Heuristic, HeuristicConfig, MelodyFeatures
+from simulated_annealing.core.incremental import IncrementalEvaluator
+from simulated_annealing.core.pareto import crowding_distance, non_dominated_sort, nsga2_select
+from simulated_annealing.core.persistence import MelodyPersistence
+from simulated_annealing.core.population import Population
+from simulated_annealing.core.selection import SelectionOperators, top_k
+from simulated_annealing.core.stopping import EarlyStopping
+from simulated_annealing.models import Job
+from simulated_annealing.views import SimulatedAnnealingView
+
+
+class HeuristicTestCase(SimpleTestCase):
+    """ Runs against a temporary config enabling every metric, auto_key included. """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        config = {metric: dict(values) for metric, values in HeuristicConfig.DEFAULT_CONFIG.items()}
+        config["auto_key"]["weight"] = 0.1
+        self.config_path = os.path.join(directory.name, "config.json")
+        with open(self.config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        self.heuristic = Heuristic(self.config_path)
+        self.rng = np.random.default_rng(0)
+
+    def random_notes(self, n_melodies=30, n_melody_notes=16):
+        return Population.random(n_melodies, n_melody_notes, self.rng).notes
+
+
+class BatchHeuristicTests(HeuristicTestCase):
+
+    def test_batch_metrics_match_scalar_metrics(self):
+        for n_melody_notes in (5, 8, 16):
+            notes = self.random_notes(n_melody_notes=n_melody_notes)
+            notes[:3, :] = notes[:3, :1]  # Monotonous melodies
+            plan = self.heuristic.compile_plan()
+            self.assertIn("auto_key", plan.metrics)
+            batch = MelodyFeatures(notes)
+            for metric, (scalar_func, scalar_kwargs, _), (batch_func, batch_kwargs, _) in zip(
+                    plan.metrics, plan.scalar_steps, plan.batch_steps):
+                expected = [scalar_func(melody, **scalar_kwargs) for melody in notes.tolist()]
+                np.testing.assert_allclose(batch_func(batch, **batch_kwargs), expected, err_msg=metric)
+
+    def test_evaluate_batch_matches_evaluate(self):
+        notes = self.random_notes()
+        expected = [self.heuristic.evaluate(melody) for melody in notes.tolist()]
+        np.testing.assert_allclose(self.heuristic.evaluate_batch(notes), expected)
+        # Second call is served from the fitness cache
+        np.testing.assert_allclose(self.heuristic.evaluate_batch(notes), expected)
+
+
+class HeuristicConfigTests(HeuristicTestCase):
+
+    def test_default_configs_are_independent(self):
+        # Missing config files: both heuristics fall back to the default config
+        first = Heuristic(os.path.join(os.path.dirname(self.config_path), "first.json"))
+        second = Heuristic(os.path.join(os.path.dirname(self.config_path), "second.json"))
+        notes = self.random_notes()
+        expected = second.evaluate_batch(notes)
+
+        first.config.update_weight("monotony", 1.0)
+        self.assertEqual(second.config.get_weight("monotony"), 0.1)
+        self.assertEqual(HeuristicConfig.DEFAULT_CONFIG["monotony"]["weight"], 0.1)
+        np.testing.assert_allclose(second.evaluate_batch(notes), expected)
+        fresh = Heuristic(os.path.join(os.path.dirname(self.config_path), "fresh.json"))
+        np.testing.assert_allclose(fresh.evaluate_batch(notes), expected)
+        self.assertFalse(np.allclose(first.evaluate_batch(notes), expected))
+
+    def test_plan_follows_weight_updates(self):
+        notes = self.random_notes()
+        self.heuristic.evaluate_batch(notes)
+        self.heuristic.config.update_weight("monotony", 1.0)
+        np.testing.assert_allclose(self.heuristic.evaluate_batch(notes), Heuristic(self.config_path).evaluate_batch(notes))
+
+
+class IncrementalEvaluatorTests(HeuristicTestCase):
+
+    def test_scores_follow_mutations(self):
+        notes = self.random_notes(n_melody_notes=24)
+        evaluator = IncrementalEvaluator(self.heuristic, notes)
+        np.testing.assert_allclose(evaluator.scores, self.heuristic.evaluate_batch(notes))
+        for _ in range(50):
+            notes = notes.copy()
+            mask = self.rng.random(notes.shape) < 0.1
+            notes[mask] = self.rng.integers(Population.NOTE_MIN, Population.NOTE_MAX + 1, size=mask.sum())
+            evaluator.update(notes)
+            np.testing.assert_allclose(evaluator.scores, self.heuristic.evaluate_batch(notes))
+
+
+class CheckpointTests(HeuristicTestCase):
+
+    def run_generator(self, generations, incremental, checkpoint=None):
+        generator = SimulatedAnnealingGA(
+            6, 16, self.heuristic, incremental=incremental, persistence=MelodyPersistence(None), seed=7,
+            stopping=EarlyStopping(patience=10 ** 6), checkpoint=checkpoint,
+        )
+        return generator, generator.run_iter(generations)
+
+    def test_resumed_run_matches_uninterrupted_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "checkpoint.bin")
+            for incremental in (True, False):
+                reference, run = self.run_generator(200, incremental)
+                for _ in run:
+                    pass
+
+                _, interrupted = self.run_generator(200, incremental, Checkpointer(path, every=73))
+                for snapshot in interrupted:
+                    if snapshot.generation == 73:
+                        break
+                resumed = SimulatedAnnealingGA.resume(
+                    path, self.heuristic, MelodyPersistence(None), stopping=EarlyStopping(patience=10 ** 6)
+                )
+                resumed.run(200)
+
+                np.testing.assert_array_equal(resumed.population.notes, reference.population.notes)
+                np.testing.assert_array_equal(resumed.population.durations, reference.population.durations)
+                np.testing.assert_array_equal(resumed.counters.scores, reference.counters.scores)
+                self.assertEqual(resumed.temperature, reference.temperature)
+                self.assertEqual(resumed.counters.accepted, reference.counters.accepted)
+                self.assertEqual(resumed.best_so_far, reference.best_so_far)
+                self.assertEqual(resumed.rng.bit_generator.state, reference.rng.bit_generator.state)
+
+
+class RunIterTests(HeuristicTestCase):
+
+    def test_snapshots_hold_the_evaluated_best_melody(self):
+        for generator in (
+                MelodyGenerator(6, 8, heuristic=self.heuristic, persistence=MelodyPersistence(None), seed=0),
+                SimulatedAnnealingGA(6, 8, self.heuristic, persistence=MelodyPersistence(None), seed=0),
+        ):
+            snapshots = list(generator.run_iter(45, every=10))
+            self.assertEqual([snapshot.generation for snapshot in snapshots], [10, 20, 30, 40, 45])
+            for snapshot in snapshots:
+                self.assertEqual(len(snapshot.notes), 8)
+                self.assertEqual(len(snapshot.durations), 8)
+                self.assertAlmostEqual(self.heuristic.evaluate(snapshot.notes), snapshot.score)
+            json.dumps(snapshots[-1]._asdict())  # Stored in the job stats
+
+
+class EarlyStoppingTests(HeuristicTestCase):
+
+    @staticmethod
+    def generator(best_score, temperature=1.0):
+        return SimpleNamespace(counters=SimpleNamespace(scores=np.array([0.0, best_score])), temperature=temperature)
+
+    def test_no_criteria_never_stop(self):
+        stopping = EarlyStopping()
+        for generation in range(1, 1000):
+            self.assertIsNone(stopping.check(self.generator(0.5, temperature=0.0), generation))
+
+    def test_frozen(self):
+        stopping = EarlyStopping(min_temperature=0.1)
+        self.assertIsNone(stopping.check(self.generator(0.5, temperature=0.1), 1))
+        self.assertEqual(stopping.check(self.generator(0.5, temperature=0.09), 2), EarlyStopping.FROZEN)
+
+    def test_patience_counts_from_the_last_improvement(self):
+        stopping = EarlyStopping(patience=3, min_delta=0.01)
+        for generation, score in enumerate((0.5, 0.6, 0.605, 0.609), start=1):
+            self.assertIsNone(stopping.check(self.generator(score), generation))
+        # 0.605 and 0.609 are within min_delta of 0.6
+        self.assertEqual(stopping.check(self.generator(0.609), 5), EarlyStopping.STAGNATED)
+
+        stopping.start()
+        for generation, score in enumerate((0.5, 0.6, 0.7, 0.8, 0.9), start=1):
+            self.assertIsNone(stopping.check(self.generator(score), generation))
+
+    def test_target_score(self):
+        stopping = EarlyStopping(target_score=0.8)
+        self.assertIsNone(stopping.check(self.generator(0.79), 1))
+        self.assertEqual(stopping.check(self.generator(0.8), 2), EarlyStopping.TARGET_SCORE)
+
+    def test_time_budget(self):
+        with mock.patch("simulated_annealing.core.stopping.time.monotonic", return_value=100.0) as monotonic:
+            stopping = EarlyStopping(time_budget=10)
+            monotonic.return_value = 109.9
+            self.assertIsNone(stopping.check(self.generator(0.5), 1))
+            monotonic.return_value = 110.0
+            self.assertEqual(stopping.check(self.generator(0.5), 2), EarlyStopping.TIME_BUDGET)
+
+    def test_state_restores_the_progress(self):
+        with mock.patch("simulated_annealing.core.stopping.time.monotonic", return_value=100.0) as monotonic:
+            stopping = EarlyStopping(patience=5, time_budget=10)
+            stopping.check(self.generator(0.7), 3)
+            monotonic.return_value = 104.0
+            state = json.loads(json.dumps(stopping.state()))
+
+            monotonic.return_value = 500.0
+            resumed = EarlyStopping(patience=5, time_budget=10)
+            resumed.start(state)
+            self.assertIsNone(resumed.check(self.generator(0.7), 7))
+            self.assertEqual(resumed.check(self.generator(0.7), 8), EarlyStopping.STAGNATED)
+            resumed.start(state)
+            monotonic.return_value = 506.0
+            self.assertEqual(resumed.check(self.generator(0.8), 9), EarlyStopping.TIME_BUDGET)
+
+    def test_generators_report_why_they_stopped(self):
+        heuristic = self.heuristic
+        generator = SimulatedAnnealingGA(6, 8, heuristic, persistence=MelodyPersistence(None), seed=0)
+        generator.run(50)
+        self.assertEqual(generator.stop_reason, EarlyStopping.COMPLETED)
+
+        generator = SimulatedAnnealingGA(
+            6, 8, heuristic, persistence=MelodyPersistence(None), seed=0, stopping=EarlyStopping(target_score=-1.0)
+        )
+        snapshots = list(generator.run_iter(50, every=10))
+        self.assertEqual(generator.stop_reason, EarlyStopping.TARGET_SCORE)
+        self.assertEqual([snapshot.generation for snapshot in snapshots], [1])
+
+
+class SelectionTests(SimpleTestCase):
+
+    def test_top_k_matches_stable_argsort(self):
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            scores = rng.integers(0, 5, rng.integers(1, 40)).astype(float)  # Plenty of ties
+            k = int(rng.integers(0, len(scores) + 2))
+            np.testing.assert_array_equal(top_k(scores, k), np.argsort(-scores, kind="stable")[:k])
+
+    def operators(self, **params):
+        return SelectionOperators(np.random.default_rng(0), **params)
+
+    def test_every_operator_favours_fitter_melodies(self):
+        scores = np.linspace(-0.5, 0.5, 20)  # Melody i is the i-th worst, weights may be negative
+        operators = self.operators(tournament_size=3)
+        self.assertEqual(sorted(operators.OPERATORS), ["rank", "roulette", "sus", "tournament", "truncation"])
+        for name in operators.OPERATORS:
+            counts = np.zeros(len(scores))
+            for _ in range(200):
+                selected = operators.select(name, scores, 10)
+                self.assertEqual(selected.shape, (10,), name)
+                self.assertTrue(((selected >= 0) & (selected < len(scores))).all(), name)
+                np.add.at(counts, selected, 1)
+            self.assertGreater(counts[10:].sum(), 1.5 * counts[:10].sum(), name)
+            self.assertGreater(np.corrcoef(scores, counts)[0, 1], 0.8, name)
+
+    def test_fitness_proportional_operators_skip_the_worst(self):
+        scores = np.array([0.2, 0.9, 0.4, 0.1, 0.6])
+        operators = self.operators(pressure=2)
+        for name in ("rank", "roulette", "sus"):
+            selected = np.concatenate([operators.select(name, scores, 4) for _ in range(200)])
+            self.assertNotIn(3, selected, name)
+
+    def test_sus_picks_close_to_the_expected_counts(self):
+        scores = np.array([0.0, 1.0, 2.0, 3.0, 4.0])
+        expected = 10 * scores / scores.sum()
+        operators = self.operators()
+        for _ in range(50):
+            counts = np.bincount(operators.select("sus", scores, 10), minlength=len(scores))
+            self.assertTrue((np.abs(counts - expected) < 1).all())
+
+    def test_elite_always_selected_first(self):
+        scores = np.array([0.3, 0.9, 0.1, 0.7, 0.5, 0.8])
+        operators = self.operators(elite=2)
+        for name in operators.OPERATORS:
+            for _ in range(20):
+                selected = operators.select(name, scores, 4)
+                self.assertEqual(len(selected), 4)
+                self.assertEqual(selected[:2].tolist(), [1, 5], name)
+        self.assertEqual(operators.select("tournament", scores, 1).tolist(), [1])
+
+    def test_equal_scores_select_uniformly(self):
+        operators = self.operators()
+        for name in ("roulette", "sus", "tournament"):  # Rank selection breaks ties by index
+            counts = np.bincount(operators.select(name, np.ones(4), 4000), minlength=4)
+            np.testing.assert_allclose(counts / 4000, 0.25, atol=0.05, err_msg=name)
+
+    def test_seeded_selection_is_reproducible(self):
+        scores = np.random.default_rng(1).random(30)
+        for name in self.operators().OPERATORS:
+            first, second = self.operators(), self.operators()
+            for _ in range(5):
+                np.testing.assert_array_equal(first.select(name, scores, 15), second.select(name, scores, 15))
+
+    def test_rejects_invalid_parameters(self):
+        for params in ({"elite": -1}, {"tournament_size": 0}, {"pressure": 0.5}, {"pressure": 2.5}):
+            with self.assertRaises(ValueError):
+                self.operators(**params)
+        with self.assertRaises(ValueError):
+            self.operators().select("lottery", np.ones(3), 1)
+
+    @staticmethod
+    def brute_force_ranks(scores):
+        ranks = np.full(len(scores), -1)
+        remaining = set(range(len(scores)))
+        rank = 0
+        while remaining:
+            front = {
+                i for i in remaining
+                if not any((scores[j] >= scores[i]).all() and (scores[j] > scores[i]).any() for j in remaining)
+            }
+            ranks[list(front)] = rank
+            remaining -= front
+            rank += 1
+        return ranks
+
+    def test_non_dominated_sort_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            scores = rng.integers(0, 4, size=(rng.integers(1, 50), rng.integers(1, 4))) * 0.1
+            scores = scores @ rng.random((scores.shape[1], scores.shape[1]))  # Sums equal up to rounding
+            np.testing.assert_array_equal(non_dominated_sort(scores), self.brute_force_ranks(scores))
+
+
+class QueueingExecutor:
+    """ Stands in for the worker pool: submitted calls wait in a queue until run_all executes them inline. """
+
+    def __init__(self):
+        self.queued = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.queued.append((future, fn, args))
+        return future
+
+    def run_all(self):
+        queued, self.queued = self.queued, []
+        for future, fn, args in queued:
+            if future.set_running_or_notify_cancel():
+                future.set_result(fn(*args))
+
+    def shutdown(self):
+        """ What a server restart does to the queued jobs. """
+        for future, _, _ in self.queued:
+            future.cancel()
+        self.queued = []
+
+
+class JobTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for patch in (
+                mock.patch.object(settings, "MEDIA_ROOT", directory.name),
+                mock.patch.object(settings, "WORKSPACE_GC_INTERVAL", None),
+                mock.patch.object(jobs, "get_executor", return_value=QueueingExecutor()),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.executor = jobs.get_executor()
+        self.config_path = os.path.join(directory.name, "config.json")
+        with open(self.config_path, "w", encoding="utf-8") as f:
+            json.dump(HeuristicConfig.DEFAULT_CONFIG, f)
+
+    def create_job(self, generations=60):
+        return Job.objects.create(params={
+            "n_melodies": 6,
+            "n_melody_notes": 8,
+            "initial_temp": 1000,
+            "generations": generations,
+            "config_path": self.config_path,
+            "seed": 7,
+            "stopping": {},
+        })
+
+    def test_submitted_job_runs_to_completion(self):
+        response = self.client.post(reverse("simulated_annealing"), {
+            "n_melodies": 6, "n_melody_notes": 8, "n_iterations": 1000,
+        })
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.Status.PENDING)
+        self.assertEqual(list(jobs.interrupted_jobs()), [])  # Queued in this process
+
+        self.executor.run_all()
+        status = self.client.get(reverse("job-status", args=[job.id])).json()
+        self.assertEqual(status["status"], Job.Status.DONE)
+        self.assertEqual(status["progress"], 1.0)
+        self.assertEqual(status["result"]["generations"], SimulatedAnnealingView.generations)
+        self.assertEqual(len(status["result"]["notes"]), 8)
+        stats = self.client.get(reverse("job-stats", args=[job.id])).json()
+        self.assertEqual(stats["snapshot"]["generation"], SimulatedAnnealingView.generations)
+
+    def test_cancel_pending_job(self):
+        job = self.create_job()
+        jobs.submit_job(job)
+        self.client.post(reverse("job-cancel", args=[job.id]))
+        self.executor.run_all()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.CANCELLED)
+        self.assertIsNone(job.result)
+
+    def test_cancel_running_job(self):
+        job = self.create_job()
+        reporter = jobs.ProgressReporter(job.id, 60, interval=0)
+        generator = SimulatedAnnealingGA(6, 8, Heuristic(self.config_path), persistence=MelodyPersistence(None))
+        generator.run(1, callback=reporter)
+        jobs.cancel_job(job)
+        with self.assertRaises(jobs.JobCancelled):
+            generator.run(1, callback=reporter)
+
+    def test_interrupted_jobs_resume(self):
+        reference = self.create_job()
+        jobs.run_job(str(reference.id))
+        reference.refresh_from_db()
+
+        # Queued when the server restarted
+        pending = self.create_job()
+        jobs.submit_job(pending)
+        self.executor.shutdown()
+        # Running when the server restarted, with a checkpoint at generation 30
+        running = self.create_job()
+        Job.objects.filter(pk=running.pk).update(status=Job.Status.RUNNING)
+        workspace = jobs.job_workspace(running.id)
+        generator = SimulatedAnnealingGA(
+            6, 8, Heuristic(self.config_path), initial_temp=1000, seed=7, stopping=EarlyStopping(),
+            persistence=MelodyPersistence(workspace.path),
+            checkpoint=Checkpointer(workspace.file(jobs.CHECKPOINT_NAME), every=30),
+        )
+        for snapshot in generator.run_iter(60):
+            if snapshot.generation == 30:
+                break
+        # Cancelled ones stay cancelled
+        cancelled = self.create_job()
+        jobs.cancel_job(cancelled)
+
+        self.assertCountEqual([job.pk for job in jobs.interrupted_jobs()], [pending.pk, running.pk])
+        call_command("resume_jobs", stdout=io.StringIO())
+        # The running job continued after its checkpoint, the pending one started over
+        for job, first_sample in ((pending, 10), (running, 40)):
+            job.refresh_from_db()
+            self.assertEqual(job.status, Job.Status.DONE)
+            self.assertEqual(job.stats["history"][0]["generation"], first_sample)
+            self.assertEqual(job.result["generations"], 60)
+            self.assertEqual(job.result["notes"], reference.result["notes"])
+            self.assertEqual(job.result["durations"], reference.result["durations"])
+        self.assertEqual(list(jobs.interrupted_jobs()), [])
+
+
+class ParetoTests(SimpleTestCase):
+
+    def test_crowding_distance_of_one_objective(self):
+        scores = np.array([[3.0], [0.0], [6.0], [1.0]])
+        np.testing.assert_allclose(crowding_distance(scores, np.zeros(4)), [5 / 6, np.inf, np.inf, 3 / 6])
+
+    def test_crowding_distance_within_fronts(self):
+        # Front 0 is a trade-off curve, front 1 lies below it
+        scores = np.array([[0, 4], [1, 3], [3, 1], [4, 0], [0, 2], [1, 1], [2, 0]], dtype=float)
+        ranks = non_dominated_sort(scores)
+        np.testing.assert_array_equal(ranks, [0, 0, 0, 0, 1, 1, 1])
+        distance = crowding_distance(scores, ranks)
+        # Extremes of every front are infinite, inner points add the gaps of both objectives over the front span
+        np.testing.assert_allclose(distance, [np.inf, 3 / 4 + 3 / 4, 3 / 4 + 3 / 4, np.inf, np.inf, 2 / 2 + 2 / 2, np.inf])
+
+    def test_crowding_distance_of_tiny_fronts(self):
+        scores = np.array([[1.0, 1.0], [2.0, 0.0], [0.0, 0.0]])
+        np.testing.assert_array_equal(crowding_distance(scores, [0, 0, 1]), [np.inf] * 3)
+        self.assertEqual(len(crowding_distance(np.zeros((0, 2)), [])), 0)
+
+    def test_nsga2_select_takes_whole_fronts_then_the_least_crowded(self):
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            scores = rng.random((int(rng.integers(1, 60)), int(rng.integers(1, 4))))
+            ranks = non_dominated_sort(scores)
+            k = int(rng.integers(0, len(scores) + 3))
+            selected = nsga2_select(scores, k)
+
+            self.assertEqual(len(selected), min(k, len(scores)))
+            self.assertEqual(len(set(selected.tolist())), len(selected))
+            self.assertTrue((np.diff(ranks[selected]) >= 0).all())  # Best fronts first
+            if not len(selected):
+                continue
+            last_rank = ranks[selected].max()
+            self.assertEqual((ranks[selected] < last_rank).sum(), (ranks < last_rank).sum())  # Whole fronts
+            # Within the front that did not fit, nothing left out is less crowded than what was taken
+            front = np.flatnonzero(ranks == last_rank)
+            distance = dict(zip(front.tolist(), crowding_distance(scores[front], np.zeros(len(front)))))
+            taken = [distance[i] for i in selected.tolist() if ranks[i] == last_rank]
+            left = [distance[i] for i in front.tolist() if i not in set(selected.tolist())]
+            if taken and left:
+                self.assertGreaterEqual(min(taken), max(left))
+
+
+class BenchmarkTests(SimpleTestCase):
+
+    def test_measure_batches_fast_calls(self):
+        calls = []
+        result = measure(lambda: calls.append(None), repeat=3, min_time=0.001)
+        self.assertGreater(result["number"], 1)
+        self.assertGreaterEqual(len(calls), result["number"] * 3)  # Calibration batches, then repeat - 1 more
+        self.assertLessEqual(result["best"], result["median"])
+
+    def test_suite_runs_selected_cases(self):
+        reported = []
+        results = BenchmarkSuite(generations=5).run(
+            {"n_melodies": (6,), "n_melody_notes": (8,)}, repeat=1, min_time=0, select="selection.", report=reported.append,
+        )
+        self.assertEqual(results, reported)
+        self.assertIn("selection.truncation", {result["benchmark"] for result in results})
+        self.assertTrue(all(result["benchmark"].startswith("selection.") for result in results))
+
+    def test_compare_matches_cases(self):
+        base = [
+            {"benchmark": "a", "n_melodies": 6, "n_melody_notes": 8, "best": 1.0},
+            {"benchmark": "b", "n_melodies": 6, "n_melody_notes": 8, "best": 1.0},
+        ]
+        head = [
+            {"benchmark": "a", "n_melodies": 6, "n_melody_notes": 8, "best": 2.0},
+            {"benchmark": "a", "n_melodies": 20, "n_melody_notes": 8, "best": 1.0},  # Not in base
+            {"benchmark": "b", "n_melodies": 6, "n_melody_notes": 8, "best": 0.5},
+        ]
+        self.assertEqual([(row["benchmark"], row["ratio"]) for row in compare(base, head)], [("a", 2.0), ("b", 0.5)])
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = []
+            for name, results in (("base", base), ("head", head)):
+                paths.append(os.path.join(directory, f"{name}.json"))
+                with open(paths[-1], "w", encoding="utf-8") as f:
+                    json.dump({"environment": {"commit": name}, "results": results}, f)
+            output = io.StringIO()
+            call_command("compare_benchmarks", *paths, stdout=output)
+            self.assertIn("base -> head: 1 regression(s)", output.getvalue())
+            with self.assertRaises(CommandError):
+                call_command("compare_benchmarks", *paths, "--fail-on-regression", stdout=io.StringIO())
+            with self.assertRaises(CommandError):
+                call_command("compare_benchmarks", paths[0], os.path.join(directory, "missing.json"))
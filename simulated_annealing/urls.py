@@ -1,6 +1,10 @@
 from django.urls import path
-from simulated_annealing.views import SimulatedAnnealingView
+from simulated_annealing.views import SimulatedAnnealingView, JobStatusView, JobStatsView, JobEventsView, JobCancelView
 
 urlpatterns = [
-    path("simulated_annealing/", SimulatedAnnealingView.as_view(), name="simulated_annealing")
+    path("simulated_annealing/", SimulatedAnnealingView.as_view(), name="simulated_annealing"),
+    path("simulated_annealing/jobs/<uuid:job_id>/", JobStatusView.as_view(), name="job-status"),
+    path("simulated_annealing/jobs/<uuid:job_id>/stats/", JobStatsView.as_view(), name="job-stats"),
+    path("simulated_annealing/jobs/<uuid:job_id>/events/", JobEventsView.as_view(), name="job-events"),
+    path("simulated_annealing/jobs/<uuid:job_id>/cancel/", JobCancelView.as_view(), name="job-cancel"),
 ]
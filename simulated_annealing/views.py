@@ -1,17 +1,24 @@
+import asyncio
+import json
 import os
+import time
 
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
 from django.views import View
-from django.shortcuts import render, redirect
 
-from battle.core.convertor import convert_mid_to_mp3
-from simulated_annealing.core.generator import SimulatedAnnealingGA
-from simulated_annealing.core.heuristics import Heuristic
+from battle.core.convertor import render_melody
+from battle.core.midi import atomic_open
+from simulated_annealing.core.jobs import cancel_job, job_workspace, submit_job
 from simulated_annealing.forms import SimulatedAnnealing
+from simulated_annealing.models import Job
 from Evalutionary_music_generation import settings
 
 
 class SimulatedAnnealingView(View):
     algorithm_dir = 'simulated_annealing'
+    generations = 1000
 
     def get(self, request):
         if 'initial' in request.session:
@@ -20,46 +27,113 @@ class SimulatedAnnealingView(View):
             form = SimulatedAnnealing()
         context = {'form': form}
 
-        if 'best_melody' in request.session:
-            file_name = f'melody_{request.session['best_melody']}'
-
-            convert_mid_to_mp3(file_name, self.algorithm_dir)
-            context.update(
-                {'best_melody': os.path.join(settings.MEDIA_URL, self.algorithm_dir, f'{file_name}.mp3')}
-            )
+        job = Job.objects.filter(pk=request.session.get('job_id')).first()
+        if job is not None:
+            context['job'] = job
+            if job.status == Job.Status.DONE:
+                audio_path = render_melody(job.result['notes'], job.result['durations'])
+                context.update(
+                    {'best_melody': os.path.join(settings.MEDIA_URL, audio_path)}
+                )
         return render(request, 'simulated_annealing/simulated_annealing.html', context)
 
     def post(self, request):
         form = SimulatedAnnealing(request.POST, request.FILES)
         if form.is_valid():
             form_data = form.cleaned_data
-            n_melodies = form_data["n_melodies"]
-            n_melody_notes = form_data["n_melody_notes"]
-            initial_temp = form_data["n_iterations"]
             uploaded_file = form_data["config"]
 
             form_data.pop("config", None)
             request.session['initial'] = form_data
 
+            job = Job(
+                params={
+                    'n_melodies': form_data["n_melodies"],
+                    'n_melody_notes': form_data["n_melody_notes"],
+                    'initial_temp': form_data["n_iterations"],
+                    'generations': self.generations,
+                    'config_path': None,
+                }
+            )
             if uploaded_file:
-                file_path = os.path.join(settings.MEDIA_ROOT, 'simulated_annealing', uploaded_file.name)
-                with open(file_path, "wb") as f:
+                workspace = job_workspace(job.id).create()
+                config_path = workspace.file(os.path.basename(uploaded_file.name))
+                with atomic_open(config_path) as f:
                     for chunk in uploaded_file.chunks():
                         f.write(chunk)
-                heuristic = Heuristic(config_path=file_path)
-            else:
-                heuristic = Heuristic()
-
-            obj = SimulatedAnnealingGA(
-                heuristic=heuristic,
-                n_melodies=n_melodies,
-                n_melody_notes=n_melody_notes,
-                initial_temp=initial_temp
-            )
-            new_obj = obj.run()
-            best_melody = new_obj.best_melody
-            request.session['best_melody'] = best_melody
+                job.params['config_path'] = config_path
+            job.save()
+            submit_job(job)
+            request.session['job_id'] = str(job.id)
             request.session.modified = True
             return redirect("simulated_annealing")
 
         return render(request, 'simulated_annealing/simulated_annealing.html', {'form': form})
+
+
+class JobStatusView(View):
+    """ JSON status of a background job, polled by the simulated annealing page. """
+
+    def get(self, request, job_id):
+        job = get_object_or_404(Job, pk=job_id)
+        return JsonResponse(job.to_dict())
+
+
+class JobStatsView(View):
+    """ JSON per-generation statistics of a job: the latest sample and the recent history. """
+
+    def get(self, request, job_id):
+        job = get_object_or_404(Job, pk=job_id)
+        return JsonResponse({'id': str(job.id), 'status': job.status, 'progress': job.progress, **job.stats})
+
+
+class JobEventsView(View):
+    """
+    Server-sent events pushing a job's progress and latest snapshot (best melody, score, temperature)
+    until it finishes. Under ASGI the stream comes from an async iterator, under WSGI from a sync one,
+    so that neither server buffers it.
+    """
+
+    interval = 0.5
+
+    def get(self, request, job_id):
+        get_object_or_404(Job, pk=job_id)
+        events = self.async_events(job_id) if isinstance(request, ASGIRequest) else self.events(job_id)
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @staticmethod
+    def event(job) -> str:
+        data = {**job.to_dict(), 'snapshot': job.stats.get('snapshot')}
+        return f"event: {'done' if job.finished else 'progress'}\ndata: {json.dumps(data)}\n\n"
+
+    def events(self, job_id):
+        last_event = None
+        while (job := Job.objects.filter(pk=job_id).first()) is not None:
+            event = self.event(job)
+            if event != last_event:
+                yield event
+                last_event = event
+            if job.finished:
+                return
+            time.sleep(self.interval)
+
+    async def async_events(self, job_id):
+        last_event = None
+        while (job := await Job.objects.filter(pk=job_id).afirst()) is not None:
+            event = self.event(job)
+            if event != last_event:
+                yield event
+                last_event = event
+            if job.finished:
+                return
+            await asyncio.sleep(self.interval)
+
+
+class JobCancelView(View):
+    def post(self, request, job_id):
+        job = get_object_or_404(Job, pk=job_id)
+        cancel_job(job)
+        return redirect("simulated_annealing")